@@ -31,12 +31,14 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -52,6 +54,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    # Before CommonMiddleware and authentication so rejected requests cost no further work
+    'hub.throttling.ThrottleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -79,6 +83,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 
 # Database
@@ -128,6 +133,15 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# User uploads: avatars and course images
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Group file attachments live outside MEDIA_ROOT and are only served as downloads
+# through /api/uploads/{upload_id}/download/, never straight from the web server
+FILE_UPLOAD_ROOT = BASE_DIR / 'group_files'
+FILE_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -169,13 +183,78 @@ AUTHENTICATION_BACKENDS = (
 SOCIAL_AUTH_GOOGLE_OAUTH2_KEY = ''
 SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = ''
 
+# Redis
+REDIS_URL = 'redis://localhost:6379/0'
+
 # Celery
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ACKS_LATE = True
+# Tasks run inline in development and tests so no broker is needed; start a worker when DEBUG is off
+CELERY_TASK_ALWAYS_EAGER = DEBUG
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_BEAT_SCHEDULE = {
+    'drain-outbox': {'task': 'hub.tasks.drain_outbox', 'schedule': 30.0},
+    'dispatch-reminders': {'task': 'hub.tasks.dispatch_reminders', 'schedule': 60.0},
+    'resume-stale-jobs': {'task': 'hub.tasks.resume_stale_jobs', 'schedule': 60.0},
+}
+
+# Channels (WebSocket push). The in-memory layer only reaches consumers in the
+# same process; multi-worker deployments should switch to
+# 'channels_redis.core.RedisChannelLayer' with CONFIG {'hosts': [REDIS_URL]}.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+# Pub/sub used for long-polling, server-sent events and live counters:
+# 'hub.pubsub.LocalBroker' (single process), 'hub.pubsub.UnixSocketBroker'
+# (several workers on one host) or 'hub.pubsub.RedisBroker' (multi-host)
+PUBSUB_BACKEND = 'hub.pubsub.LocalBroker'
+PUBSUB_REDIS_URL = REDIS_URL
+PUBSUB_SOCKET_DIR = '/tmp/youth-skills-hub-pubsub'
+
+# Long-polls, notification streams and free courses are served by async views
+# under ASGI (daphne, as runserver and the Docker image do), so a waiting
+# request holds no thread. Their database work runs on a shared pool of
+# ASYNC_DB_THREADS threads, which also caps how many connections they open.
+# Turn ASYNC_VIEWS off to serve every endpoint from the DRF views.
+ASYNC_VIEWS = True
+ASYNC_DB_THREADS = 10
+
+# Online/typing tracking for study-group chat: 'hub.presence.MemoryPresence'
+# (single process) or 'hub.presence.RedisPresence' (shared across workers)
+PRESENCE_BACKEND = 'hub.presence.MemoryPresence'
+PRESENCE_REDIS_URL = REDIS_URL
+
+# Announcements to larger audiences are read from one shared row instead of copied per recipient
+ANNOUNCEMENT_PULL_THRESHOLD = 5000
+
+# Event and mentorship reminders are sent this many minutes before the start
+REMINDER_OFFSETS_MINUTES = [24 * 60, 60]
+
+# Free-course providers, fetched concurrently with a per-provider TIMEOUT (seconds).
+# 'hub.providers.StubProvider' serves the bundled catalog offline (LATENCY and
+# FAILURE_RATE simulate a slow or flaky API); 'hub.providers.JsonFeedProvider'
+# takes a URL. Lists are fresh for FREE_COURSE_CACHE_FRESH seconds, then served
+# stale while they refresh, for up to FREE_COURSE_CACHE_STALE seconds.
+FREE_COURSE_PROVIDERS = {
+    name: {'BACKEND': 'hub.providers.StubProvider', 'TIMEOUT': 3}
+    for name in ['Coursera', 'edX', 'Khan Academy', 'Udacity', 'FutureLearn']
+}
+FREE_COURSE_CACHE_FRESH = 300
+FREE_COURSE_CACHE_STALE = 24 * 3600
+
+# Leaderboard ('db' ranks from indexed columns, 'redis' uses sorted sets).
+# Redis sets start empty: run `manage.py rebuild_leaderboard` after switching
+# to 'redis' and whenever Redis has lost its data.
+LEADERBOARD_BACKEND = 'db'
+LEADERBOARD_REDIS_URL = REDIS_URL
 
 # Email
 EMAIL_BACKEND = 'sendgrid_backend.SendgridBackend'
@@ -186,6 +265,16 @@ TWILIO_ACCOUNT_SID = ''
 TWILIO_AUTH_TOKEN = ''
 TWILIO_PHONE_NUMBER = ''
 
+# Outbox senders per channel. Console in development; 'hub.outbox.FileBackend'
+# writes JSON lines to OUTBOX_FILE_PATH for tests
+OUTBOX_BACKENDS = {
+    'email': {'BACKEND': 'hub.outbox.ConsoleBackend' if DEBUG else 'hub.outbox.SendGridBackend',
+              'BATCH_SIZE': 500, 'CONCURRENCY': 4},
+    'sms': {'BACKEND': 'hub.outbox.ConsoleBackend' if DEBUG else 'hub.outbox.TwilioBackend',
+            'BATCH_SIZE': 100, 'CONCURRENCY': 5},
+}
+OUTBOX_FILE_PATH = BASE_DIR / 'logs/outbox.jsonl'
+
 # Security
 SECURE_SSL_REDIRECT = False
 SECURE_HSTS_SECONDS = 31536000
@@ -206,6 +295,16 @@ RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
 RATELIMIT_CACHE_PREFIX = 'rl:'
 
+# Token-bucket limits per user: 'N/period' allows bursts of N, refilled evenly over the period
+THROTTLE_RATES = {
+    'group_message': '20/min',
+    'update_progress': '30/min',
+}
+THROTTLE_ROUTES = [
+    ('POST', r'^/api/group-messages/$', 'group_message'),
+    ('POST', r'^/api/(courses|enrollments)/\d+/update_progress/$', 'update_progress'),
+]
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -0,0 +1,185 @@
+"""
+Completion funnels and signup-cohort retention computed with NumPy.
+
+Enrollment and user columns are streamed out of the database in chunks and
+packed into arrays, so every aggregate below is a handful of vectorized
+``bincount``/``unique`` calls instead of per-course ORM loops.
+"""
+import time
+
+import numpy as np
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .models import AnalyticsSnapshot, Course, Enrollment, User
+
+STAGES = ['enrolled', 'progress_25', 'progress_50', 'progress_75', 'completed']
+RETENTION_MONTHS = 12
+CHUNK_SIZE = 50000
+FUNNEL_SNAPSHOT = 'funnels'
+
+
+def _epoch(value):
+    return value.timestamp() if value else -1
+
+
+def load_enrollment_columns(chunk_size=CHUNK_SIZE):
+    """Return (user_id, course_id, progress, enrolled_at, completed_at) as arrays, timestamps in epoch seconds"""
+    user_ids, course_ids, progress, enrolled_at, completed_at = [], [], [], [], []
+    rows = Enrollment.objects.order_by().values_list(
+        'user_id', 'course_id', 'progress', 'enrolled_at', 'completed_at'
+    ).iterator(chunk_size=chunk_size)
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= chunk_size:
+            _flush(buffer, user_ids, course_ids, progress, enrolled_at, completed_at)
+            buffer = []
+    _flush(buffer, user_ids, course_ids, progress, enrolled_at, completed_at)
+    return (
+        np.concatenate(user_ids) if user_ids else np.empty(0, dtype=np.int64),
+        np.concatenate(course_ids) if course_ids else np.empty(0, dtype=np.int64),
+        np.concatenate(progress) if progress else np.empty(0, dtype=np.int16),
+        np.concatenate(enrolled_at) if enrolled_at else np.empty(0, dtype=np.float64),
+        np.concatenate(completed_at) if completed_at else np.empty(0, dtype=np.float64),
+    )
+
+
+def _flush(buffer, user_ids, course_ids, progress, enrolled_at, completed_at):
+    if not buffer:
+        return
+    uid, cid, prog, enrolled, completed = zip(*buffer)
+    user_ids.append(np.fromiter(uid, dtype=np.int64, count=len(buffer)))
+    course_ids.append(np.fromiter(cid, dtype=np.int64, count=len(buffer)))
+    progress.append(np.fromiter(prog, dtype=np.int16, count=len(buffer)))
+    enrolled_at.append(np.fromiter((_epoch(v) for v in enrolled), dtype=np.float64, count=len(buffer)))
+    completed_at.append(np.fromiter((_epoch(v) for v in completed), dtype=np.float64, count=len(buffer)))
+
+
+def load_user_cohorts(chunk_size=CHUNK_SIZE):
+    """Return sorted user ids and their signup month (months since 1970-01)"""
+    ids, joined = [], []
+    for uid, date_joined in User.objects.order_by('id').values_list('id', 'date_joined').iterator(chunk_size=chunk_size):
+        ids.append(uid)
+        joined.append(date_joined.timestamp())
+    return np.array(ids, dtype=np.int64), _months(np.array(joined, dtype=np.float64))
+
+
+def _months(epoch_seconds):
+    return epoch_seconds.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+
+def _month_label(month):
+    return str(np.datetime64(int(month), 'M'))
+
+
+def _stage_matrix(progress, completed_at):
+    completed = (completed_at >= 0) | (progress >= 100)
+    return np.stack([
+        np.ones(progress.shape, dtype=bool),
+        progress >= 25,
+        progress >= 50,
+        progress >= 75,
+        completed,
+    ])
+
+
+def _grouped_funnel(stages, group_index, group_count):
+    return np.stack([
+        np.bincount(group_index, weights=stage, minlength=group_count) for stage in stages
+    ]).astype(np.int64).T
+
+
+def compute_funnels(user_ids, course_ids, progress, enrolled_at, completed_at,
+                    cohort_user_ids, cohort_months, course_categories):
+    """
+    Build funnels per course, category and signup cohort plus monthly cohort retention.
+
+    ``cohort_user_ids`` must be sorted. ``course_categories`` maps course id to category.
+    """
+    stages = _stage_matrix(progress, completed_at)
+
+    courses, course_index = np.unique(course_ids, return_inverse=True)
+    by_course = _grouped_funnel(stages, course_index, len(courses))
+
+    category_names = sorted(set(course_categories.values()) | {'other'})
+    category_lookup = {name: i for i, name in enumerate(category_names)}
+    course_category = np.array(
+        [category_lookup[course_categories.get(int(cid), 'other')] for cid in courses], dtype=np.int64)
+    by_category = _grouped_funnel(stages, course_category[course_index], len(category_names))
+
+    position = np.searchsorted(cohort_user_ids, user_ids)
+    position = np.clip(position, 0, max(len(cohort_user_ids) - 1, 0))
+    known = (cohort_user_ids[position] == user_ids) if len(cohort_user_ids) else np.zeros(len(user_ids), dtype=bool)
+
+    result = {
+        'stages': STAGES,
+        'enrollments': int(len(user_ids)),
+        'by_course': {str(cid): row.tolist() for cid, row in zip(courses, by_course)},
+        'by_category': {name: row.tolist() for name, row in zip(category_names, by_category)},
+        'by_cohort': {},
+        'cohort_retention': {},
+    }
+    if not len(cohort_user_ids):
+        return result
+
+    cohorts, user_cohort = np.unique(cohort_months, return_inverse=True)
+    enrollment_cohort = user_cohort[position[known]]
+    by_cohort = _grouped_funnel(stages[:, known], enrollment_cohort, len(cohorts))
+    result['by_cohort'] = {_month_label(m): row.tolist() for m, row in zip(cohorts, by_cohort)}
+
+    # A user is retained in month N after signup if they enrolled in or completed a course that month
+    activity_user = np.concatenate([position[known], position[known & (completed_at >= 0)]])
+    activity_month = np.concatenate([
+        _months(enrolled_at[known]),
+        _months(completed_at[known & (completed_at >= 0)]),
+    ])
+    offset = activity_month - cohort_months[activity_user]
+    in_window = (offset >= 0) & (offset < RETENTION_MONTHS)
+    seen = np.zeros(len(cohort_user_ids) * RETENTION_MONTHS, dtype=bool)
+    seen[activity_user[in_window] * RETENTION_MONTHS + offset[in_window]] = True
+    active = np.flatnonzero(seen)
+    active_cohort = user_cohort[active // RETENTION_MONTHS]
+    retained = np.bincount(
+        active_cohort * RETENTION_MONTHS + active % RETENTION_MONTHS,
+        minlength=len(cohorts) * RETENTION_MONTHS,
+    ).reshape(len(cohorts), RETENTION_MONTHS)
+    cohort_sizes = np.bincount(user_cohort, minlength=len(cohorts))
+    rates = np.round(retained / np.maximum(cohort_sizes, 1)[:, None], 4)
+    result['cohort_retention'] = {
+        _month_label(m): {'users': int(size), 'retention': row.tolist()}
+        for m, size, row in zip(cohorts, cohort_sizes, rates)
+    }
+    return result
+
+
+def build_funnel_report(chunk_size=CHUNK_SIZE):
+    """Load the columns from the database and compute the full report, with timings"""
+    started = time.perf_counter()
+    columns = load_enrollment_columns(chunk_size)
+    cohort_user_ids, cohort_months = load_user_cohorts(chunk_size)
+    categories = dict(Course.objects.values_list('id', 'category'))
+    loaded = time.perf_counter()
+    report = compute_funnels(*columns, cohort_user_ids, cohort_months, categories)
+    finished = time.perf_counter()
+    report['load_ms'] = round((loaded - started) * 1000, 1)
+    report['compute_ms'] = round((finished - loaded) * 1000, 1)
+    return report
+
+
+def get_funnel_report(refresh=False):
+    """Return today's funnel snapshot, computing and storing it on the first request of the day"""
+    today = timezone.now().date()
+    if not refresh:
+        snapshot = AnalyticsSnapshot.objects.filter(kind=FUNNEL_SNAPSHOT, day=today).first()
+        if snapshot:
+            return snapshot.payload
+    report = build_funnel_report()
+    report['day'] = today.isoformat()
+    report['generated_at'] = timezone.now().isoformat()
+    try:
+        AnalyticsSnapshot.objects.update_or_create(
+            kind=FUNNEL_SNAPSHOT, day=today, defaults={'payload': report})
+    except IntegrityError:
+        pass
+    return report
@@ -0,0 +1,160 @@
+"""
+Cold storage for old study-group chat history.
+
+Messages older than a cutoff are moved out of ``GroupMessage`` into
+``GroupMessageSegment`` rows: one zlib-compressed JSON array per group and
+month. Reads page backwards by message id and stitch hot rows and archived
+segments together, so clients never see where the hot table ends.
+"""
+import json
+import zlib
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GroupMessage, GroupMessageSegment, User
+
+# Order of the values stored for each archived message
+ARCHIVE_COLUMNS = ('id', 'sender_id', 'message', 'created_at', 'message_type', 'file_url', 'file_name')
+SEGMENT_MAX_MESSAGES = 5000
+DELETE_BATCH_SIZE = 500
+COMPRESSION_LEVEL = 9
+
+
+def encode_rows(rows):
+    raw = json.dumps(rows, separators=(',', ':')).encode()
+    return raw, zlib.compress(raw, COMPRESSION_LEVEL)
+
+
+def decode_rows(payload):
+    return json.loads(zlib.decompress(bytes(payload)))
+
+
+def _month(value):
+    return value.date().replace(day=1)
+
+
+def _row(values):
+    row = list(values)
+    row[3] = row[3].isoformat()
+    return row
+
+
+def _store(group_id, month, rows, stats):
+    """Append rows to the group's open segment for ``month`` or start a new one, then drop the hot rows"""
+    with transaction.atomic():
+        segment = GroupMessageSegment.objects.select_for_update().filter(
+            group_id=group_id, month=month).order_by('-last_message_id').first()
+        if segment and segment.message_count + len(rows) <= SEGMENT_MAX_MESSAGES \
+                and segment.last_message_id < rows[0][0]:
+            stats['stored_bytes'] -= len(segment.payload)
+            raw, payload = encode_rows(decode_rows(segment.payload) + rows)
+            segment.payload = payload
+            segment.raw_bytes = len(raw)
+            segment.message_count += len(rows)
+            segment.last_message_id = rows[-1][0]
+            segment.save(update_fields=['payload', 'raw_bytes', 'message_count', 'last_message_id'])
+        else:
+            raw, payload = encode_rows(rows)
+            segment = GroupMessageSegment.objects.create(
+                group_id=group_id, month=month, first_message_id=rows[0][0], last_message_id=rows[-1][0],
+                message_count=len(rows), raw_bytes=len(raw), payload=payload,
+            )
+            stats['segments'] += 1
+        ids = [row[0] for row in rows]
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            GroupMessage.objects.filter(id__in=ids[start:start + DELETE_BATCH_SIZE]).delete()
+    stats['messages'] += len(rows)
+    stats['raw_bytes'] += len(json.dumps(rows, separators=(',', ':')).encode())
+    stats['stored_bytes'] += len(payload)
+
+
+def archive_group(group_id, cutoff, batch_size=SEGMENT_MAX_MESSAGES, stats=None):
+    """Move a group's messages sent before ``cutoff`` into monthly segments, oldest first"""
+    stats = stats if stats is not None else new_stats()
+    queryset = GroupMessage.objects.filter(group_id=group_id, created_at__lt=cutoff).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).values_list(*ARCHIVE_COLUMNS)[:batch_size])
+        if not batch:
+            return stats
+        last_id = batch[-1][0]
+        month, rows = _month(batch[0][3]), []
+        for values in batch:
+            if _month(values[3]) != month:
+                _store(group_id, month, rows, stats)
+                month, rows = _month(values[3]), []
+            rows.append(_row(values))
+        _store(group_id, month, rows, stats)
+
+
+def new_stats():
+    return {'groups': 0, 'messages': 0, 'segments': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+
+
+def archive_messages(older_than, batch_size=SEGMENT_MAX_MESSAGES, on_group=None):
+    """Archive every group's messages older than the ``older_than`` timedelta; returns totals"""
+    cutoff = timezone.now() - older_than
+    stats = new_stats()
+    group_ids = list(
+        GroupMessage.objects.filter(created_at__lt=cutoff).order_by('group_id')
+        .values_list('group_id', flat=True).distinct()
+    )
+    for group_id in group_ids:
+        archive_group(group_id, cutoff, batch_size, stats)
+        stats['groups'] += 1
+        if on_group:
+            on_group(group_id, stats)
+    return stats
+
+
+def storage_report():
+    """Totals over every stored segment: messages, uncompressed and compressed bytes"""
+    totals = {'segments': 0, 'messages': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+    for count, raw_bytes, payload in GroupMessageSegment.objects.values_list(
+            'message_count', 'raw_bytes', 'payload').iterator(chunk_size=200):
+        totals['segments'] += 1
+        totals['messages'] += count
+        totals['raw_bytes'] += raw_bytes
+        totals['stored_bytes'] += len(payload)
+    return totals
+
+
+def _archived_messages(group_id, rows):
+    """Unsaved GroupMessage instances for archived rows; messages whose sender was deleted are dropped"""
+    senders = User.objects.only('id', 'username', 'avatar').in_bulk({row[1] for row in rows})
+    messages = []
+    for row in rows:
+        values = dict(zip(ARCHIVE_COLUMNS, row))
+        sender = senders.get(values.pop('sender_id'))
+        if sender is None:
+            continue
+        values['created_at'] = datetime.fromisoformat(values['created_at'])
+        messages.append(GroupMessage(group_id=group_id, sender=sender, **values))
+    return messages
+
+
+def message_page(group_id, before_id=None, limit=50):
+    """
+    Up to ``limit`` messages with id < ``before_id`` (the newest when omitted), oldest first.
+
+    Hot rows are read first; if they run out, older messages are pulled from
+    archived segments. Clients page back by passing the smallest id returned.
+    """
+    hot = GroupMessage.objects.filter(group_id=group_id).select_related('sender').order_by('-id')
+    if before_id is not None:
+        hot = hot.filter(id__lt=before_id)
+    messages = list(hot[:limit])
+    boundary = messages[-1].id if messages else before_id
+    segments = GroupMessageSegment.objects.filter(group_id=group_id).order_by('-last_message_id')
+    if boundary is not None:
+        segments = segments.filter(first_message_id__lt=boundary)
+    for segment in segments.iterator(chunk_size=4):
+        if len(messages) >= limit:
+            break
+        rows = [row for row in decode_rows(segment.payload) if boundary is None or row[0] < boundary]
+        rows = rows[-(limit - len(messages)):]
+        messages.extend(reversed(_archived_messages(group_id, rows)))
+    messages.reverse()
+    return messages
@@ -0,0 +1,63 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .dbpool import pooled
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError):
+        return AnonymousUser()
+
+
+@pooled
+def get_user_for_request(request, query_string=False):
+    """
+    The user for an async view's request, or None: the JWT comes from the
+    Authorization header or, with ``query_string``, a ``token`` parameter.
+    """
+    authentication = JWTAuthentication()
+    try:
+        header = authentication.get_header(request)
+        raw_token = authentication.get_raw_token(header) if header else None
+        if raw_token is None and query_string:
+            raw_token = request.GET.get('token')
+        if not raw_token:
+            return None
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticate WebSocket connections with the same JWT access tokens as the REST API.
+
+    Browsers cannot set headers on a WebSocket handshake, so the token is read
+    from the ``token`` query string parameter.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+        scope['user'] = await get_user_for_token(token) if token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+
+class QueryStringJWTAuthentication(JWTAuthentication):
+    """JWT authentication from a ``?token=`` parameter, for EventSource clients that cannot send headers"""
+
+    def authenticate(self, request):
+        raw_token = request.query_params.get('token')
+        if not raw_token:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token), validated_token
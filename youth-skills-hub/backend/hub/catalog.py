@@ -0,0 +1,132 @@
+"""
+In-memory catalog of free courses from external providers.
+
+The catalog is built from the providers' cached course lists (see
+providers.py; offline they serve ``data/free_courses.json``) into a tuple of
+read-only course dicts, and rebuilt only when one of those lists changes.
+Building precomputes, for each facet (provider, category, skill level), a map
+from the lowercase value to the frozenset of course positions, plus an
+inverted index from title/description tokens to positions. A query is then a few set intersections instead of one pass over
+every course per filter. Search keeps the endpoint's substring semantics: the
+query must appear, case-insensitively, in the title or the description, so
+"script" finds "JavaScript". The index only narrows the candidates (every
+word of the query occurs inside some word of a match) before that check.
+
+``version`` is a digest of the provider lists it was built from. Together
+with the normalized query it gives a stable ETag without building the
+response. It is checked against the providers' digests alone, so requests
+only load the full course lists when one of them has changed.
+"""
+import hashlib
+import json
+import os
+import re
+from types import MappingProxyType
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), 'data', 'free_courses.json')
+FACETS = ('provider', 'category', 'skill_level')
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+_catalog = None
+
+
+def load_courses(path=CATALOG_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class FreeCourseCatalog:
+    def __init__(self, courses, version=''):
+        self.courses = tuple(MappingProxyType(dict(course)) for course in courses)
+        self.version = version
+        self.all_ids = frozenset(range(len(self.courses)))
+        self.positions = {course['id']: position for position, course in enumerate(self.courses)}
+        facets = {facet: {} for facet in FACETS}
+        postings = {}
+        for position, course in enumerate(self.courses):
+            for facet in FACETS:
+                facets[facet].setdefault(str(course.get(facet, '')).lower(), set()).add(position)
+            for token in set(tokenize(f"{course['title']} {course['description']}")):
+                postings.setdefault(token, set()).add(position)
+        self.facets = {
+            facet: {value: frozenset(ids) for value, ids in values.items()} for facet, values in facets.items()
+        }
+        self.postings = {token: frozenset(ids) for token, ids in postings.items()}
+        self.texts = tuple((course['title'].lower(), course['description'].lower()) for course in self.courses)
+
+    def __len__(self):
+        return len(self.courses)
+
+    def facet_values(self, facet):
+        return sorted(self.facets[facet])
+
+    def _containing_ids(self, term):
+        """Positions of courses with any token containing ``term``"""
+        ids = set()
+        for token, positions in self.postings.items():
+            if term in token:
+                ids |= positions
+        return ids
+
+    def _matches(self, position, needle):
+        title, description = self.texts[position]
+        return needle in title or needle in description
+
+    def search(self, provider=None, category=None, skill_level=None, search=None, exclude=()):
+        """Courses matching every given filter, in catalog order, leaving out the course ids in ``exclude``"""
+        ids = self.all_ids - {self.positions[course_id] for course_id in exclude if course_id in self.positions}
+        for facet, value in (('provider', provider), ('category', category), ('skill_level', skill_level)):
+            if value:
+                ids = ids & self.facets[facet].get(value.lower(), frozenset())
+        if search:
+            needle = search.lower()
+            for term in tokenize(needle):
+                if not ids:
+                    break
+                ids = ids & self._containing_ids(term)
+            ids = [position for position in ids if self._matches(position, needle)]
+        return [self.courses[position] for position in sorted(ids)]
+
+    def etag(self, *parts):
+        key = '\x1f'.join([self.version] + [str(part or '').lower() for part in parts])
+        return '"%s"' % hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def _provider_names(aggregator, entries):
+    return [provider.name for provider in aggregator.providers if provider.name in entries]
+
+
+def _version(aggregator, entries):
+    names = _provider_names(aggregator, entries)
+    return hashlib.sha1(' '.join(f"{name}:{entries[name]['digest']}" for name in names).encode()).hexdigest()[:16]
+
+
+def _current_catalog(aggregator, entries):
+    global _catalog
+    version = _version(aggregator, entries)
+    if _catalog is None or _catalog.version != version:
+        names = _provider_names(aggregator, entries)
+        _catalog = FreeCourseCatalog(
+            [course for name in names for course in entries[name]['courses']], version=version)
+    return _catalog
+
+
+def get_catalog():
+    """The process-wide catalog, rebuilt when a provider's cached course list has changed"""
+    from .providers import get_aggregator
+    aggregator = get_aggregator()
+    if _catalog is not None and _catalog.version == _version(aggregator, aggregator.collect(digests=True)):
+        return _catalog
+    return _current_catalog(aggregator, aggregator.collect())
+
+
+async def aget_catalog():
+    from .providers import get_aggregator
+    aggregator = get_aggregator()
+    if _catalog is not None and _catalog.version == _version(aggregator, await aggregator.acollect(digests=True)):
+        return _catalog
+    return _current_catalog(aggregator, await aggregator.acollect())
@@ -0,0 +1,104 @@
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+
+from .models import StudyGroup
+from .presence import get_presence
+
+
+def presence_call(method):
+    """Presence backends are thread-safe, so their calls need not queue on the shared sync thread"""
+    return sync_to_async(method, thread_sensitive=False)
+
+
+def group_channel_name(group_id):
+    return f'study_group_{group_id}'
+
+
+def broadcast_group_message(message):
+    """Push a freshly created GroupMessage to everyone connected to its group"""
+    from .serializers import GroupMessageSerializer
+    async_to_sync(get_channel_layer().group_send)(
+        group_channel_name(message.group_id),
+        {'type': 'chat.message', 'message': GroupMessageSerializer(message).data},
+    )
+
+
+class StudyGroupChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    One channel group per StudyGroup; new messages are pushed as they are created.
+
+    Clients send ``{"type": "heartbeat"}`` every ~10 seconds and
+    ``{"type": "typing", "typing": true|false}`` while composing. The online
+    list is broadcast to the group whenever someone arrives, leaves or times out;
+    a user with several tabs open stays online until the last one closes.
+    """
+
+    async def connect(self):
+        user = self.scope['user']
+        self.group_id = int(self.scope['url_route']['kwargs']['group_id'])
+        if not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        if not await self.can_join(user):
+            await self.close(code=4403)
+            return
+        self.channel_group = group_channel_name(self.group_id)
+        await self.channel_layer.group_add(self.channel_group, self.channel_name)
+        await self.accept()
+        presence = get_presence()
+        if await presence_call(presence.connect)(self.group_id, user.id, user.username):
+            await self.broadcast_presence(self.group_id)
+        else:
+            await self.send_json({'type': 'presence', 'online': await presence_call(presence.online)(self.group_id)})
+        typing = await presence_call(presence.typing)(self.group_id)
+        if typing:
+            await self.send_json({'type': 'typing', 'users': typing})
+
+    async def disconnect(self, code):
+        if hasattr(self, 'channel_group'):
+            await self.channel_layer.group_discard(self.channel_group, self.channel_name)
+            user = self.scope['user']
+            if await presence_call(get_presence().leave)(self.group_id, user.id, user.username):
+                await self.broadcast_presence(self.group_id)
+
+    @database_sync_to_async
+    def can_join(self, user):
+        group = StudyGroup.objects.filter(pk=self.group_id).only('is_private', 'creator_id').first()
+        if group is None:
+            return False
+        if not group.is_private or group.creator_id == user.id:
+            return True
+        return group.members.filter(id=user.id).exists()
+
+    async def receive_json(self, content, **kwargs):
+        user = self.scope['user']
+        presence = get_presence()
+        kind = content.get('type') if isinstance(content, dict) else None
+        if kind == 'heartbeat':
+            if await presence_call(presence.heartbeat)(self.group_id, user.id, user.username):
+                await self.broadcast_presence(self.group_id)
+        elif kind == 'typing':
+            typing = bool(content.get('typing', True))
+            await presence_call(presence.set_typing)(self.group_id, user.id, user.username, typing)
+            await self.channel_layer.group_send(self.channel_group, {
+                'type': 'chat.typing', 'user': {'id': user.id, 'username': user.username}, 'typing': typing,
+            })
+        # Whichever connection happens to sweep announces the timeouts for every affected group
+        for group_id in await presence_call(presence.sweep)():
+            await self.broadcast_presence(group_id)
+
+    async def broadcast_presence(self, group_id):
+        online = await presence_call(get_presence().online)(group_id)
+        await self.channel_layer.group_send(group_channel_name(group_id), {'type': 'chat.presence', 'online': online})
+
+    async def chat_message(self, event):
+        await self.send_json({'type': 'message', 'message': event['message']})
+
+    async def chat_presence(self, event):
+        await self.send_json({'type': 'presence', 'online': event['online']})
+
+    async def chat_typing(self, event):
+        if event['user']['id'] != self.scope['user'].id:
+            await self.send_json({'type': 'typing', 'user': event['user'], 'typing': event['typing']})
@@ -0,0 +1,36 @@
+"""
+A bounded thread pool for the database work of async views.
+
+``sync_to_async`` and Django's async ORM give every request a thread of its
+own for database calls, so a few thousand open long-polls could mean as many
+threads and database connections. ``pooled`` functions run on at most
+``settings.ASYNC_DB_THREADS`` shared threads instead. A waiting request holds
+neither a thread nor a connection, and a burst of queries queues for a free
+thread. Like channels' ``database_sync_to_async``, stale connections are
+closed before and after each call.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+
+DEFAULT_THREADS = 10
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_DB_THREADS', DEFAULT_THREADS), thread_name_prefix='db-pool')
+    return _executor
+
+
+def pooled(func):
+    """``func`` as a coroutine function that runs on the database pool"""
+    return DatabaseSyncToAsync(func, thread_sensitive=False, executor=get_executor())
@@ -0,0 +1,210 @@
+"""
+Near-duplicate detection across internal courses and the free-course catalog.
+
+Each course is reduced to a set of shingles: title words and word pairs,
+description word pairs and its normalized URL. A MinHash signature of
+NUM_PERM minimum hash values is computed from those shingles; the fraction
+of equal positions in two signatures estimates the Jaccard similarity of
+their sets. Locality-sensitive hashing splits each signature into BANDS
+bands. Only courses that share a whole band land in the same bucket and are
+compared, so finding duplicates costs about linear time in the number of
+courses rather than one comparison per pair. Candidates count as duplicates
+at an estimated similarity of THRESHOLD or more. Courses with the same
+provider and title are duplicates without any estimate. A shared URL only
+adds to the similarity, because providers link several courses to one
+listing page. A course with no shingles at all (say, a title of stop words
+and no description or URL) has nothing to compare and is never a duplicate.
+
+Duplicate clusters keep one canonical course. Internal courses are
+preferred, the most enrolled first. The other internal courses in the
+cluster point at it through ``Course.duplicate_of``, and duplicate free
+courses get a FreeCourseDuplicate row for the free-courses endpoint.
+
+Signatures are stable across processes (fixed hash seeds), so internal ones
+are stored on the Course row and computed only when the course changes.
+"""
+import hashlib
+import re
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.db import transaction
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from .models import Course, FreeCourseDuplicate
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.5
+MAX_BUCKET = 50  # larger buckets come from boilerplate text; compare their members with the first only
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+_random = np.random.RandomState(20240601)
+PERM_A = _random.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+PERM_B = _random.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def words(text):
+    return [word for word in WORD_RE.findall((text or '').lower()) if word not in ENGLISH_STOP_WORDS]
+
+
+def normalize_url(url):
+    parts = urlsplit((url or '').strip().lower())
+    host = parts.netloc[4:] if parts.netloc.startswith('www.') else parts.netloc
+    query = '&'.join(sorted(parts.query.split('&'))) if parts.query else ''
+    return f"{host}{parts.path.rstrip('/')}{'?' + query if query else ''}" if host else ''
+
+
+def shingles(title, description, url):
+    title_words, description_words = words(title), words(description)
+    result = set(title_words)
+    result.update(f'{a} {b}' for a, b in zip(title_words, title_words[1:]))
+    result.update(f'{a} {b}' for a, b in zip(description_words, description_words[1:]))
+    if normalize_url(url):
+        result.add('url:' + normalize_url(url))
+    return result
+
+
+def signature(title, description, url):
+    """MinHash signature (NUM_PERM uint32 values) of a course's shingles; all MAX_HASH without any"""
+    items = shingles(title, description, url)
+    if not items:
+        return np.full(NUM_PERM, MAX_HASH, dtype=np.uint32)
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(item.encode(), digest_size=4).digest(), 'little') for item in items],
+        dtype=np.uint64)
+    permuted = (hashes[:, None] * PERM_A + PERM_B) % MERSENNE_PRIME & MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def course_signature(course):
+    return signature(course.title, course.description, course.external_url).tobytes()
+
+
+def title_key(provider, title):
+    """Exact-match key for a provider and title, or '' when the title has no words"""
+    title_words = words(title)
+    return f"{provider.lower()}|{' '.join(title_words)}" if title_words else ''
+
+
+def exact_key_groups(keys):
+    """Index groups that share a non-empty key"""
+    groups = {}
+    for index, key in enumerate(keys):
+        if key:
+            groups.setdefault(key, []).append(index)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def lsh_pairs(signatures):
+    """(i, j) index pairs that share at least one band and have an estimated similarity of THRESHOLD or more"""
+    pairs = set()
+    if len(signatures) < 2:
+        return pairs
+    # Empty signatures are all equal, which says nothing about the courses
+    has_shingles = (signatures != MAX_HASH).any(axis=1)
+    for band in range(BANDS):
+        block = np.ascontiguousarray(signatures[:, band * ROWS:(band + 1) * ROWS])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * ROWS))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = np.flatnonzero((counts[inverse] > 1) & has_shingles)  # most courses are alone in their bucket
+        order = shared[np.argsort(inverse[shared], kind='stable')]
+        boundaries = np.flatnonzero(np.diff(inverse[order])) + 1
+        for bucket in np.split(order, boundaries) if len(order) else ():
+            if len(bucket) > MAX_BUCKET:
+                left, right = bucket[:1], bucket[1:]
+            else:
+                left = right = bucket
+            similarity = (signatures[left][:, None, :] == signatures[right][None, :, :]).mean(axis=2)
+            for a, b in zip(*np.nonzero(similarity >= THRESHOLD)):
+                i, j = int(left[a]), int(right[b])
+                if i < j:
+                    pairs.add((i, j))
+    return pairs
+
+
+class _DisjointSet:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        self.parent[self.find(b)] = self.find(a)
+
+
+def duplicate_clusters(signatures, exact_keys=()):
+    """Clusters (lists of indexes, in index order) of near-duplicate entries"""
+    sets = _DisjointSet(len(signatures))
+    for i, j in lsh_pairs(signatures):
+        sets.union(i, j)
+    for keys in exact_keys:
+        for group in exact_key_groups(keys):
+            for index in group[1:]:
+                sets.union(group[0], index)
+    clusters = {}
+    for index in range(len(signatures)):
+        clusters.setdefault(sets.find(index), []).append(index)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def fill_missing_signatures(batch_size=1000):
+    courses = list(Course.objects.filter(minhash__isnull=True).only('id', 'title', 'description', 'external_url'))
+    for course in courses:
+        course.minhash = course_signature(course)
+    Course.objects.bulk_update(courses, ['minhash'], batch_size=batch_size)
+    return len(courses)
+
+
+def dedupe_courses(free_courses=None):
+    """
+    Recompute duplicate clusters over active internal courses and the free catalog.
+
+    Sets or clears ``Course.duplicate_of`` and replaces the FreeCourseDuplicate
+    rows. Returns counts of duplicates found on each side.
+    """
+    if free_courses is None:
+        from .catalog import get_catalog
+        free_courses = get_catalog().courses
+    fill_missing_signatures()
+    internal = list(Course.objects.filter(is_active=True).order_by('-enrolled_count', 'id').values_list(
+        'id', 'provider', 'title', 'minhash'))
+    free_courses = list(free_courses)
+
+    signatures = np.array(
+        [np.frombuffer(row[3], dtype=np.uint32) for row in internal]
+        + [signature(course['title'], course['description'], course.get('url', '')) for course in free_courses],
+        dtype=np.uint32).reshape(-1, NUM_PERM)
+    titles = [title_key(row[1], row[2]) for row in internal] + [
+        title_key(course['provider'], course['title']) for course in free_courses]
+
+    duplicate_of, free_duplicates = {}, []
+    # Members are in index order: internal courses by enrollments first, then the free catalog in its order
+    for members in duplicate_clusters(signatures, exact_keys=(titles,)):
+        canonical = members[0]
+        for member in members[1:]:
+            if member < len(internal):
+                duplicate_of[internal[member][0]] = internal[canonical][0]
+            elif canonical < len(internal):
+                free_duplicates.append(FreeCourseDuplicate(
+                    free_course_id=free_courses[member - len(internal)]['id'], course_id=internal[canonical][0]))
+            else:
+                free_duplicates.append(FreeCourseDuplicate(
+                    free_course_id=free_courses[member - len(internal)]['id'],
+                    duplicate_of_free_id=free_courses[canonical - len(internal)]['id']))
+
+    with transaction.atomic():
+        Course.objects.filter(duplicate_of__isnull=False).exclude(pk__in=list(duplicate_of)).update(duplicate_of=None)
+        Course.objects.bulk_update(
+            [Course(pk=course_id, duplicate_of_id=target) for course_id, target in duplicate_of.items()],
+            ['duplicate_of'], batch_size=1000)
+        FreeCourseDuplicate.objects.all().delete()
+        FreeCourseDuplicate.objects.bulk_create(free_duplicates)
+    return {'courses': len(duplicate_of), 'free_courses': len(free_duplicates)}
@@ -0,0 +1,124 @@
+"""
+Announcement delivery to course enrollees, event attendees and study-group members.
+
+Push mode (fan-out on write) streams recipient ids with ``iterator()`` and
+writes one ``bulk_create`` batch of Notification rows per transaction,
+together with the unread counters and a cursor, so a retried task resumes
+after the last committed batch. Pull mode (fan-out on read) stores only the
+announcement; each user's feed finds it through their own enrollments,
+events and groups, so cost follows readers instead of audience size.
+Audiences larger than ANNOUNCEMENT_PULL_THRESHOLD default to pull mode.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .models import Announcement, AnnouncementRead, Course, Enrollment, Event, Notification, StudyGroup, User
+from .notifications import publish_notifications
+
+BATCH_SIZE = 1000
+
+
+def pull_threshold():
+    return getattr(settings, 'ANNOUNCEMENT_PULL_THRESHOLD', 5000)
+
+
+def audience_target(audience_type, audience_id):
+    """The course, event or group an announcement is addressed to, or None"""
+    model = {'course': Course, 'event': Event, 'group': StudyGroup}.get(audience_type)
+    return model.objects.filter(pk=audience_id).first() if model else None
+
+
+def audience_size(target):
+    """Recipient count from the denormalized counters, without scanning the audience"""
+    if isinstance(target, Course):
+        return target.enrolled_count
+    if isinstance(target, Event):
+        return target.attendee_count
+    return target.members_count
+
+
+def audience_user_ids(audience_type, audience_id):
+    if audience_type == 'course':
+        rows = Enrollment.objects.filter(course_id=audience_id)
+    elif audience_type == 'event':
+        rows = Event.attendees.through.objects.filter(event_id=audience_id)
+    else:
+        rows = StudyGroup.members.through.objects.filter(studygroup_id=audience_id)
+    return rows.order_by('user_id').values_list('user_id', flat=True)
+
+
+def create_announcement(user, target, audience_type, title, message, action_url='', mode=None):
+    size = audience_size(target)
+    mode = mode or ('pull' if size > pull_threshold() else 'push')
+    announcement = Announcement.objects.create(
+        created_by=user, audience_type=audience_type, audience_id=target.pk,
+        title=title, message=message, action_url=action_url, mode=mode, total_recipients=size,
+        status='done' if mode == 'pull' else 'pending',
+        finished_at=timezone.now() if mode == 'pull' else None,
+    )
+    if mode == 'push':
+        from .tasks import enqueue_on_commit, fan_out_announcement
+        enqueue_on_commit(fan_out_announcement, announcement.pk)
+    return announcement
+
+
+def fan_out(announcement, batch_size=BATCH_SIZE):
+    """Create the announcement's Notification rows in batches, resuming after ``last_user_id``"""
+    Announcement.objects.filter(pk=announcement.pk).update(status='running')
+    user_ids = audience_user_ids(announcement.audience_type, announcement.audience_id).filter(
+        user_id__gt=announcement.last_user_id).iterator(chunk_size=batch_size)
+    batch = []
+    try:
+        for user_id in user_ids:
+            batch.append(user_id)
+            if len(batch) >= batch_size:
+                _deliver(announcement, batch)
+                batch = []
+        if batch:
+            _deliver(announcement, batch)
+    except Exception:
+        Announcement.objects.filter(pk=announcement.pk).update(status='failed')
+        raise
+    Announcement.objects.filter(pk=announcement.pk).update(status='done', finished_at=timezone.now())
+
+
+def _deliver(announcement, user_ids):
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id, title=announcement.title, message=announcement.message,
+                action_url=announcement.action_url,
+            )
+            for user_id in user_ids
+        ])
+        # bulk_create skips Notification.save(), so maintain the unread counters here in one UPDATE
+        User.objects.filter(pk__in=user_ids).update(unread_notifications=F('unread_notifications') + 1)
+        Announcement.objects.filter(pk=announcement.pk).update(
+            delivered=F('delivered') + len(user_ids), last_user_id=user_ids[-1])
+        transaction.on_commit(lambda: publish_notifications(notifications))
+    announcement.last_user_id = user_ids[-1]
+
+
+def announcement_feed(user):
+    """Pull-mode announcements addressed to any course, event or group the user belongs to"""
+    audiences = (
+        Q(audience_type='course', audience_id__in=Enrollment.objects.filter(user=user).values('course_id'))
+        | Q(audience_type='event', audience_id__in=Event.attendees.through.objects.filter(
+            user=user).values('event_id'))
+        | Q(audience_type='group', audience_id__in=StudyGroup.members.through.objects.filter(
+            user=user).values('studygroup_id'))
+    )
+    return Announcement.objects.filter(audiences, mode='pull').annotate(
+        is_read=Exists(AnnouncementRead.objects.filter(announcement=OuterRef('pk'), user=user)))
+
+
+def unread_announcements(user):
+    return announcement_feed(user).filter(is_read=False).count()
+
+
+def mark_announcements_read(user, announcement_ids):
+    visible = announcement_feed(user).filter(pk__in=announcement_ids, is_read=False).values_list('pk', flat=True)
+    AnnouncementRead.objects.bulk_create(
+        [AnnouncementRead(announcement_id=pk, user=user) for pk in visible], ignore_conflicts=True)
@@ -0,0 +1,232 @@
+"""
+Streaming import of provider course feeds into Course.
+
+Feeds are JSON arrays, CSV or NDJSON, read from a file, URL or stdin. They
+are parsed incrementally, so memory use depends on the chunk size and not on
+the size of the feed. Each chunk is upserted with one
+``bulk_create(update_conflicts=True)`` keyed on (provider, external_id), so
+re-running a feed updates courses in place instead of duplicating them.
+
+Every row written in a run gets the same ``last_synced_at``. Once the whole
+feed has been read, active courses from the same providers that were not in
+it are deactivated. Courses that were written or deactivated are re-indexed
+for recommendations in the background, and near-duplicates across internal
+and free courses are recomputed (see dedupe.py).
+"""
+import csv
+import io
+import json
+import re
+import sys
+import time
+import urllib.request
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .dedupe import course_signature, dedupe_courses
+from .models import Course
+
+CHUNK_SIZE = 1000
+READ_SIZE = 64 * 1024
+INDEX_TASK_SIZE = 5000
+HOURS_PER_WEEK = 5
+HOURS_PER_MONTH = 20
+UPDATE_FIELDS = ['title', 'description', 'category', 'skill_level', 'duration', 'external_url', 'is_active',
+                 'last_synced_at', 'minhash']
+FORMATS = ('json', 'csv', 'ndjson')
+CATEGORIES = {value for value, _ in Course.CATEGORY_CHOICES}
+SKILL_LEVELS = {value for value, _ in Course._meta.get_field('skill_level').choices}
+DURATION_RE = re.compile(r'(\d+)(?:\s*-\s*(\d+))?\s*(hour|week|month)?', re.IGNORECASE)
+
+
+class IngestError(Exception):
+    pass
+
+
+def detect_format(source):
+    name = source.split('?', 1)[0].lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith('.json'):
+        return 'json'
+    raise IngestError(f'Cannot tell the format of {source}; pass it explicitly')
+
+
+def open_source(source):
+    """A binary stream for a path, an http(s) URL or '-' for stdin"""
+    if source == '-':
+        return sys.stdin.buffer
+    if source.startswith(('http://', 'https://')):
+        return urllib.request.urlopen(source, timeout=30)
+    return open(source, 'rb')
+
+
+def read_json_array(stream):
+    """Yield the objects of a top-level JSON array without loading the whole document"""
+    text = io.TextIOWrapper(stream, encoding='utf-8')
+    decoder = json.JSONDecoder()
+    buffer, position, started, eof = '', 0, False, False
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ',')):
+            position += 1
+        if position < len(buffer):
+            char = buffer[position]
+            if not started:
+                if char != '[':
+                    raise IngestError('JSON feed must be an array of course objects')
+                started = True
+                position += 1
+                continue
+            if char == ']':
+                return
+            if char != '{':
+                raise IngestError(f'Expected a course object in the JSON feed, found {char!r}')
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise IngestError('JSON feed ends inside a course object')
+            else:
+                yield row
+                continue
+        elif eof:
+            raise IngestError('JSON feed ended before the closing ]')
+        # The next object is incomplete: drop what has been consumed and read another block
+        buffer, position = buffer[position:], 0
+        data = text.read(READ_SIZE)
+        eof = not data
+        buffer += data
+
+
+def read_ndjson(stream):
+    for number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), 1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise IngestError(f'Line {number} is not valid JSON: {e}')
+
+
+def read_csv(stream):
+    yield from csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+
+
+READERS = {'json': read_json_array, 'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def read_rows(source, format=None):
+    return READERS[format or detect_format(source)](open_source(source))
+
+
+def parse_duration(value):
+    """Hours from a number or text like '10 hours', '4-6 weeks' or '2 months' (ranges use the midpoint)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = DURATION_RE.search(str(value or ''))
+    if not match:
+        return 0
+    low, high, unit = int(match.group(1)), int(match.group(2) or match.group(1)), (match.group(3) or 'hour').lower()
+    amount = (low + high) / 2
+    return int(round(amount * {'hour': 1, 'week': HOURS_PER_WEEK, 'month': HOURS_PER_MONTH}[unit]))
+
+
+def course_from_row(row, provider, synced_at):
+    """An unsaved Course for a feed row, or None if the row lacks an id, title or usable URL"""
+    provider = str(row.get('provider') or provider or '').strip()[:100]
+    external_id = str(row.get('external_id') or row.get('id') or '').strip()
+    title = str(row.get('title') or '').strip()
+    url = str(row.get('external_url') or row.get('url') or '').strip()
+    if not (provider and external_id and title and url) or len(external_id) > 200 or len(url) > 200:
+        return None
+    category = str(row.get('category') or '').strip().lower()
+    skill_level = str(row.get('skill_level') or '').strip().lower()
+    course = Course(
+        provider=provider,
+        external_id=external_id,
+        title=title[:200],
+        description=str(row.get('description') or ''),
+        category=category if category in CATEGORIES else 'other',
+        skill_level=skill_level if skill_level in SKILL_LEVELS else 'beginner',
+        duration=parse_duration(row.get('duration')),
+        external_url=url,
+        is_active=True,
+        last_synced_at=synced_at,
+    )
+    course.minhash = course_signature(course)
+    return course
+
+
+def _keys_query(keys):
+    by_provider = {}
+    for provider, external_id in keys:
+        by_provider.setdefault(provider, []).append(external_id)
+    return reduce(or_, (Q(provider=provider, external_id__in=ids) for provider, ids in by_provider.items()))
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest(rows, provider=None, chunk_size=CHUNK_SIZE, deactivate_missing=True, dedupe=True, on_chunk=None):
+    """
+    Upsert feed rows into Course in chunks and return run statistics.
+
+    ``provider`` fills in rows that do not name one. With
+    ``deactivate_missing``, active courses of the providers seen in the feed
+    that it no longer lists are deactivated afterwards. With ``dedupe``,
+    near-duplicate clusters are recomputed once the feed is in.
+    """
+    synced_at = timezone.now()
+    clock = time.monotonic()
+    stats = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'deactivated': 0}
+    providers, touched = set(), []
+    for chunk in _chunks(rows, chunk_size):
+        courses = {}
+        for row in chunk:
+            course = course_from_row(row, provider, synced_at) if isinstance(row, dict) else None
+            if course is None:
+                stats['skipped'] += 1
+            else:
+                courses[(course.provider, course.external_id)] = course  # a repeated id keeps its last row
+        stats['rows'] += len(chunk)
+        if courses:
+            existing = Course.objects.filter(_keys_query(courses)).count()
+            Course.objects.bulk_create(
+                list(courses.values()), update_conflicts=True,
+                unique_fields=['provider', 'external_id'], update_fields=UPDATE_FIELDS)
+            touched.extend(Course.objects.filter(_keys_query(courses)).values_list('pk', flat=True))
+            stats['created'] += len(courses) - existing
+            stats['updated'] += existing
+            providers.update(name for name, _ in courses)
+        if on_chunk:
+            on_chunk(stats, time.monotonic() - clock)
+
+    if deactivate_missing and providers:
+        missing = Course.objects.filter(
+            provider__in=providers, external_id__isnull=False, is_active=True).exclude(last_synced_at=synced_at)
+        missing_ids = list(missing.values_list('pk', flat=True))
+        stats['deactivated'] = Course.objects.filter(pk__in=missing_ids).update(is_active=False)
+        touched.extend(missing_ids)
+
+    from .tasks import enqueue_on_commit, update_course_index
+    for start in range(0, len(touched), INDEX_TASK_SIZE):
+        enqueue_on_commit(update_course_index, touched[start:start + INDEX_TASK_SIZE])
+
+    stats['seconds'] = time.monotonic() - clock
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+    if dedupe:
+        stats['duplicates'] = dedupe_courses()
+    return stats
@@ -0,0 +1,334 @@
+"""
+Resumable background jobs: backfills, reconciles, index rebuilds and archival.
+
+A job type walks its rows in primary-key order. ``run_chunk`` processes up to
+``chunk_size`` rows after a cursor and returns how many it handled, the new
+cursor and counters to add to the job's result. The runner commits each
+chunk's effects in the same transaction as the BackgroundJob row's cursor and
+progress, so after a crash the job carries on from the last committed chunk
+and nothing is processed twice.
+
+A runner claims a job by marking it running under its worker id, and sends a
+heartbeat with every chunk and, from a background thread, every
+HEARTBEAT_INTERVAL while a long chunk is still running. A running job whose
+heartbeat is older than LEASE is treated as abandoned: ``resume_stale_jobs``
+or ``run_job`` picks it up again. Cancelling sets a flag that the runner checks between chunks.
+Jobs run under Celery (``start_job``) or in the foreground from the
+``run_job`` management command.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import BackgroundJob, Course, GroupMessage, User
+
+LEASE = timedelta(minutes=5)
+# Well inside LEASE so a couple of missed beats (e.g. a locked database) don't lose the claim
+HEARTBEAT_INTERVAL = timedelta(minutes=1)
+
+logger = logging.getLogger(__name__)
+
+JOBS = {}
+
+
+class JobError(Exception):
+    pass
+
+
+class LostClaim(Exception):
+    """Another runner took the job over; this chunk is rolled back"""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled; raised between chunks"""
+
+
+def register(job_class):
+    JOBS[job_class.name] = job_class()
+    return job_class
+
+
+def get_job_type(name):
+    if name not in JOBS:
+        raise JobError(f'Unknown job {name!r}. Choices: {", ".join(sorted(JOBS))}')
+    return JOBS[name]
+
+
+class Job:
+    """Base class for a job type; subclasses set ``name`` and implement ``run_chunk``"""
+    name = None
+    description = ''
+    chunk_size = 1000
+
+    def clean(self, params):
+        """Validated params for a new job; raise JobError for bad ones"""
+        return params
+
+    def total(self, params):
+        """Estimated number of rows the job will process, or None"""
+        return None
+
+    def run_chunk(self, params, cursor, chunk_size):
+        """Process up to ``chunk_size`` rows after ``cursor``; returns (rows, new cursor, counters)"""
+        raise NotImplementedError
+
+
+@register
+class ReconcileJob(Job):
+    name = 'reconcile'
+    description = 'Recompute one set of denormalized counters (params: target)'
+
+    def clean(self, params):
+        from .reconcile import RECONCILERS
+        if params.get('target') not in RECONCILERS:
+            raise JobError(f'params.target must be one of: {", ".join(RECONCILERS)}')
+        return {'target': params['target']}
+
+    def _reconciler(self, params):
+        from .reconcile import RECONCILERS
+        return RECONCILERS[params['target']]
+
+    def total(self, params):
+        return self._reconciler(params).queryset().count()
+
+    def run_chunk(self, params, cursor, chunk_size):
+        reconciler = self._reconciler(params)
+        chunk = list(reconciler.queryset().filter(pk__gt=cursor).order_by('pk').only('pk', *reconciler.fields)[:chunk_size])
+        if not chunk:
+            return 0, cursor, {}
+        return len(chunk), chunk[-1].pk, {'fixed': reconciler._reconcile_chunk(chunk, dry_run=False)}
+
+
+@register
+class BadgeBackfillJob(Job):
+    name = 'badge_backfill'
+    description = 'Award every badge users already qualify for, with notifications'
+    chunk_size = 200
+
+    def total(self, params):
+        return User.objects.count()
+
+    def run_chunk(self, params, cursor, chunk_size):
+        from .tasks import check_badges
+        user_ids = list(User.objects.filter(pk__gt=cursor).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        awarded = sum(len(check_badges(user_id)) for user_id in user_ids)
+        return len(user_ids), user_ids[-1] if user_ids else cursor, {'awarded': awarded}
+
+
+@register
+class CourseIndexJob(Job):
+    name = 'course_index'
+    description = 'Rebuild the recommendation vectors of every course (params: missing=1 for active courses without one)'
+    chunk_size = 500
+
+    def clean(self, params):
+        if str(params.get('missing', '0')) not in ('0', '1'):
+            raise JobError('params.missing must be 0 or 1')
+        return {'missing': str(params.get('missing', '0')) == '1'}
+
+    def _courses(self, params):
+        if params.get('missing'):
+            return Course.objects.filter(is_active=True, vector__isnull=True)
+        return Course.objects.all()
+
+    def total(self, params):
+        return self._courses(params).count()
+
+    def run_chunk(self, params, cursor, chunk_size):
+        from .ml_model import update_course_index
+        course_ids = list(self._courses(params).filter(pk__gt=cursor).order_by('pk')
+                          .values_list('pk', flat=True)[:chunk_size])
+        indexed = update_course_index(course_ids) if course_ids else 0
+        return len(course_ids), course_ids[-1] if course_ids else cursor, {'indexed': indexed}
+
+
+@register
+class ArchiveMessagesJob(Job):
+    name = 'archive_messages'
+    description = 'Move old group messages into archive segments, group by group (params: older_than_days)'
+    chunk_size = 5
+
+    def clean(self, params):
+        try:
+            days = int(params.get('older_than_days', 180))
+        except (TypeError, ValueError):
+            raise JobError('params.older_than_days must be a whole number')
+        if days < 1:
+            raise JobError('params.older_than_days must be at least 1')
+        # Fix the cutoff now so a resumed job archives the same range
+        return {'older_than_days': days, 'cutoff': (timezone.now() - timedelta(days=days)).isoformat()}
+
+    def _groups(self, params):
+        return (GroupMessage.objects.filter(created_at__lt=parse_datetime(params['cutoff']))
+                .order_by('group_id').values_list('group_id', flat=True).distinct())
+
+    def total(self, params):
+        return self._groups(params).count()
+
+    def run_chunk(self, params, cursor, chunk_size):
+        from .archive import archive_group, new_stats
+        group_ids = list(self._groups(params).filter(group_id__gt=cursor)[:chunk_size])
+        stats = new_stats()
+        for group_id in group_ids:
+            archive_group(group_id, parse_datetime(params['cutoff']), stats=stats)
+        return len(group_ids), group_ids[-1] if group_ids else cursor, {
+            'messages': stats['messages'], 'segments': stats['segments']}
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+
+
+def start_job(name, params=None, user=None, chunk_size=None, throttle=0, enqueue=True):
+    """Create a job and, with ``enqueue``, queue it for a Celery worker once the transaction commits"""
+    job_type = get_job_type(name)
+    params = job_type.clean(dict(params or {}))
+    if chunk_size is not None and chunk_size < 1:
+        raise JobError('chunk_size must be at least 1')
+    if throttle < 0:
+        raise JobError('throttle must not be negative')
+    job = BackgroundJob.objects.create(
+        name=name, params=params, chunk_size=chunk_size or job_type.chunk_size, throttle=throttle,
+        total=job_type.total(params), created_by=user,
+    )
+    if enqueue:
+        from .tasks import enqueue_on_commit, run_background_job
+        enqueue_on_commit(run_background_job, job.pk)
+    return job
+
+
+def claim_job(job_id, worker):
+    """Mark the job running for ``worker`` if it is pending or its last runner stopped heartbeating"""
+    now = timezone.now()
+    return BackgroundJob.objects.filter(
+        Q(status='pending') | Q(status='running', heartbeat_at__lt=now - LEASE), pk=job_id,
+    ).update(status='running', worker=worker, heartbeat_at=now, started_at=Coalesce(F('started_at'), now)) == 1
+
+
+def _add_counters(result, counters):
+    merged = dict(result)
+    for key, value in counters.items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _finish(job, worker, status, **fields):
+    BackgroundJob.objects.filter(pk=job.pk, worker=worker).update(status=status, finished_at=timezone.now(), **fields)
+    job.refresh_from_db()
+    return job
+
+
+class Heartbeat:
+    """Refresh the job's heartbeat from a separate thread and connection until stopped"""
+
+    def __init__(self, job_id, worker, interval=None):
+        self.job_id = job_id
+        self.worker = worker
+        self.interval = (interval or HEARTBEAT_INTERVAL).total_seconds()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'job-heartbeat-{job_id}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    if not BackgroundJob.objects.filter(pk=self.job_id, worker=self.worker, status='running').update(
+                            heartbeat_at=timezone.now()):
+                        return
+                except Exception:
+                    logger.warning('Could not refresh the heartbeat of job %s', self.job_id, exc_info=True)
+        finally:
+            connection.close()
+
+
+def run_job(job_id, worker=None, on_chunk=None):
+    """
+    Run a job to completion in this process, resuming from its cursor.
+
+    Returns the job, or None if it could not be claimed (already finished,
+    or another runner holds a live claim).
+    """
+    worker = worker or worker_id()
+    if not claim_job(job_id, worker):
+        return None
+    job = BackgroundJob.objects.get(pk=job_id)
+    job_type = get_job_type(job.name)
+    try:
+        with Heartbeat(job.pk, worker):
+            _run_chunks(job, job_type, worker, on_chunk)
+    except LostClaim:
+        return None
+    except JobCancelled:
+        return _finish(job, worker, 'cancelled')
+    except Exception as e:
+        return _finish(job, worker, 'failed', last_error=f'{type(e).__name__}: {e}'[:2000])
+    return _finish(job, worker, 'done', last_error='')
+
+
+def _run_chunks(job, job_type, worker, on_chunk):
+    while True:
+        if BackgroundJob.objects.filter(pk=job.pk, cancel_requested=True).exists():
+            raise JobCancelled()
+        with transaction.atomic():
+            rows, cursor, counters = job_type.run_chunk(job.params, job.cursor, job.chunk_size)
+            if not rows:
+                return
+            result = _add_counters(job.result, counters)
+            # Only the runner that holds the claim may advance the cursor
+            if not BackgroundJob.objects.filter(pk=job.pk, worker=worker, status='running').update(
+                    cursor=cursor, processed=F('processed') + rows, result=result, heartbeat_at=timezone.now()):
+                raise LostClaim()
+        job.cursor, job.processed, job.result = cursor, job.processed + rows, result
+        if on_chunk:
+            on_chunk(job)
+        if job.throttle:
+            time.sleep(job.throttle)
+
+
+def cancel_job(job):
+    """Cancel a pending job at once, or ask a running one to stop after its current chunk"""
+    if job.status == 'pending':
+        BackgroundJob.objects.filter(pk=job.pk, status='pending').update(
+            status='cancelled', cancel_requested=True, finished_at=timezone.now())
+    elif job.status == 'running':
+        BackgroundJob.objects.filter(pk=job.pk).update(cancel_requested=True)
+    else:
+        raise JobError(f'Job is already {job.status}')
+    job.refresh_from_db()
+    return job
+
+
+def resume_job(job, enqueue=True):
+    """Put a failed or cancelled job back in the queue; it continues from its cursor"""
+    if job.status not in ('failed', 'cancelled'):
+        raise JobError(f'Only failed or cancelled jobs can be resumed; this one is {job.status}')
+    BackgroundJob.objects.filter(pk=job.pk).update(
+        status='pending', cancel_requested=False, last_error='', finished_at=None)
+    if enqueue:
+        from .tasks import enqueue_on_commit, run_background_job
+        enqueue_on_commit(run_background_job, job.pk)
+    job.refresh_from_db()
+    return job
+
+
+def stale_jobs():
+    """Running jobs whose runner has stopped heartbeating, presumably because it crashed"""
+    return BackgroundJob.objects.filter(status='running', heartbeat_at__lt=timezone.now() - LEASE)
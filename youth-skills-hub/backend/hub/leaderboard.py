@@ -0,0 +1,246 @@
+"""
+Leaderboard ranking for all-time, monthly and weekly timeframes.
+
+Two backends are available, selected with ``settings.LEADERBOARD_BACKEND``:
+
+* ``'db'`` ranks straight from indexed columns (``User.points`` and
+  ``LeaderboardScore``). Rank lookups are index range counts, which is fine
+  for small and medium deployments.
+* ``'redis'`` mirrors every score into a Redis sorted set per timeframe and
+  period, where ``ZCOUNT``/``ZREVRANK``/``ZREVRANGE`` are all O(log n).
+  The sets start empty: fill them with ``manage.py rebuild_leaderboard``
+  when switching to this backend or after Redis loses its data.
+
+Weekly and monthly scores count points earned in the period, so deductions
+(such as leaving a group) lower them but never below zero.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import User, LeaderboardScore
+
+TIMEFRAMES = ('all_time', 'monthly', 'weekly')
+NEIGHBOR_COUNT = 5
+
+
+def period_start(timeframe, now=None):
+    """Return the first day of the current period, or None for all-time"""
+    today = (now or timezone.now()).date()
+    if timeframe == 'weekly':
+        return today - timedelta(days=today.weekday())
+    if timeframe == 'monthly':
+        return today.replace(day=1)
+    return None
+
+
+def percentile(rank, total):
+    """Share of ranked users at or below the given rank, as a percentage"""
+    if not total:
+        return 0.0
+    return round(100.0 * (total - rank + 1) / total, 1)
+
+
+class DatabaseLeaderboard:
+    """Ranks users with index range scans on the points columns"""
+
+    def record(self, user, points, now=None):
+        for timeframe in ('monthly', 'weekly'):
+            start = period_start(timeframe, now)
+            updated = LeaderboardScore.objects.filter(
+                user=user, timeframe=timeframe, period_start=start
+            ).update(points=Greatest(F('points') + points, Value(0)))
+            if not updated and points > 0:
+                try:
+                    with transaction.atomic():
+                        LeaderboardScore.objects.create(
+                            user=user, timeframe=timeframe, period_start=start, points=points)
+                except IntegrityError:
+                    LeaderboardScore.objects.filter(
+                        user=user, timeframe=timeframe, period_start=start
+                    ).update(points=F('points') + points)
+
+    def _scores(self, timeframe, now=None):
+        """Return a queryset of (user_id, username, points) rows for the timeframe"""
+        if timeframe == 'all_time':
+            return User.objects.values_list('id', 'username', 'points'), 'id', 'points'
+        qs = LeaderboardScore.objects.filter(
+            timeframe=timeframe, period_start=period_start(timeframe, now)
+        ).values_list('user_id', 'user__username', 'points')
+        return qs, 'user_id', 'points'
+
+    def _user_points(self, user, timeframe, now=None):
+        if timeframe == 'all_time':
+            return user.points, True
+        points = LeaderboardScore.objects.filter(
+            user=user, timeframe=timeframe, period_start=period_start(timeframe, now)
+        ).values_list('points', flat=True).first()
+        if points is None:
+            return 0, False
+        return points, True
+
+    def top(self, timeframe, limit=50, now=None):
+        qs, id_field, points_field = self._scores(timeframe, now)
+        rows = qs.order_by(f'-{points_field}', id_field)[:limit]
+        return [
+            {'position': i + 1, 'user_id': uid, 'username': username, 'points': points}
+            for i, (uid, username, points) in enumerate(rows)
+        ]
+
+    def rank(self, user, timeframe, now=None):
+        qs, id_field, points_field = self._scores(timeframe, now)
+        points, ranked = self._user_points(user, timeframe, now)
+
+        ahead = qs.filter(**{f'{points_field}__gt': points}).count()
+        tied_before = qs.filter(**{points_field: points, f'{id_field}__lt': user.id}).count()
+        total = qs.count() + (0 if ranked else 1)
+        position = ahead + tied_before + 1
+
+        above = qs.filter(
+            Q(**{f'{points_field}__gt': points}) | Q(**{points_field: points, f'{id_field}__lt': user.id})
+        ).order_by(points_field, f'-{id_field}')[:NEIGHBOR_COUNT]
+        below = qs.filter(
+            Q(**{f'{points_field}__lt': points}) | Q(**{points_field: points, f'{id_field}__gt': user.id})
+        ).order_by(f'-{points_field}', id_field)[:NEIGHBOR_COUNT]
+
+        above = [
+            {'position': position - i - 1, 'user_id': uid, 'username': username, 'points': pts}
+            for i, (uid, username, pts) in enumerate(above)
+        ]
+        below = [
+            {'position': position + i + 1, 'user_id': uid, 'username': username, 'points': pts}
+            for i, (uid, username, pts) in enumerate(below)
+        ]
+        return {
+            'rank': ahead + 1,
+            'position': position,
+            'points': points,
+            'total': total,
+            'percentile': percentile(ahead + 1, total),
+            'neighbors': {'above': list(reversed(above)), 'below': below},
+        }
+
+
+class RedisLeaderboard:
+    """Keeps a Redis sorted set per timeframe and period for O(log n) ranks"""
+
+    def __init__(self, url=None):
+        import redis
+        self.client = redis.Redis.from_url(url or settings.LEADERBOARD_REDIS_URL)
+
+    def _key(self, timeframe, now=None):
+        start = period_start(timeframe, now)
+        if start is None:
+            return f'leaderboard:{timeframe}'
+        return f'leaderboard:{timeframe}:{start.isoformat()}'
+
+    def record(self, user, points, now=None):
+        pipe = self.client.pipeline()
+        pipe.zincrby(self._key('all_time', now), points, user.id)
+        for timeframe, ttl in (('monthly', 62), ('weekly', 15)):
+            key = self._key(timeframe, now)
+            pipe.zincrby(key, points, user.id)
+            if points < 0:
+                pipe.zadd(key, {user.id: 0}, gt=True)  # the pipeline is a transaction, so nobody sees a negative score
+            pipe.expire(key, timedelta(days=ttl))
+        pipe.execute()
+
+    def rebuild(self, timeframe='all_time', now=None):
+        """Reload a sorted set from the database, e.g. after a Redis flush"""
+        qs, id_field, points_field = DatabaseLeaderboard()._scores(timeframe, now)
+        key = self._key(timeframe, now)
+        tmp_key = f'{key}:rebuild'
+        self.client.delete(tmp_key)
+        batch = {}
+        for uid, _, points in qs.iterator(chunk_size=2000):
+            batch[uid] = points
+            if len(batch) >= 2000:
+                self.client.zadd(tmp_key, batch)
+                batch = {}
+        if batch:
+            self.client.zadd(tmp_key, batch)
+        if self.client.exists(tmp_key):
+            self.client.rename(tmp_key, key)
+        else:
+            self.client.delete(key)
+
+    def _usernames(self, user_ids):
+        return dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+
+    def _entries(self, pairs, first_position):
+        names = self._usernames([int(uid) for uid, _ in pairs])
+        return [
+            {'position': first_position + i, 'user_id': int(uid), 'username': names.get(int(uid), ''),
+             'points': int(score)}
+            for i, (uid, score) in enumerate(pairs)
+        ]
+
+    def top(self, timeframe, limit=50, now=None):
+        pairs = self.client.zrevrange(self._key(timeframe, now), 0, limit - 1, withscores=True)
+        return self._entries(pairs, 1)
+
+    def rank(self, user, timeframe, now=None):
+        key = self._key(timeframe, now)
+        pipe = self.client.pipeline()
+        pipe.zscore(key, user.id)
+        pipe.zrevrank(key, user.id)
+        pipe.zcard(key)
+        score, index, total = pipe.execute()
+
+        if index is None:
+            points = 0
+            ahead = self.client.zcount(key, '(0', '+inf')
+            total += 1
+            return {
+                'rank': ahead + 1,
+                'position': ahead + 1,
+                'points': points,
+                'total': total,
+                'percentile': percentile(ahead + 1, total),
+                'neighbors': {
+                    'above': self._entries(
+                        self.client.zrevrange(key, max(ahead - NEIGHBOR_COUNT, 0), ahead - 1, withscores=True)
+                        if ahead else [], max(ahead - NEIGHBOR_COUNT, 0) + 1),
+                    'below': [],
+                },
+            }
+
+        points = int(score)
+        ahead = self.client.zcount(key, f'({score}', '+inf')
+        start = max(index - NEIGHBOR_COUNT, 0)
+        window = self.client.zrevrange(key, start, index + NEIGHBOR_COUNT, withscores=True)
+        offset = index - start
+        return {
+            'rank': ahead + 1,
+            'position': index + 1,
+            'points': points,
+            'total': total,
+            'percentile': percentile(ahead + 1, total),
+            'neighbors': {
+                'above': self._entries(window[:offset], start + 1),
+                'below': self._entries(window[offset + 1:], index + 2),
+            },
+        }
+
+
+_backend = None
+
+
+def get_leaderboard():
+    global _backend
+    if _backend is None:
+        if getattr(settings, 'LEADERBOARD_BACKEND', 'db') == 'redis':
+            _backend = RedisLeaderboard()
+        else:
+            _backend = DatabaseLeaderboard()
+    return _backend
+
+
+def record_points(user, points):
+    """Add awarded points to every timeframe the user is ranked in"""
+    if points:
+        get_leaderboard().record(user, points)
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from hub.analytics import compute_funnels, get_funnel_report
+
+
+class Command(BaseCommand):
+    help = "Compute today's completion funnel and cohort retention snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true', help="Recompute even if today's snapshot exists")
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N',
+                            help='Time the funnel computation on N synthetic enrollments instead of the database')
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            self.benchmark(options['benchmark'])
+            return
+        report = get_funnel_report(refresh=options['refresh'])
+        self.stdout.write(
+            f"{report['enrollments']} enrollments, {len(report['by_course'])} courses, "
+            f"{len(report['by_cohort'])} cohorts (load {report['load_ms']} ms, compute {report['compute_ms']} ms)"
+        )
+
+    def benchmark(self, n):
+        rng = np.random.default_rng(0)
+        user_count, course_count = max(n // 10, 1), 500
+        now = time.time()
+        cohort_user_ids = np.arange(1, user_count + 1, dtype=np.int64)
+        joined = now - rng.uniform(0, 365 * 86400, user_count)
+        cohort_months = joined.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+        user_ids = rng.integers(1, user_count + 1, n)
+        course_ids = rng.integers(1, course_count + 1, n)
+        progress = rng.integers(0, 101, n).astype(np.int16)
+        enrolled_at = joined[user_ids - 1] + rng.uniform(0, 90 * 86400, n)
+        completed_at = np.where(progress == 100, enrolled_at + 86400, -1.0)
+        categories = {cid: ('coding', 'digital_literacy', 'renewable_energy')[cid % 3] for cid in range(1, course_count + 1)}
+
+        started = time.perf_counter()
+        report = compute_funnels(user_ids, course_ids, progress, enrolled_at, completed_at,
+                                 cohort_user_ids, cohort_months, categories)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            f"{n} synthetic enrollments, {user_count} users, {len(report['by_cohort'])} cohorts: "
+            f"computed in {elapsed:.1f} ms"
+        )
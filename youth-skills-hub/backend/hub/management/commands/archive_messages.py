@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.archive import SEGMENT_MAX_MESSAGES, archive_messages, storage_report
+
+
+def _size(num_bytes):
+    for unit in ('B', 'KB', 'MB'):
+        if num_bytes < 1024:
+            return f'{num_bytes:.1f} {unit}' if unit != 'B' else f'{num_bytes} B'
+        num_bytes /= 1024
+    return f'{num_bytes:.1f} GB'
+
+
+class Command(BaseCommand):
+    help = 'Move old study-group messages into compressed per-group, per-month archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=180,
+                            help='Archive messages sent more than this many days ago (default: 180)')
+        parser.add_argument('--batch-size', type=int, default=SEGMENT_MAX_MESSAGES,
+                            help='Messages read from the hot table per query')
+        parser.add_argument('--report', action='store_true', help='Only print totals for existing segments')
+
+    def handle(self, *args, **options):
+        if not options['report']:
+            if options['older_than_days'] < 1:
+                raise CommandError('--older-than-days must be at least 1')
+            stats = archive_messages(
+                timedelta(days=options['older_than_days']),
+                batch_size=options['batch_size'],
+                on_group=lambda group_id, stats: self.stdout.write(
+                    f"group {group_id}: {stats['messages']} messages archived so far"),
+            )
+            self.stdout.write(
+                f"Archived {stats['messages']} messages from {stats['groups']} groups "
+                f"into {stats['segments']} new segments: {_size(stats['raw_bytes'])} -> {_size(stats['stored_bytes'])}"
+            )
+
+        totals = storage_report()
+        saved = totals['raw_bytes'] - totals['stored_bytes']
+        ratio = totals['raw_bytes'] / totals['stored_bytes'] if totals['stored_bytes'] else 0
+        self.stdout.write(
+            f"Archive: {totals['messages']} messages in {totals['segments']} segments, "
+            f"{_size(totals['stored_bytes'])} stored for {_size(totals['raw_bytes'])} of message data "
+            f"({_size(saved)} saved, {ratio:.1f}x)"
+        )
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from hub.reminders import backfill_reminders, dispatch_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Send due event and mentorship reminders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help='First schedule reminders for upcoming events and sessions that have none')
+        parser.add_argument('--loop', action='store_true', help='Keep ticking instead of exiting')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between ticks with --loop')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f'Scheduled {backfill_reminders()} reminders')
+        while True:
+            sent = dispatch_due_reminders()
+            if sent or not options['loop']:
+                self.stdout.write(f'Sent {sent} reminders')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.models import OutboxMessage
+from hub.outbox import drain
+
+
+class Command(BaseCommand):
+    help = 'Send pending outbox emails and SMS in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('channels', nargs='*', metavar='channel', help='email and/or sms (default: both)')
+        parser.add_argument('--loop', action='store_true', help='Keep draining, polling for new messages')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        known = [channel for channel, _ in OutboxMessage.CHANNEL_CHOICES]
+        channels = options['channels'] or known
+        unknown = set(channels) - set(known)
+        if unknown:
+            raise CommandError(f'Unknown channel(s): {", ".join(sorted(unknown))}')
+        while True:
+            for channel in channels:
+                result = drain(channel)
+                if result is None:
+                    self.stdout.write(f'{channel}: another worker is draining')
+                elif any(result):
+                    self.stdout.write(f'{channel}: sent {result[0]}, retrying {result[1]}, failed {result[2]}')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
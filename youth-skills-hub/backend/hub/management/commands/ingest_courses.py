@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.dedupe import dedupe_courses
+from hub.ingest import CHUNK_SIZE, FORMATS, IngestError, ingest, read_rows
+from hub.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Upsert a provider course feed (JSON array, CSV or NDJSON) into Course, matching on provider and external id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', help="Feed path, http(s) URL or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Feed format (default: from the file extension)')
+        parser.add_argument('--provider', help='Provider name for rows that do not include one')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows upserted per query')
+        parser.add_argument('--keep-missing', action='store_true',
+                            help='Do not deactivate courses missing from the feed (for partial feeds)')
+        parser.add_argument('--skip-dedupe', action='store_true',
+                            help='Do not recompute near-duplicate courses after ingesting')
+        parser.add_argument('--dedupe', action='store_true',
+                            help='Recompute near-duplicates across internal and free courses without a feed')
+        parser.add_argument('--reindex', action='store_true',
+                            help='Rebuild recommendation vectors for every active course')
+
+    def handle(self, *args, **options):
+        if not (options['source'] or options['dedupe'] or options['reindex']):
+            raise CommandError('Give a feed to ingest, --dedupe or --reindex')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        if options['source']:
+            try:
+                stats = ingest(
+                    read_rows(options['source'], options['format']),
+                    provider=options['provider'],
+                    chunk_size=options['chunk_size'],
+                    deactivate_missing=not options['keep_missing'],
+                    dedupe=not options['skip_dedupe'],
+                    on_chunk=lambda stats, seconds: self.stdout.write(
+                        f"{stats['rows']} rows, {stats['rows'] / seconds if seconds else 0:.0f} rows/s"),
+                )
+            except (IngestError, OSError) as e:
+                raise CommandError(str(e))
+            self.stdout.write(
+                f"Ingested {stats['rows']} rows in {stats['seconds']:.1f}s ({stats['rows_per_second']:.0f} rows/s): "
+                f"{stats['created']} created, {stats['updated']} updated, {stats['skipped']} skipped, "
+                f"{stats['deactivated']} deactivated"
+            )
+            if 'duplicates' in stats:
+                self._report_duplicates(stats['duplicates'])
+        elif options['dedupe']:
+            self._report_duplicates(dedupe_courses())
+
+        if options['reindex']:
+            from hub.ml_model import update_course_index
+            indexed = update_course_index(Course.objects.values_list('pk', flat=True))
+            self.stdout.write(f'Indexed {indexed} active courses for recommendations')
+
+    def _report_duplicates(self, duplicates):
+        self.stdout.write(
+            f"Near-duplicates: {duplicates['courses']} internal courses, {duplicates['free_courses']} free courses")
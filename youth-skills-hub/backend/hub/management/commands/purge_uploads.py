@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from hub.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete unfinished file uploads, and their partial files, that have stopped receiving chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        count = purge_stale_uploads(timedelta(hours=options['older_than_hours']))
+        self.stdout.write(f'Removed {count} stale uploads')
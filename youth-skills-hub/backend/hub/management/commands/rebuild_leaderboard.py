@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hub.leaderboard import TIMEFRAMES, get_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Reload the Redis leaderboard's sorted sets for every timeframe from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('timeframes', nargs='*', metavar='timeframe',
+                            help=f'Timeframes to rebuild (default: all). Choices: {", ".join(TIMEFRAMES)}')
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'LEADERBOARD_BACKEND', 'db') != 'redis':
+            self.stdout.write('LEADERBOARD_BACKEND is not redis; the database leaderboard needs no rebuild')
+            return
+        leaderboard = get_leaderboard()
+        for timeframe in options['timeframes'] or TIMEFRAMES:
+            leaderboard.rebuild(timeframe)
+            self.stdout.write(f'{timeframe}: rebuilt')
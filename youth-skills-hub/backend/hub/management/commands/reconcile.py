@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.leaderboard import get_leaderboard
+from hub.reconcile import DEFAULT_TARGETS, RECONCILERS, clear_checkpoint, load_checkpoint, save_checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized counters and aggregates in primary-key chunks and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*', metavar='target',
+                            help=f'Reconcilers to run (default: {", ".join(DEFAULT_TARGETS)}; '
+                                 f'"points" overwrites points with the formula and must be named). '
+                                 f'Choices: {", ".join(RECONCILERS)}')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted rows without writing')
+        parser.add_argument('--throttle', type=float, default=0, metavar='SECONDS',
+                            help='Pause between chunks to limit load on the database')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue each target from its last checkpoint instead of the start')
+
+    def handle(self, *args, **options):
+        targets = options['targets'] or DEFAULT_TARGETS
+        unknown = set(targets) - set(RECONCILERS)
+        if unknown:
+            raise CommandError(f'Unknown target(s): {", ".join(sorted(unknown))}')
+
+        for name in targets:
+            reconciler = RECONCILERS[name]
+            start_after = load_checkpoint(name) if options['resume'] else 0
+            checked, fixed, _ = reconciler.run(
+                chunk_size=options['chunk_size'],
+                dry_run=options['dry_run'],
+                throttle=options['throttle'],
+                start_after=start_after,
+                on_chunk=None if options['dry_run'] else save_checkpoint,
+            )
+            if not options['dry_run']:
+                clear_checkpoint(name)
+            verb = 'would fix' if options['dry_run'] else 'fixed'
+            self.stdout.write(f'{name}: checked {checked} rows after pk {start_after}, {verb} {fixed}')
+
+            if name == 'points' and fixed and not options['dry_run'] and settings.LEADERBOARD_BACKEND == 'redis':
+                get_leaderboard().rebuild('all_time')
@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hub.jobs import JOBS, JobError, cancel_job, resume_job, run_job, start_job
+from hub.models import BackgroundJob
+
+
+class Command(BaseCommand):
+    help = 'Run a resumable background job in the foreground, or resume, cancel or list jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help=f'Job to start. Choices: {", ".join(sorted(JOBS))}')
+        parser.add_argument('--param', action='append', default=[], metavar='KEY=VALUE', help='Job parameter')
+        parser.add_argument('--chunk-size', type=int, help="Rows per committed chunk (default: the job's own)")
+        parser.add_argument('--throttle', type=float, default=0, metavar='SECONDS', help='Pause between chunks')
+        parser.add_argument('--resume', type=int, metavar='JOB_ID',
+                            help='Continue a failed, cancelled or abandoned job from its cursor')
+        parser.add_argument('--cancel', type=int, metavar='JOB_ID', help='Cancel a pending or running job')
+        parser.add_argument('--list', action='store_true', help='Show recent jobs and the available job types')
+
+    def handle(self, *args, **options):
+        try:
+            if options['list']:
+                return self._list()
+            if options['cancel']:
+                job = cancel_job(self._job(options['cancel']))
+                self.stdout.write(f'{job}: cancel requested')
+                return
+            if options['resume']:
+                job = self._job(options['resume'])
+                if job.status in ('failed', 'cancelled'):
+                    job = resume_job(job, enqueue=False)
+                job_id = job.pk
+            elif options['name']:
+                params = {}
+                for param in options['param']:
+                    key, sep, value = param.partition('=')
+                    if not sep:
+                        raise CommandError(f'--param must look like KEY=VALUE, got {param!r}')
+                    params[key] = value
+                job = start_job(options['name'], params, chunk_size=options['chunk_size'],
+                                throttle=options['throttle'], enqueue=False)
+                job_id = job.pk
+            else:
+                raise CommandError('Give a job name, --resume, --cancel or --list')
+        except JobError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f'Running job #{job_id}')
+        job = run_job(job_id, on_chunk=lambda job: self.stdout.write(
+            f'{job.processed}/{job.total if job.total is not None else "?"} rows, cursor {job.cursor}, '
+            f'{json.dumps(job.result)}'))
+        if job is None:
+            raise CommandError(f'Job #{job_id} is finished or another worker is running it')
+        self.stdout.write(f'{job}: {job.processed} rows, {json.dumps(job.result)}')
+        if job.status == 'failed':
+            raise CommandError(f'{job.last_error} (resume with --resume {job.pk})')
+
+    def _job(self, job_id):
+        job = BackgroundJob.objects.filter(pk=job_id).first()
+        if job is None:
+            raise CommandError(f'No job #{job_id}')
+        return job
+
+    def _list(self):
+        for name in sorted(JOBS):
+            self.stdout.write(f'{name}: {JOBS[name].description}')
+        for job in BackgroundJob.objects.all()[:20]:
+            self.stdout.write(f'#{job.pk} {job.name} {job.status} {job.processed}/{job.total} cursor {job.cursor}')
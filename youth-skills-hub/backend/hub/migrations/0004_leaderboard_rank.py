@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0003_remove_badge_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='points',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='LeaderboardScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timeframe', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timeframe', 'period_start', 'points', 'user'], name='hub_lbscore_rank_idx')],
+                'unique_together': {('timeframe', 'period_start', 'user')},
+            },
+        ),
+    ]
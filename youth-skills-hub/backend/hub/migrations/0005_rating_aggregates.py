@@ -0,0 +1,58 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:31
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_rating_aggregates(apps, schema_editor):
+    # Later rating changes apply deltas to these, so they must start from the ratings already given
+    for model_name, source_name, key, fields in (
+        ('Course', 'Enrollment', 'course_id', ('rating_sum', 'rating_count', 'rating')),
+        ('User', 'Mentorship', 'mentor_id', ('mentor_rating_sum', 'mentor_rating_count', 'mentor_rating')),
+    ):
+        model = apps.get_model('hub', model_name)
+        source = apps.get_model('hub', source_name)
+        totals = source.objects.filter(rating__gt=0).order_by().values(key).annotate(total=Sum('rating'), count=Count('pk'))
+        sum_field, count_field, average_field = fields
+        for row in totals.iterator():
+            average = (Decimal(row['total']) / row['count']).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+            model.objects.filter(pk=row[key]).update(
+                **{sum_field: row['total'], count_field: row['count'], average_field: average})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0004_leaderboard_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='mentor_rating',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='mentor_rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='mentor_rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(seed_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0006_analytics_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='current_streak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='last_active_day',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='longest_streak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ProgressDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('updates', models.IntegerField(default=0)),
+                ('progress_gained', models.IntegerField(default=0)),
+                ('courses_completed', models.IntegerField(default=0)),
+                ('course_progress', models.JSONField(default=dict)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_days', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['day'],
+                'unique_together': {('user', 'day')},
+            },
+        ),
+    ]
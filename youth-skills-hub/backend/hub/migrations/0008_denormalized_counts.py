@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def seed_counts(apps, schema_editor):
+    for model_name, relation, fk, field in (
+        ('Event', 'attendees', 'event_id', 'attendee_count'),
+        ('StudyGroup', 'members', 'studygroup_id', 'members_count'),
+    ):
+        model = apps.get_model('hub', model_name)
+        through = getattr(model, relation).through
+        counts = through.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+        model.objects.update(**{field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0007_progress_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='attendee_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='studygroup',
+            name='members_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(seed_counts, migrations.RunPython.noop),
+    ]
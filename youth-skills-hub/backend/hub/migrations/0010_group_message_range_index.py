@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0009_reconcile_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'id'], name='hub_groupmsg_group_id_idx'),
+        ),
+    ]
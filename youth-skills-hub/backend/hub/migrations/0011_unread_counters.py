@@ -0,0 +1,59 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def seed_counters(apps, schema_editor):
+    User = apps.get_model('hub', 'User')
+    Notification = apps.get_model('hub', 'Notification')
+    StudyGroup = apps.get_model('hub', 'StudyGroup')
+    GroupMessage = apps.get_model('hub', 'GroupMessage')
+    GroupReadCursor = apps.get_model('hub', 'GroupReadCursor')
+
+    unread = Notification.objects.filter(user_id=OuterRef('pk'), is_read=False).order_by().values('user_id').annotate(n=Count('pk')).values('n')
+    User.objects.update(unread_notifications=Coalesce(Subquery(unread), 0))
+
+    # Existing members start fully caught up
+    latest = dict(GroupMessage.objects.order_by().values('group_id').annotate(m=Max('id')).values_list('group_id', 'm'))
+    memberships = StudyGroup.members.through.objects.values_list('studygroup_id', 'user_id').iterator(chunk_size=2000)
+    batch = []
+    for group_id, user_id in memberships:
+        batch.append(GroupReadCursor(group_id=group_id, user_id=user_id, last_read_message_id=latest.get(group_id, 0)))
+        if len(batch) >= 2000:
+            GroupReadCursor.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    GroupReadCursor.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0010_group_message_range_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_notifications',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='GroupReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='hub.studygroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_read_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'group')},
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
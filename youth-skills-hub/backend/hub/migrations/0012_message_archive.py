@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0011_unread_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupMessageSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('first_message_id', models.BigIntegerField()),
+                ('last_message_id', models.BigIntegerField()),
+                ('message_count', models.IntegerField()),
+                ('raw_bytes', models.IntegerField()),
+                ('payload', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['group', 'first_message_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['created_at'], name='hub_groupmsg_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='groupmessagesegment',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_segments', to='hub.studygroup'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmessagesegment',
+            index=models.Index(fields=['group', 'last_message_id'], name='hub_msgseg_group_last_idx'),
+        ),
+    ]
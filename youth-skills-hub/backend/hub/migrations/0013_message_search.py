@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# The index lives in the database and follows every insert, update and delete.
+# Note: on SQLite, a later migration that makes Django rebuild hub_groupmessage
+# (altering a column rather than adding one) drops the triggers; re-run
+# create_index in that migration.
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE hub_groupmessage_fts USING fts5("
+    "message, group_id, content='hub_groupmessage', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER hub_groupmessage_fts_insert AFTER INSERT ON hub_groupmessage BEGIN "
+    "INSERT INTO hub_groupmessage_fts(rowid, message, group_id) VALUES (new.id, new.message, new.group_id); END",
+    "CREATE TRIGGER hub_groupmessage_fts_delete AFTER DELETE ON hub_groupmessage BEGIN "
+    "INSERT INTO hub_groupmessage_fts(hub_groupmessage_fts, rowid, message, group_id) "
+    "VALUES ('delete', old.id, old.message, old.group_id); END",
+    "CREATE TRIGGER hub_groupmessage_fts_update AFTER UPDATE OF message, group_id ON hub_groupmessage BEGIN "
+    "INSERT INTO hub_groupmessage_fts(hub_groupmessage_fts, rowid, message, group_id) "
+    "VALUES ('delete', old.id, old.message, old.group_id); "
+    "INSERT INTO hub_groupmessage_fts(rowid, message, group_id) VALUES (new.id, new.message, new.group_id); END",
+    "INSERT INTO hub_groupmessage_fts(hub_groupmessage_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS hub_groupmessage_fts_insert',
+    'DROP TRIGGER IF EXISTS hub_groupmessage_fts_delete',
+    'DROP TRIGGER IF EXISTS hub_groupmessage_fts_update',
+    'DROP TABLE IF EXISTS hub_groupmessage_fts',
+]
+POSTGRES_CREATE = [
+    "CREATE INDEX hub_groupmsg_search_idx ON hub_groupmessage USING GIN (to_tsvector('english', message))",
+]
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS hub_groupmsg_search_idx',
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql, params=None)
+
+
+def create_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE})
+
+
+def drop_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0012_message_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
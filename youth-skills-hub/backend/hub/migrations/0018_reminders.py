@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0017_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minutes_before', models.IntegerField()),
+                ('due_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('cancelled', 'Cancelled')], default='pending', max_length=10)),
+                ('claim_token', models.UUIDField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='hub.event')),
+                ('mentorship', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='hub.mentorship')),
+            ],
+            options={
+                'ordering': ['due_at'],
+                'indexes': [models.Index(fields=['status', 'due_at'], name='hub_reminder_due_idx')],
+            },
+        ),
+    ]
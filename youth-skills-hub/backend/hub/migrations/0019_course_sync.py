@@ -0,0 +1,41 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0018_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseVector',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='hub.course')),
+                ('indices', models.BinaryField()),
+                ('values', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='course',
+            constraint=models.UniqueConstraint(fields=('provider', 'external_id'), name='hub_course_provider_external_id'),
+        ),
+        migrations.AddIndex(
+            model_name='coursevector',
+            index=models.Index(fields=['updated_at'], name='hub_coursevec_updated_idx'),
+        ),
+    ]
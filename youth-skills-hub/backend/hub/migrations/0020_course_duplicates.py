@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0019_course_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='hub.course'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='minhash',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='FreeCourseDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('free_course_id', models.CharField(max_length=200, unique=True)),
+                ('duplicate_of_free_id', models.CharField(blank=True, max_length=200)),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='hub.course')),
+            ],
+        ),
+    ]
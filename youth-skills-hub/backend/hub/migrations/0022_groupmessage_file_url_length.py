@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:28
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+message_search = import_module('hub.migrations.0013_message_search')
+
+
+def recreate_search_index(apps, schema_editor):
+    # On SQLite, altering a hub_groupmessage column rebuilds the table and drops
+    # the full-text triggers from 0013, so set the index up again and reindex
+    message_search.drop_index(apps, schema_editor)
+    message_search.create_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0021_background_jobs'),
+    ]
+
+    operations = [
+        # Runs last when unapplying, after the reverse AlterField has rebuilt the table again
+        migrations.RunPython(migrations.RunPython.noop, recreate_search_index),
+        migrations.AlterField(
+            model_name='groupmessage',
+            name='file_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.RunPython(recreate_search_index, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,88 @@
+import threading
+
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
+from django.db.models import Count, Max
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import StandardScaler
-from .models import User, Course, Enrollment
+from .models import User, Course, CourseVector, Enrollment
+
+# Hashing needs no fitted vocabulary, so each course is vectorized on its own
+# and the index is updated one course at a time instead of refit per request
+N_FEATURES = 2 ** 18
+course_vectorizer = HashingVectorizer(n_features=N_FEATURES, stop_words='english', alternate_sign=False, norm='l2')
+INDEX_BATCH_SIZE = 500
+
+def course_text(course):
+    return f"{course.title} {course.description} {course.category}".lower()
+
+def update_course_index(course_ids):
+    """Re-vectorize the given courses; inactive or deleted ones are dropped from the index"""
+    course_ids = list(course_ids)
+    indexed = 0
+    for start in range(0, len(course_ids), INDEX_BATCH_SIZE):
+        batch = course_ids[start:start + INDEX_BATCH_SIZE]
+        courses = list(Course.objects.filter(pk__in=batch, is_active=True).only('id', 'title', 'description', 'category'))
+        CourseVector.objects.filter(course_id__in=batch).exclude(course_id__in=[course.pk for course in courses]).delete()
+        if not courses:
+            continue
+        matrix = course_vectorizer.transform([course_text(course) for course in courses])
+        vectors = []
+        for row, course in enumerate(courses):
+            start_at, end_at = matrix.indptr[row], matrix.indptr[row + 1]
+            vectors.append(CourseVector(
+                course=course,
+                indices=matrix.indices[start_at:end_at].astype(np.int32).tobytes(),
+                values=matrix.data[start_at:end_at].astype(np.float32).tobytes(),
+            ))
+        CourseVector.objects.bulk_create(
+            vectors, update_conflicts=True, unique_fields=['course'], update_fields=['indices', 'values', 'updated_at'])
+        indexed += len(courses)
+    return indexed
+
+class CourseIndex:
+    """All course vectors as one sparse matrix, reloaded only after CourseVector rows change"""
+    def __init__(self):
+        self.version = None
+        self.course_ids = np.empty(0, dtype=np.int64)
+        self.matrix = csr_matrix((0, N_FEATURES), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        stats = CourseVector.objects.aggregate(count=Count('pk'), latest=Max('updated_at'))
+        version = (stats['count'], stats['latest'])
+        with self._lock:
+            if version == self.version:
+                return
+            course_ids, indptr, indices, values = [], [0], [], []
+            for course_id, row_indices, row_values in CourseVector.objects.order_by('course_id').values_list(
+                    'course_id', 'indices', 'values').iterator(chunk_size=2000):
+                course_ids.append(course_id)
+                indices.append(np.frombuffer(row_indices, dtype=np.int32))
+                values.append(np.frombuffer(row_values, dtype=np.float32))
+                indptr.append(indptr[-1] + len(indices[-1]))
+            self.course_ids = np.array(course_ids, dtype=np.int64)
+            self.matrix = csr_matrix(
+                (np.concatenate(values) if values else np.empty(0, dtype=np.float32),
+                 np.concatenate(indices) if indices else np.empty(0, dtype=np.int32),
+                 indptr),
+                shape=(len(course_ids), N_FEATURES))
+            self.version = version
+
+    def similar(self, text, limit=5, exclude=()):
+        """Ids of the indexed courses closest to ``text`` by cosine similarity, best first"""
+        self.refresh()
+        if not len(self.course_ids):
+            return []
+        scores = (self.matrix @ course_vectorizer.transform([text.lower()]).T).toarray().ravel()
+        if exclude:
+            scores[np.isin(self.course_ids, list(exclude))] = -1
+        candidates = np.flatnonzero(scores >= 0)
+        top = candidates[np.argsort(-scores[candidates], kind='stable')[:limit]]
+        return [int(course_id) for course_id in self.course_ids[top]]
+
+course_index = CourseIndex()
 
 class MentorMatcher:
     def __init__(self):
@@ -42,46 +122,30 @@ class MentorMatcher:
             return mentors.first()
 
 class CourseRecommender:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(stop_words='english', max_features=500)
+    def __init__(self, index=None):
+        self.index = index or course_index
 
     def get_course_text(self, course):
         """Convert course to text for recommendation"""
-        return f"{course.title} {course.description} {course.category}".lower()
+        return course_text(course)
 
     def recommend_courses(self, user, limit=5):
         """Recommend courses based on user's profile and completed courses"""
         # Get user's completed courses
-        completed_course_ids = Enrollment.objects.filter(
+        completed_course_ids = set(Enrollment.objects.filter(
             user=user, completed=True
-        ).values_list('course_id', flat=True)
+        ).values_list('course_id', flat=True))
 
-        # Get all available courses except completed ones
         available_courses = Course.objects.filter(is_active=True).exclude(id__in=completed_course_ids)
+        user_profile = f"{' '.join(user.skills or [])} {' '.join(user.interests or [])}".strip()
+        if not user_profile:
+            return list(available_courses[:limit] or Course.objects.filter(is_active=True)[:limit])
 
-        if not available_courses:
-            return Course.objects.filter(is_active=True)[:limit]
-
-        user_profile = f"{' '.join(user.skills)} {' '.join(user.interests)}".lower()
-        course_texts = [self.get_course_text(course) for course in available_courses]
-
-        if not user_profile or not any(course_texts):
-            return list(available_courses[:limit])
-
-        try:
-            # Vectorize user profile and course descriptions
-            all_texts = [user_profile] + course_texts
-            tfidf_matrix = self.vectorizer.fit_transform(all_texts)
-            similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
-
-            # Sort courses by similarity score
-            course_similarity_pairs = list(zip(available_courses, similarities))
-            course_similarity_pairs.sort(key=lambda x: x[1], reverse=True)
-
-            recommended_courses = [course for course, _ in course_similarity_pairs[:limit]]
-            return recommended_courses
-        except:
-            return list(available_courses[:limit])
+        # Rank against the precomputed course vectors instead of vectorizing every course per request
+        course_ids = self.index.similar(user_profile, limit, exclude=completed_course_ids)
+        courses = available_courses.in_bulk(course_ids)
+        recommended_courses = [courses[course_id] for course_id in course_ids if course_id in courses]
+        return recommended_courses or list(available_courses[:limit])
 
 def award_badges(user):
     """Check and award badges to user based on their achievements"""
@@ -184,5 +248,4 @@ def award_badges(user):
         if created:
             awarded_badges.append(badge)
 
-    return awarded_badges</content>
-<parameter name="filePath">c:\Users\User\OneDrive\Desktop\Education\youth-skills-hub\backend\hub\ml_model.py
+    return awarded_badges
@@ -1,8 +1,39 @@
-from django.db import models
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, Value, When
+from django.db.models.functions import Cast, Greatest
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
+def rating_delta(old, new):
+    """Return the (sum, count) change for a 1-5 rating moving from old to new (0 = unrated)"""
+    delta_sum = delta_count = 0
+    if old:
+        delta_sum -= old
+        delta_count -= 1
+    if new:
+        delta_sum += new
+        delta_count += 1
+    return delta_sum, delta_count
+
+def rating_update(sum_field, count_field, average_field, delta_sum, delta_count):
+    """Build update() kwargs that apply a rating delta and refresh the average in one statement"""
+    new_sum = F(sum_field) + delta_sum
+    new_count = F(count_field) + delta_count
+    average = ExpressionWrapper(Cast(new_sum, FloatField()) / new_count, output_field=FloatField())
+    return {
+        sum_field: new_sum,
+        count_field: new_count,
+        average_field: Case(
+            When(**{f'{count_field}__gt': -delta_count}, then=Cast(average, DecimalField(max_digits=3, decimal_places=1))),
+            default=Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=1),
+        ),
+    }
+
 class User(AbstractUser):
     ROLE_CHOICES = [
         ('learner', 'Learner'),
@@ -17,11 +48,18 @@ class User(AbstractUser):
     interests = models.JSONField(default=list)  # List of interests
     phone_number = models.CharField(max_length=20, blank=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True)
-    points = models.IntegerField(default=0)
+    points = models.IntegerField(default=0, db_index=True)
     is_verified = models.BooleanField(default=False)
     preferred_language = models.CharField(max_length=10, default='en')
     two_factor_enabled = models.BooleanField(default=False)
     two_factor_secret = models.CharField(max_length=32, blank=True)
+    mentor_rating = models.DecimalField(max_digits=3, decimal_places=1, default=0)
+    mentor_rating_sum = models.IntegerField(default=0)
+    mentor_rating_count = models.IntegerField(default=0)
+    current_streak = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
+    last_active_day = models.DateField(blank=True, null=True)
+    unread_notifications = models.IntegerField(default=0)
 
     groups = models.ManyToManyField(
         'auth.Group',
@@ -42,12 +80,44 @@ class User(AbstractUser):
         return self.username
 
     def add_points(self, points):
+        User.objects.filter(pk=self.pk).update(points=F('points') + points)
         self.points += points
-        self.save()
+        from .leaderboard import record_points
+        record_points(self, points)
 
     def get_badges(self):
         return UserBadge.objects.filter(user=self)
 
+    def record_activity(self, day=None):
+        """Extend or restart the daily learning streak; repeat calls on the same day are no-ops"""
+        day = day or timezone.localdate()
+        yesterday = day - timedelta(days=1)
+        users = User.objects.filter(pk=self.pk)
+        updated = users.filter(last_active_day=yesterday).update(
+            current_streak=F('current_streak') + 1,
+            longest_streak=Greatest(F('longest_streak'), F('current_streak') + 1),
+            last_active_day=day,
+        ) or users.filter(models.Q(last_active_day__isnull=True) | models.Q(last_active_day__lt=yesterday)).update(
+            current_streak=1,
+            longest_streak=Greatest(F('longest_streak'), 1),
+            last_active_day=day,
+        )
+        if updated:
+            self.refresh_from_db(fields=['current_streak', 'longest_streak', 'last_active_day'])
+
+    @property
+    def active_streak(self):
+        """Current streak, or 0 once a full day has passed without activity"""
+        if self.last_active_day and self.last_active_day >= timezone.localdate() - timedelta(days=1):
+            return self.current_streak
+        return 0
+
+    def record_mentor_rating(self, old, new):
+        delta_sum, delta_count = rating_delta(old, new)
+        if delta_sum or delta_count:
+            User.objects.filter(pk=self.pk).update(**rating_update(
+                'mentor_rating_sum', 'mentor_rating_count', 'mentor_rating', delta_sum, delta_count))
+
 class Course(models.Model):
     CATEGORY_CHOICES = [
         ('coding', 'Coding'),
@@ -61,22 +131,66 @@ class Course(models.Model):
     skill_level = models.CharField(max_length=20, choices=[('beginner', 'Beginner'), ('intermediate', 'Intermediate'), ('advanced', 'Advanced')])
     duration = models.IntegerField(help_text='Duration in hours')
     provider = models.CharField(max_length=100)  # e.g., Coursera, edX
+    external_id = models.CharField(max_length=200, blank=True, null=True)  # the provider's id, for catalog sync
     external_url = models.URLField()
     image = models.ImageField(upload_to='courses/', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
     enrolled_count = models.IntegerField(default=0)
+    last_synced_at = models.DateTimeField(blank=True, null=True)
+    minhash = models.BinaryField(blank=True, null=True, editable=False)  # see hub/dedupe.py
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, blank=True, null=True,
+                                     related_name='duplicates')
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'external_id'], name='hub_course_provider_external_id'),
+        ]
 
     def __str__(self):
         return self.title
 
-    def update_enrolled_count(self):
-        self.enrolled_count = self.enrollment_set.count()
-        self.save()
+    def save(self, *args, **kwargs):
+        from .dedupe import course_signature
+        self.minhash = course_signature(self)
+        super().save(*args, **kwargs)
+        from .tasks import enqueue_on_commit, update_course_index
+        enqueue_on_commit(update_course_index, [self.pk])
+
+    def update_enrolled_count(self, delta=1):
+        Course.objects.filter(pk=self.pk).update(enrolled_count=F('enrolled_count') + delta)
+        self.enrolled_count += delta
+
+    def record_rating(self, old, new):
+        delta_sum, delta_count = rating_delta(old, new)
+        if delta_sum or delta_count:
+            Course.objects.filter(pk=self.pk).update(**rating_update(
+                'rating_sum', 'rating_count', 'rating', delta_sum, delta_count))
+
+class CourseVector(models.Model):
+    """Hashed, L2-normalized text features of an active course for the recommendation index"""
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='vector')
+    indices = models.BinaryField()  # int32 feature indices
+    values = models.BinaryField()  # float32 weights
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='hub_coursevec_updated_idx'),
+        ]
+
+class FreeCourseDuplicate(models.Model):
+    """A free-catalog course found to duplicate an internal course or an earlier free course"""
+    free_course_id = models.CharField(max_length=200, unique=True)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, blank=True, null=True)
+    duplicate_of_free_id = models.CharField(max_length=200, blank=True)
+
+    def __str__(self):
+        return f"{self.free_course_id} -> {self.course_id or self.duplicate_of_free_id}"
 
 class Enrollment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -91,11 +205,79 @@ class Enrollment(models.Model):
     class Meta:
         unique_together = ('user', 'course')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = instance.__dict__.get('rating', 0)
+        instance._loaded_progress = instance.__dict__.get('progress', 0)
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.completed and not self.completed_at:
+        created = self._state.adding
+        completed_now = self.completed and not self.completed_at
+        if completed_now:
             self.completed_at = timezone.now()
-            self.user.add_points(10)  # Award points for completion
         super().save(*args, **kwargs)
+        old_course_id = getattr(self, '_loaded_course_id', self.course_id)
+        if created:
+            self.course.update_enrolled_count(1)
+        elif old_course_id != self.course_id:
+            Course.objects.filter(pk=old_course_id).update(enrolled_count=F('enrolled_count') - 1)
+            self.course.update_enrolled_count(1)
+        self._loaded_course_id = self.course_id
+        if completed_now:
+            from .tasks import enrollment_completed, enqueue_on_commit
+            enqueue_on_commit(enrollment_completed, self.pk)  # completion points, notification and badges
+        old_rating = getattr(self, '_loaded_rating', 0)
+        if self.rating != old_rating:
+            self.course.record_rating(old_rating, self.rating)
+            self._loaded_rating = self.rating
+        old_progress = getattr(self, '_loaded_progress', 0)
+        if int(self.progress) != old_progress or completed_now:
+            ProgressDay.record(self.user, self.course_id, old_progress, int(self.progress), completed_now)
+            self.user.record_activity()
+            self._loaded_progress = int(self.progress)
+
+    def delete(self, *args, **kwargs):
+        self.course.record_rating(getattr(self, '_loaded_rating', self.rating), 0)
+        self.course.update_enrolled_count(-1)
+        return super().delete(*args, **kwargs)
+
+class ProgressDay(models.Model):
+    """One row per user per day summarising their course progress updates"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='progress_days')
+    day = models.DateField()
+    updates = models.IntegerField(default=0)
+    progress_gained = models.IntegerField(default=0)
+    courses_completed = models.IntegerField(default=0)
+    course_progress = models.JSONField(default=dict)  # {course_id: latest progress that day}
+
+    class Meta:
+        unique_together = ('user', 'day')
+        ordering = ['day']
+
+    def __str__(self):
+        return f"{self.user.username} {self.day}: +{self.progress_gained}"
+
+    @classmethod
+    def record(cls, user, course_id, old_progress, new_progress, completed=False, day=None):
+        """Fold a progress change into the user's bucket for the day, creating it if needed"""
+        day = day or timezone.localdate()
+        with transaction.atomic():
+            bucket = cls.objects.select_for_update().filter(user=user, day=day).first()
+            if bucket is None:
+                try:
+                    with transaction.atomic():
+                        bucket = cls.objects.create(user=user, day=day)
+                except IntegrityError:
+                    bucket = cls.objects.select_for_update().get(user=user, day=day)
+            bucket.updates += 1
+            bucket.progress_gained += max(new_progress - old_progress, 0)
+            bucket.courses_completed += int(completed)
+            bucket.course_progress[str(course_id)] = new_progress
+            bucket.save(update_fields=['updates', 'progress_gained', 'courses_completed', 'course_progress'])
+        return bucket
 
 class Mentorship(models.Model):
     mentor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mentorships_as_mentor')
@@ -118,11 +300,41 @@ class Mentorship(models.Model):
     def __str__(self):
         return f"{self.mentor.username} mentoring {self.learner.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = instance.__dict__.get('rating', 0)
+        instance._loaded_mentor_id = instance.__dict__.get('mentor_id')
+        instance._loaded_schedule = (instance.__dict__.get('scheduled_at'), instance.__dict__.get('status'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if (self.scheduled_at, self.status) != getattr(self, '_loaded_schedule', None):
+            from .reminders import schedule_reminders
+            schedule_reminders(self)
+            self._loaded_schedule = (self.scheduled_at, self.status)
+        old_rating = getattr(self, '_loaded_rating', 0)
+        old_mentor_id = getattr(self, '_loaded_mentor_id', self.mentor_id)
+        if old_mentor_id != self.mentor_id:
+            User(pk=old_mentor_id).record_mentor_rating(old_rating, 0)
+            self.mentor.record_mentor_rating(0, self.rating)
+        elif self.rating != old_rating:
+            self.mentor.record_mentor_rating(old_rating, self.rating)
+        self._loaded_rating = self.rating
+        self._loaded_mentor_id = self.mentor_id
+
+    def delete(self, *args, **kwargs):
+        self.mentor.record_mentor_rating(getattr(self, '_loaded_rating', self.rating), 0)
+        return super().delete(*args, **kwargs)
+
     def complete_session(self):
         self.completed_at = timezone.now()
         self.status = 'completed'
-        self.mentor.add_points(20)  # Award points for mentorship session
         self.save()
+        from .tasks import enqueue_on_commit, mentorship_completed
+        # Mentor points, notifications and badge checks run on a worker once the status change commits
+        enqueue_on_commit(mentorship_completed, self.pk, self.completed_at.isoformat())
 
 class StudyGroup(models.Model):
     name = models.CharField(max_length=200)
@@ -133,17 +345,44 @@ class StudyGroup(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_private = models.BooleanField(default=False)
     max_members = models.IntegerField(default=20)
+    members_count = models.IntegerField(default=0)
     meeting_link = models.URLField(blank=True)
 
     def __str__(self):
         return self.name
 
     def add_member(self, user):
-        if self.members.count() < self.max_members:
-            self.members.add(user)
+        """Add ``user`` unless the group is full; returns False only when it is. Joining twice changes nothing"""
+        # Counters follow the membership row this call actually inserted, and the seat is taken
+        # by a conditional UPDATE, so concurrent joins can neither double-count nor overfill
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    StudyGroup.members.through.objects.create(studygroup_id=self.pk, user_id=user.pk)
+            except IntegrityError:
+                return True
+            if not StudyGroup.objects.filter(pk=self.pk, members_count__lt=F('max_members')).update(
+                    members_count=F('members_count') + 1):
+                transaction.set_rollback(True)
+                return False
+            self.members_count += 1
+            GroupReadCursor.objects.get_or_create(
+                user=user, group=self,
+                defaults={'last_read_message_id': self.groupmessage_set.aggregate(m=models.Max('id'))['m'] or 0})
             user.add_points(5)  # Award points for joining group
-            return True
-        return False
+        return True
+
+    def remove_member(self, user):
+        """Remove ``user``; returns False, changing nothing, if they were not a member"""
+        with transaction.atomic():
+            deleted, _ = StudyGroup.members.through.objects.filter(studygroup_id=self.pk, user_id=user.pk).delete()
+            if not deleted:
+                return False
+            GroupReadCursor.objects.filter(user=user, group=self).delete()
+            StudyGroup.objects.filter(pk=self.pk).update(members_count=F('members_count') - 1)
+            self.members_count -= 1
+            user.add_points(-5)
+        return True
 
 class GroupMessage(models.Model):
     group = models.ForeignKey(StudyGroup, on_delete=models.CASCADE)
@@ -155,15 +394,97 @@ class GroupMessage(models.Model):
         ('file', 'File'),
         ('system', 'System')
     ], default='text')
-    file_url = models.URLField(blank=True)
+    file_url = models.URLField(max_length=500, blank=True)
     file_name = models.CharField(max_length=255, blank=True)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['group', 'id'], name='hub_groupmsg_group_id_idx'),
+            models.Index(fields=['created_at'], name='hub_groupmsg_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.message[:50]}"
 
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if created:
+                # One UPDATE bumps every other member's counter, so concurrent messages never lose increments
+                GroupReadCursor.objects.filter(group_id=self.group_id).exclude(user_id=self.sender_id).update(
+                    unread_count=F('unread_count') + 1)
+
+class FileUpload(models.Model):
+    """A resumable upload of a file attachment; becomes a 'file' GroupMessage once every byte has arrived"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='file_uploads')
+    group = models.ForeignKey(StudyGroup, on_delete=models.CASCADE, related_name='file_uploads')
+    file_name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    message = models.OneToOneField(GroupMessage, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.received}/{self.size} bytes)"
+
+class GroupMessageSegment(models.Model):
+    """Archived messages for one group and month, stored as zlib-compressed JSON rows"""
+    group = models.ForeignKey(StudyGroup, on_delete=models.CASCADE, related_name='message_segments')
+    month = models.DateField()  # first day of the month the messages were sent in
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    message_count = models.IntegerField()
+    raw_bytes = models.IntegerField()  # size of the uncompressed JSON
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['group', 'first_message_id']
+        indexes = [
+            models.Index(fields=['group', 'last_message_id'], name='hub_msgseg_group_last_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.group.name} {self.month:%Y-%m} ({self.message_count} messages)"
+
+class GroupReadCursor(models.Model):
+    """How far a member has read in a study group, with a maintained count of unread messages"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_read_cursors')
+    group = models.ForeignKey(StudyGroup, on_delete=models.CASCADE, related_name='read_cursors')
+    last_read_message_id = models.BigIntegerField(default=0)
+    unread_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'group')
+
+    def __str__(self):
+        return f"{self.user.username} in {self.group.name}: {self.unread_count} unread"
+
+    @classmethod
+    def mark_read(cls, user, group, message_id=None):
+        """Advance the cursor to message_id (default: latest) and recount what is still unread"""
+        with transaction.atomic():
+            cursor, _ = cls.objects.select_for_update().get_or_create(user=user, group=group)
+            if message_id is None:
+                message_id = group.groupmessage_set.aggregate(m=models.Max('id'))['m'] or 0
+            cursor.last_read_message_id = max(cursor.last_read_message_id, message_id)
+            cursor.unread_count = group.groupmessage_set.filter(
+                id__gt=cursor.last_read_message_id).exclude(sender=user).count()
+            cursor.save(update_fields=['last_read_message_id', 'unread_count', 'updated_at'])
+        return cursor
+
 class Portfolio(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
@@ -228,6 +549,41 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.user.username}: {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_is_read = instance.__dict__.get('is_read')
+        return instance
+
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        was_unread = not created and getattr(self, '_loaded_is_read', None) is False
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if was_unread != (not self.is_read):
+                delta = -1 if was_unread else 1
+                User.objects.filter(pk=self.user_id).update(unread_notifications=F('unread_notifications') + delta)
+        self._loaded_is_read = self.is_read
+        if created:
+            from .notifications import publish_notification
+            transaction.on_commit(lambda: publish_notification(self))
+            if self.notification_type in ('email', 'sms'):
+                self.queue_delivery()
+
+    def queue_delivery(self):
+        """Copy an email or SMS notification into the outbox; a worker sends it after commit"""
+        from .outbox import enqueue_email, enqueue_sms
+        user = User.objects.only('email', 'phone_number').get(pk=self.user_id)
+        if self.notification_type == 'email' and user.email:
+            enqueue_email(user.email, self.title, self.message)
+        elif self.notification_type == 'sms' and user.phone_number:
+            enqueue_sms(user.phone_number, f'{self.title}: {self.message}')
+
+    def delete(self, *args, **kwargs):
+        if getattr(self, '_loaded_is_read', self.is_read) is False:
+            User.objects.filter(pk=self.user_id).update(unread_notifications=F('unread_notifications') - 1)
+        return super().delete(*args, **kwargs)
+
 class Event(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -243,11 +599,252 @@ class Event(models.Model):
     attendees = models.ManyToManyField(User, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     max_attendees = models.IntegerField(default=100)
+    attendee_count = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return self.title
 
-    @property
-    def attendee_count(self):
-        return self.attendees.count()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_start_time = instance.__dict__.get('start_time')
+        instance._loaded_is_active = instance.__dict__.get('is_active')
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if (self.start_time != getattr(self, '_loaded_start_time', None)
+                or self.is_active != getattr(self, '_loaded_is_active', None)):
+            from .reminders import schedule_reminders
+            schedule_reminders(self)
+            self._loaded_start_time = self.start_time
+            self._loaded_is_active = self.is_active
+
+    def add_attendee(self, user):
+        """Add ``user`` unless the event is full; returns False only when it is. Attending twice changes nothing"""
+        # Same as StudyGroup.add_member: count only the row inserted here, take the seat conditionally
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    Event.attendees.through.objects.create(event_id=self.pk, user_id=user.pk)
+            except IntegrityError:
+                return True
+            if not Event.objects.filter(pk=self.pk, attendee_count__lt=F('max_attendees')).update(
+                    attendee_count=F('attendee_count') + 1):
+                transaction.set_rollback(True)
+                return False
+            self.attendee_count += 1
+        return True
+
+    def remove_attendee(self, user):
+        """Remove ``user``; returns False, changing nothing, if they were not attending"""
+        with transaction.atomic():
+            deleted, _ = Event.attendees.through.objects.filter(event_id=self.pk, user_id=user.pk).delete()
+            if not deleted:
+                return False
+            Event.objects.filter(pk=self.pk).update(attendee_count=F('attendee_count') - 1)
+            self.attendee_count -= 1
+        return True
+
+class LeaderboardScore(models.Model):
+    """Points earned by a user within one weekly or monthly leaderboard period"""
+    TIMEFRAME_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_scores')
+    timeframe = models.CharField(max_length=10, choices=TIMEFRAME_CHOICES)
+    period_start = models.DateField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('timeframe', 'period_start', 'user')
+        indexes = [
+            models.Index(fields=['timeframe', 'period_start', 'points', 'user'], name='hub_lbscore_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.timeframe} {self.period_start}: {self.points}"
+
+class AnalyticsSnapshot(models.Model):
+    """A precomputed analytics report, stored once per kind per day"""
+    kind = models.CharField(max_length=50)
+    day = models.DateField()
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('kind', 'day')
+
+    def __str__(self):
+        return f"{self.kind} {self.day}"
+
+class ReconcileCheckpoint(models.Model):
+    """Last primary key a reconcile pass finished, so an interrupted run can resume"""
+    name = models.CharField(max_length=50, unique=True)
+    last_pk = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_pk}"
+
+class ProcessedTask(models.Model):
+    """Idempotency key of a background task whose side effects have committed"""
+    key = models.CharField(max_length=200, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+class Announcement(models.Model):
+    """
+    A notification for everyone enrolled in a course, attending an event or in a study group.
+
+    'push' announcements are copied into one Notification per recipient by a
+    background task; 'pull' announcements stay a single row that each member's
+    feed picks up when read, for audiences too large to copy.
+    """
+    AUDIENCE_CHOICES = [
+        ('course', 'Course enrollees'),
+        ('event', 'Event attendees'),
+        ('group', 'Study group members'),
+    ]
+    MODE_CHOICES = [
+        ('push', 'Fan-out on write'),
+        ('pull', 'Fan-out on read'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='announcements')
+    audience_type = models.CharField(max_length=10, choices=AUDIENCE_CHOICES)
+    audience_id = models.IntegerField()
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    action_url = models.URLField(blank=True)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, default='push')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total_recipients = models.IntegerField(default=0)
+    delivered = models.IntegerField(default=0)
+    last_user_id = models.BigIntegerField(default=0)  # fan-out cursor, so a retried task resumes
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['audience_type', 'audience_id', 'mode'], name='hub_announce_audience_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.audience_type} {self.audience_id})"
+
+class AnnouncementRead(models.Model):
+    """Marks a pull-mode announcement as read by one user; rows exist only for readers"""
+    announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE, related_name='reads')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('announcement', 'user')
+
+class OutboxMessage(models.Model):
+    """An email or SMS written in the same transaction as the change that caused it and sent by a worker"""
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=200, blank=True)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['channel', 'status', 'next_attempt_at'], name='hub_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} to {self.recipient} ({self.status})"
+
+class Reminder(models.Model):
+    """A reminder for an upcoming event or mentorship session, due at a fixed time before it starts"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    event = models.ForeignKey('Event', on_delete=models.CASCADE, null=True, blank=True, related_name='reminders')
+    mentorship = models.ForeignKey(Mentorship, on_delete=models.CASCADE, null=True, blank=True, related_name='reminders')
+    minutes_before = models.IntegerField()
+    due_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    claim_token = models.UUIDField(null=True, blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['due_at']
+        indexes = [
+            models.Index(fields=['status', 'due_at'], name='hub_reminder_due_idx'),
+        ]
+
+    def __str__(self):
+        target = self.event or self.mentorship
+        return f"{target} - {self.minutes_before} min before ({self.status})"
+
+class BackgroundJob(models.Model):
+    """A long-running maintenance job, processed in chunks after a persisted cursor (see hub/jobs.py)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    name = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    cursor = models.BigIntegerField(default=0)  # last primary key a committed chunk processed
+    chunk_size = models.IntegerField(default=1000)
+    throttle = models.FloatField(default=0)  # seconds to pause between chunks
+    total = models.IntegerField(blank=True, null=True)  # estimated rows when the job was created
+    processed = models.IntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)  # counters summed over chunks
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'heartbeat_at'], name='hub_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,141 @@
+"""
+Live notification delivery over server-sent events.
+
+New and read notifications are published on a per-user topic; each SSE
+connection subscribes to its user's topic and forwards events as they arrive,
+so an open stream costs nothing until something happens. Under ASGI,
+``anotification_stream`` serves the same events without holding a thread.
+"""
+import json
+import time
+
+from django.db import connection
+from rest_framework.renderers import BaseRenderer
+
+from .dbpool import pooled
+from .models import Notification
+from .pubsub import get_broker, notifications_topic
+from .serializers import NotificationSerializer
+
+KEEPALIVE_SECONDS = 15
+MAX_STREAM_SECONDS = 300
+REPLAY_LIMIT = 100
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF views answer ``Accept: text/event-stream``; errors are sent as a JSON body"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+
+def publish_notification(notification):
+    publish_notifications([notification])
+
+
+def publish_notifications(notifications):
+    """Publish a batch of new notifications to their users' topics in one broker round trip"""
+    data = NotificationSerializer(notifications, many=True).data
+    get_broker().publish_many(
+        (notifications_topic(notification.user_id), {
+            'event': 'notification',
+            'id': notification.id,
+            'notification': serialized,
+            'unread_delta': 0 if notification.is_read else 1,
+        })
+        for notification, serialized in zip(notifications, data)
+    )
+
+
+def publish_read(notification_ids, user_id):
+    if notification_ids:
+        get_broker().publish(notifications_topic(user_id), {
+            'event': 'read',
+            'ids': list(notification_ids),
+            'unread_delta': -len(notification_ids),
+        })
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_start(user, last_event_id=None):
+    """The frames a stream opens with (retry interval, unread count, replayed notifications) and the last id sent"""
+    frames = ['retry: 3000\n\n', format_event('unread_count', {'unread_count': user.unread_notifications})]
+    sent_up_to = last_event_id or 0
+    if last_event_id is not None:
+        missed = Notification.objects.filter(user=user, id__gt=last_event_id).order_by('id')[:REPLAY_LIMIT]
+        for notification in missed:
+            sent_up_to = notification.id
+            frames.append(format_event('notification', {
+                'notification': NotificationSerializer(notification).data,
+                'unread_delta': 0,
+            }, event_id=notification.id))
+    return frames, sent_up_to
+
+
+def payload_frame(payload, sent_up_to):
+    """The frame for a published payload, or None for a notification already sent; and the new last id sent"""
+    if payload['event'] == 'notification':
+        if payload['id'] <= sent_up_to:
+            return None, sent_up_to
+        return format_event('notification', {
+            'notification': payload['notification'],
+            'unread_delta': payload['unread_delta'],
+        }, event_id=payload['id']), payload['id']
+    return format_event(payload['event'], {
+        key: value for key, value in payload.items() if key != 'event'
+    }), sent_up_to
+
+
+def notification_stream(user, last_event_id=None):
+    """
+    Yield SSE frames for ``user``.
+
+    Notifications newer than ``last_event_id`` are replayed first so a
+    reconnecting client misses nothing; after that only published events are
+    sent. The stream ends after MAX_STREAM_SECONDS and the browser reconnects
+    with its Last-Event-ID.
+    """
+    with get_broker().subscribe(notifications_topic(user.id)) as subscription:
+        frames, sent_up_to = stream_start(user, last_event_id)
+        yield from frames
+
+        # Nothing below touches the database, so don't hold a connection for the whole stream
+        connection.close()
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            payload = subscription.get(timeout=KEEPALIVE_SECONDS)
+            if payload is None:
+                yield ': keepalive\n\n'
+                continue
+            frame, sent_up_to = payload_frame(payload, sent_up_to)
+            if frame:
+                yield frame
+
+
+async def anotification_stream(user, last_event_id=None):
+    """``notification_stream`` for async views: an open stream holds no thread or database connection"""
+    async with get_broker().asubscribe(notifications_topic(user.id)) as subscription:
+        frames, sent_up_to = await pooled(stream_start)(user, last_event_id)
+        for frame in frames:
+            yield frame
+
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            payload = await subscription.aget(timeout=KEEPALIVE_SECONDS)
+            if payload is None:
+                yield ': keepalive\n\n'
+                continue
+            frame, sent_up_to = payload_frame(payload, sent_up_to)
+            if frame:
+                yield frame
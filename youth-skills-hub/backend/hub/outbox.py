@@ -0,0 +1,201 @@
+"""
+Transactional outbox for email and SMS.
+
+``enqueue_email``/``enqueue_sms`` only insert an OutboxMessage, inside the
+caller's transaction, so nothing is sent for a change that rolls back and no
+request waits on SendGrid or Twilio. ``drain`` claims due messages in
+batches and hands them to the channel's backend:
+
+* ``SendGridBackend`` sends every message with the same subject and body as
+  one API call with a personalization per recipient.
+* ``TwilioBackend`` has no batch API, so it sends messages in parallel.
+* ``ConsoleBackend`` and ``FileBackend`` stand in for both during development
+  and tests.
+
+Each backend runs at most CONCURRENCY calls at a time, and only one drain per
+channel runs at once across workers. Failed messages are retried with
+exponential backoff until MAX_ATTEMPTS, then marked failed.
+"""
+import json
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxMessage
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 3600
+CLAIM_LEASE = timedelta(minutes=10)  # a 'sending' row older than this belonged to a worker that died
+
+
+class Backend:
+    batch_size = 100
+    concurrency = 1
+
+    def __init__(self, batch_size=None, concurrency=None, **options):
+        self.batch_size = batch_size or self.batch_size
+        self.concurrency = concurrency or self.concurrency
+        self.options = options
+
+    def units(self, messages):
+        """Split a claimed batch into the groups sent by one provider call each"""
+        return [[message] for message in messages]
+
+    def send(self, unit):
+        """Send one unit; raise to mark every message in it as failed"""
+        raise NotImplementedError
+
+
+class SendGridBackend(Backend):
+    batch_size = 500
+    concurrency = 4
+    max_personalizations = 1000
+
+    def units(self, messages):
+        key = lambda message: (message.subject, message.body)
+        units = []
+        for _, same in groupby(sorted(messages, key=key), key=key):
+            same = list(same)
+            for start in range(0, len(same), self.max_personalizations):
+                units.append(same[start:start + self.max_personalizations])
+        return units
+
+    def send(self, unit):
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Personalization, To
+        mail = Mail(from_email=settings.DEFAULT_FROM_EMAIL, subject=unit[0].subject, plain_text_content=unit[0].body)
+        for message in unit:
+            personalization = Personalization()
+            personalization.add_to(To(message.recipient))
+            mail.add_personalization(personalization)
+        SendGridAPIClient(settings.SENDGRID_API_KEY).send(mail)
+
+
+class TwilioBackend(Backend):
+    batch_size = 100
+    concurrency = 5
+
+    def send(self, unit):
+        from twilio.rest import Client
+        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        for message in unit:
+            client.messages.create(to=message.recipient, from_=settings.TWILIO_PHONE_NUMBER, body=message.body)
+
+
+class ConsoleBackend(Backend):
+    def send(self, unit):
+        for message in unit:
+            sys.stdout.write(f'[{message.channel} to {message.recipient}] {message.subject}\n{message.body}\n\n')
+
+
+class FileBackend(Backend):
+    """Appends each message as a JSON line to ``settings.OUTBOX_FILE_PATH``"""
+
+    def send(self, unit):
+        with open(settings.OUTBOX_FILE_PATH, 'a') as f:
+            for message in unit:
+                f.write(json.dumps({
+                    'id': message.id, 'channel': message.channel, 'recipient': message.recipient,
+                    'subject': message.subject, 'body': message.body,
+                }) + '\n')
+
+
+def get_backend(channel):
+    config = dict(settings.OUTBOX_BACKENDS[channel])
+    backend_class = import_string(config.pop('BACKEND'))
+    return backend_class(
+        batch_size=config.pop('BATCH_SIZE', None),
+        concurrency=config.pop('CONCURRENCY', None),
+        **{key.lower(): value for key, value in config.items()},
+    )
+
+
+def enqueue_email(recipient, subject, body):
+    return _enqueue('email', recipient, body, subject)
+
+
+def enqueue_sms(recipient, body):
+    return _enqueue('sms', recipient, body)
+
+
+def _enqueue(channel, recipient, body, subject=''):
+    message = OutboxMessage.objects.create(channel=channel, recipient=recipient, subject=subject[:200], body=body)
+    from .tasks import drain_outbox, enqueue_on_commit
+    enqueue_on_commit(drain_outbox, channel)
+    return message
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch(channel, batch_size):
+    """Mark up to ``batch_size`` due messages as 'sending' for this worker and return them"""
+    now = timezone.now()
+    due = OutboxMessage.objects.filter(channel=channel, status='pending', next_attempt_at__lte=now)
+    abandoned = OutboxMessage.objects.filter(channel=channel, status='sending', claimed_at__lt=now - CLAIM_LEASE)
+    ids = list((due | abandoned).order_by('id').values_list('id', flat=True)[:batch_size])
+    with transaction.atomic():
+        # Re-check status in the UPDATE so a row another worker claimed in between is skipped
+        (OutboxMessage.objects.filter(id__in=ids, status='pending') | OutboxMessage.objects.filter(
+            id__in=ids, status='sending', claimed_at__lt=now - CLAIM_LEASE)).update(status='sending', claimed_at=now)
+    return list(OutboxMessage.objects.filter(id__in=ids, status='sending', claimed_at=now).order_by('id'))
+
+
+def _send_unit(backend, unit):
+    try:
+        backend.send(unit)
+        return None
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'[:1000]
+
+
+def drain(channel, max_batches=None):
+    """
+    Send due messages for ``channel`` until none are left (or ``max_batches``).
+
+    Returns (sent, retried, failed) counts, or None if another worker is
+    already draining this channel.
+    """
+    lock = f'outbox:drain:{channel}'
+    if not cache.add(lock, 1, timeout=int(CLAIM_LEASE.total_seconds())):
+        return None
+    backend = get_backend(channel)
+    sent = retried = failed = batches = 0
+    try:
+        with ThreadPoolExecutor(max_workers=backend.concurrency) as pool:
+            while max_batches is None or batches < max_batches:
+                messages = claim_batch(channel, backend.batch_size)
+                if not messages:
+                    break
+                batches += 1
+                units = backend.units(messages)
+                for unit, error in zip(units, pool.map(lambda unit: _send_unit(backend, unit), units)):
+                    if error is None:
+                        OutboxMessage.objects.filter(id__in=[m.id for m in unit]).update(
+                            status='sent', sent_at=timezone.now(), last_error='')
+                        sent += len(unit)
+                        continue
+                    for message in unit:
+                        attempts = message.attempts + 1
+                        if attempts >= MAX_ATTEMPTS:
+                            status, next_attempt_at = 'failed', message.next_attempt_at
+                            failed += 1
+                        else:
+                            status, next_attempt_at = 'pending', timezone.now() + backoff(attempts)
+                            retried += 1
+                        OutboxMessage.objects.filter(id=message.id).update(
+                            status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=error)
+    finally:
+        cache.delete(lock)
+    return sent, retried, failed
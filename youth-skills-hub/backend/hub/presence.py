@@ -0,0 +1,242 @@
+"""
+Who is online and typing in each study group.
+
+Chat connections send a heartbeat every few seconds; a user counts as online
+until their last heartbeat is older than PRESENCE_TTL. Nothing is written to
+the database and only users with a live connection are tracked, so the cost
+follows active users rather than group sizes.
+
+Connections are counted per user, so closing one of several tabs does not
+take the user offline; ``leave`` only drops them when their last connection
+closes. Expired users lose their count too, in case a worker died without
+calling ``leave``.
+
+Expired entries are removed in batched sweeps, at most once every
+SWEEP_INTERVAL seconds, instead of a timer per user:
+
+* ``MemoryPresence`` keeps a heap of expiry times in the current process
+  (tests, single worker).
+* ``RedisPresence`` keeps one sorted set per group scored by expiry time, so
+  every worker shares the same view.
+
+Pick one with ``settings.PRESENCE_BACKEND``.
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+PRESENCE_TTL = 30
+TYPING_TTL = 6
+SWEEP_INTERVAL = 5
+
+
+class MemoryPresence:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._online = defaultdict(dict)  # group_id -> {(user_id, username): expires_at}
+        self._typing = defaultdict(dict)
+        self._connections = defaultdict(dict)  # group_id -> {(user_id, username): open connections}
+        self._expiry = []  # heap of (expires_at, group_id, member); stale entries are skipped on sweep
+        self._next_sweep = 0
+
+    def heartbeat(self, group_id, user_id, username):
+        """Mark the user online; returns True if they were not online before"""
+        member = (user_id, username)
+        expires_at = time.time() + PRESENCE_TTL
+        with self._lock:
+            is_new = member not in self._online[group_id]
+            self._online[group_id][member] = expires_at
+            heapq.heappush(self._expiry, (expires_at, group_id, member))
+        return is_new
+
+    def connect(self, group_id, user_id, username):
+        """Count a new connection and mark the user online; returns True if they were not online before"""
+        member = (user_id, username)
+        with self._lock:
+            connections = self._connections[group_id]
+            connections[member] = connections.get(member, 0) + 1
+        return self.heartbeat(group_id, user_id, username)
+
+    def leave(self, group_id, user_id, username):
+        """Close one connection, dropping the user once none are left; returns True if they went offline"""
+        member = (user_id, username)
+        with self._lock:
+            connections = self._connections.get(group_id, {})
+            if connections.get(member, 0) > 1:
+                connections[member] -= 1
+                return False
+            connections.pop(member, None)
+            if not connections:
+                self._connections.pop(group_id, None)
+            self._typing.get(group_id, {}).pop(member, None)
+            was_online = self._online.get(group_id, {}).pop(member, None) is not None
+            if not self._online.get(group_id):
+                self._online.pop(group_id, None)
+        return was_online
+
+    def set_typing(self, group_id, user_id, username, typing=True):
+        member = (user_id, username)
+        with self._lock:
+            if typing:
+                self._typing[group_id][member] = time.time() + TYPING_TTL
+            else:
+                self._typing.get(group_id, {}).pop(member, None)
+
+    def online(self, group_id):
+        now = time.time()
+        with self._lock:
+            members = [member for member, expires_at in self._online.get(group_id, {}).items() if expires_at > now]
+        return _as_users(members)
+
+    def typing(self, group_id):
+        now = time.time()
+        with self._lock:
+            members = [member for member, expires_at in self._typing.get(group_id, {}).items() if expires_at > now]
+        return _as_users(members)
+
+    def sweep(self, force=False):
+        """Remove expired heartbeats; returns the ids of groups whose online list changed"""
+        now = time.time()
+        if not force and now < self._next_sweep:
+            return set()
+        changed = set()
+        with self._lock:
+            self._next_sweep = now + SWEEP_INTERVAL
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, group_id, member = heapq.heappop(self._expiry)
+                members = self._online.get(group_id)
+                # A later heartbeat pushed a newer entry for this member; this one is stale
+                if members is None or members.get(member) != expires_at:
+                    continue
+                del members[member]
+                self._typing.get(group_id, {}).pop(member, None)
+                self._connections.get(group_id, {}).pop(member, None)
+                if not members:
+                    del self._online[group_id]
+                changed.add(group_id)
+            for group_id in [group_id for group_id, members in self._typing.items() if not members]:
+                del self._typing[group_id]
+            for group_id in [group_id for group_id, members in self._connections.items() if not members]:
+                del self._connections[group_id]
+        return changed
+
+
+class RedisPresence:
+    """
+    Presence shared by every worker through Redis.
+
+    ``hub:presence:{group}`` and ``hub:typing:{group}`` are sorted sets of
+    ``"{user_id}|{username}"`` scored by expiry time; ``hub:presence:groups``
+    scores each group by its latest expiry so a sweep only visits groups that
+    still have someone in them. ``hub:connections:{group}`` is a hash of open
+    connections per member.
+    """
+    prefix = 'hub:presence:'
+
+    # KEYS: connections hash, presence set, typing set; ARGV: member
+    LEAVE_SCRIPT = """
+    if redis.call('HINCRBY', KEYS[1], ARGV[1], -1) > 0 then
+        return 0
+    end
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    return redis.call('ZREM', KEYS[2], ARGV[1])
+    """
+
+    # KEYS: presence set, connections hash; ARGV: now
+    SWEEP_SCRIPT = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+    if #expired > 0 then
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+        redis.call('HDEL', KEYS[2], unpack(expired))
+    end
+    return #expired
+    """
+
+    def __init__(self, url=None):
+        import redis
+        self.client = redis.Redis.from_url(url or getattr(settings, 'PRESENCE_REDIS_URL', settings.REDIS_URL))
+        self._leave = self.client.register_script(self.LEAVE_SCRIPT)
+        self._sweep = self.client.register_script(self.SWEEP_SCRIPT)
+        self._next_sweep = 0
+
+    def _key(self, group_id, kind='presence'):
+        return f'hub:{kind}:{group_id}'
+
+    def heartbeat(self, group_id, user_id, username):
+        expires_at = time.time() + PRESENCE_TTL
+        pipe = self.client.pipeline()
+        pipe.zadd(self._key(group_id), {_member(user_id, username): expires_at})
+        pipe.zadd(f'{self.prefix}groups', {group_id: expires_at}, gt=True)
+        is_new = pipe.execute()[0]
+        return bool(is_new)
+
+    def connect(self, group_id, user_id, username):
+        self.client.hincrby(self._key(group_id, 'connections'), _member(user_id, username), 1)
+        return self.heartbeat(group_id, user_id, username)
+
+    def leave(self, group_id, user_id, username):
+        keys = [self._key(group_id, 'connections'), self._key(group_id), self._key(group_id, 'typing')]
+        return bool(self._leave(keys=keys, args=[_member(user_id, username)]))
+
+    def set_typing(self, group_id, user_id, username, typing=True):
+        key = self._key(group_id, 'typing')
+        if typing:
+            pipe = self.client.pipeline()
+            pipe.zadd(key, {_member(user_id, username): time.time() + TYPING_TTL})
+            pipe.expire(key, TYPING_TTL)
+            pipe.execute()
+        else:
+            self.client.zrem(key, _member(user_id, username))
+
+    def online(self, group_id):
+        return _as_users(_parse(m) for m in self.client.zrangebyscore(self._key(group_id), time.time(), '+inf'))
+
+    def typing(self, group_id):
+        return _as_users(
+            _parse(m) for m in self.client.zrangebyscore(self._key(group_id, 'typing'), time.time(), '+inf'))
+
+    def sweep(self, force=False):
+        now = time.time()
+        if not force and now < self._next_sweep:
+            return set()
+        self._next_sweep = now + SWEEP_INTERVAL
+        group_ids = [int(g) for g in self.client.zrange(f'{self.prefix}groups', 0, -1)]
+        if not group_ids:
+            return set()
+        pipe = self.client.pipeline()
+        for group_id in group_ids:
+            self._sweep(keys=[self._key(group_id), self._key(group_id, 'connections')], args=[now], client=pipe)
+        pipe.zremrangebyscore(f'{self.prefix}groups', '-inf', now)
+        removed = pipe.execute()[:-1]
+        return {group_id for group_id, count in zip(group_ids, removed) if count}
+
+
+def _member(user_id, username):
+    return f'{user_id}|{username}'
+
+
+def _parse(member):
+    user_id, username = member.decode().split('|', 1)
+    return int(user_id), username
+
+
+def _as_users(members):
+    return [{'id': user_id, 'username': username} for user_id, username in sorted(members)]
+
+
+_presence = None
+_presence_lock = threading.Lock()
+
+
+def get_presence():
+    global _presence
+    if _presence is None:
+        with _presence_lock:
+            if _presence is None:
+                _presence = import_string(getattr(settings, 'PRESENCE_BACKEND', 'hub.presence.MemoryPresence'))()
+    return _presence
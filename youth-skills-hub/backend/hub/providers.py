@@ -0,0 +1,277 @@
+"""
+Free-course providers (Coursera, edX, Khan Academy, Udacity, FutureLearn).
+
+Every provider's course list is cached with two ages:
+
+* younger than FRESH seconds: served as is;
+* older than that but still in the cache: served straight away while a
+  background refresh replaces it (stale-while-revalidate);
+* missing: fetched before the response, all missing providers at once.
+
+Fetches run as coroutines on one background event loop, so providers are
+called concurrently and a request waits for the slowest provider's timeout at
+most, never for the sum of their latencies. A provider that keeps failing
+trips its circuit breaker and is skipped for RESET_TIMEOUT seconds instead of
+costing every request a timeout; its last cached list keeps being served.
+
+``StubProvider`` serves each provider's slice of ``data/free_courses.json``
+with optional latency and failures, so everything here runs offline.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from django.utils.text import slugify
+
+from .catalog import CATALOG_PATH, load_courses
+
+FRESH = 300
+STALE = 24 * 3600
+DEFAULT_TIMEOUT = 3.0
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 60
+
+
+class ProviderError(Exception):
+    pass
+
+
+class Provider:
+    timeout = DEFAULT_TIMEOUT
+
+    def __init__(self, name, timeout=None, **options):
+        self.name = name
+        self.timeout = timeout or self.timeout
+        self.options = options
+
+    async def fetch(self):
+        """Return the provider's courses as catalog records"""
+        raise NotImplementedError
+
+
+class StubProvider(Provider):
+    """This provider's courses from the bundled catalog file, after ``latency`` seconds"""
+
+    def __init__(self, name, latency=0, failure_rate=0, path=CATALOG_PATH, **options):
+        super().__init__(name, **options)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.path = path
+
+    async def fetch(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ProviderError(f'{self.name} stub failed')
+        return [course for course in load_courses(self.path) if course['provider'] == self.name]
+
+
+class JsonFeedProvider(Provider):
+    """GETs ``url``, which returns a list (or {'results': [...]}) of courses already in catalog shape"""
+
+    def __init__(self, name, url, **options):
+        super().__init__(name, **options)
+        self.url = url
+
+    async def fetch(self):
+        import aiohttp
+        async with aiohttp.ClientSession() as session:
+            async with session.get(self.url) as response:
+                if response.status != 200:
+                    raise ProviderError(f'{self.name} returned HTTP {response.status}')
+                data = await response.json()
+        courses = data['results'] if isinstance(data, dict) else data
+        return [{**course, 'provider': self.name} for course in courses]
+
+
+class CircuitBreaker:
+    """
+    Closed until ``failure_threshold`` consecutive failures, then open for
+    ``reset_timeout`` seconds. After that one trial call is let through
+    (half-open); success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = ''
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.opened_at = time.monotonic()  # hold others off while the trial call runs
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = f'{type(error).__name__}: {error}'[:200]
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def background_loop():
+    """The event loop provider fetches run on, started in a daemon thread on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='course-providers', daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+class ProviderAggregator:
+    def __init__(self, providers, fresh=FRESH, stale=STALE):
+        self.providers = providers
+        self.fresh = fresh
+        self.stale = stale
+        self.breakers = {provider.name: CircuitBreaker() for provider in providers}
+        self._inflight = {}
+        self._lock = threading.RLock()  # a future that is already done runs its callback inside _submit
+
+    def cache_key(self, provider):
+        return f'free-courses:provider:{slugify(provider.name)}'
+
+    def digest_key(self, provider):
+        return f'free-courses:digest:{slugify(provider.name)}'
+
+    async def fetch(self, provider):
+        """Fetch and cache one provider's courses; returns the cache entry, or None if it failed or was skipped"""
+        breaker = self.breakers[provider.name]
+        if not breaker.allow():
+            return None
+        try:
+            courses = await asyncio.wait_for(provider.fetch(), provider.timeout)
+        except Exception as e:
+            breaker.record_failure(e)
+            return None
+        breaker.record_success()
+        entry = {
+            'courses': courses,
+            'fetched_at': time.time(),
+            'digest': hashlib.sha1(json.dumps(courses, sort_keys=True).encode()).hexdigest()[:16],
+        }
+        # The digest goes under its own small key so checking the catalog version doesn't unpickle every course
+        await asyncio.to_thread(cache.set_many, {
+            self.cache_key(provider): entry,
+            self.digest_key(provider): {'digest': entry['digest'], 'fetched_at': entry['fetched_at']},
+        }, self.stale)
+        return entry
+
+    async def fetch_all(self):
+        """Refresh every provider concurrently, for async callers and cache warm-up"""
+        return dict(zip(
+            [provider.name for provider in self.providers],
+            await asyncio.gather(*(self.fetch(provider) for provider in self.providers)),
+        ))
+
+    def _submit(self, provider):
+        # One fetch per provider at a time, however many requests find it stale or missing
+        with self._lock:
+            future = self._inflight.get(provider.name)
+            if future is None:
+                future = asyncio.run_coroutine_threadsafe(self.fetch(provider), background_loop())
+                self._inflight[provider.name] = future
+                future.add_done_callback(lambda _: self._release(provider.name))
+            return future
+
+    def _release(self, name):
+        with self._lock:
+            self._inflight.pop(name, None)
+
+    def _split(self, cached, key):
+        """Split cached entries into usable ones and fetches for the missing; stale ones start refreshing"""
+        entries, missing = {}, {}
+        now = time.time()
+        for provider in self.providers:
+            entry = cached.get(key(provider))
+            if entry is None:
+                missing[provider.name] = self._submit(provider)
+                continue
+            entries[provider.name] = entry
+            if now - entry['fetched_at'] > self.fresh:
+                self._submit(provider)
+        return entries, missing
+
+    def _merge(self, entries, missing):
+        for name, future in missing.items():
+            entry = future.result() if future.done() and not future.exception() else None
+            if entry is not None:
+                entries[name] = entry
+        return entries
+
+    def _max_timeout(self):
+        return max(provider.timeout for provider in self.providers)
+
+    def collect(self, digests=False):
+        """
+        Cache entries by provider name for every provider that has courses.
+
+        Stale entries are returned as they are and refreshed in the background;
+        missing ones are fetched concurrently, waiting at most the longest
+        provider timeout. Providers that still have nothing are left out.
+        With ``digests`` only each entry's digest and fetch time are read.
+        """
+        key = self.digest_key if digests else self.cache_key
+        entries, missing = self._split(cache.get_many([key(provider) for provider in self.providers]), key)
+        if missing:
+            wait(missing.values(), timeout=self._max_timeout())
+        return self._merge(entries, missing)
+
+    async def acollect(self, digests=False):
+        """``collect`` for async views: waiting for missing providers suspends the caller instead of a thread"""
+        key = self.digest_key if digests else self.cache_key
+        entries, missing = self._split(await cache.aget_many([key(provider) for provider in self.providers]), key)
+        if missing:
+            await asyncio.wait([asyncio.wrap_future(future) for future in missing.values()],
+                               timeout=self._max_timeout())
+        return self._merge(entries, missing)
+
+
+_aggregator = None
+
+
+def get_aggregator():
+    """The process-wide aggregator for ``settings.FREE_COURSE_PROVIDERS``"""
+    global _aggregator
+    if _aggregator is None:
+        providers = []
+        for name, config in getattr(settings, 'FREE_COURSE_PROVIDERS', {}).items():
+            config = dict(config)
+            provider_class = import_string(config.pop('BACKEND', 'hub.providers.StubProvider'))
+            providers.append(provider_class(name, **{key.lower(): value for key, value in config.items()}))
+        _aggregator = ProviderAggregator(
+            providers,
+            fresh=getattr(settings, 'FREE_COURSE_CACHE_FRESH', FRESH),
+            stale=getattr(settings, 'FREE_COURSE_CACHE_STALE', STALE),
+        )
+    return _aggregator
@@ -0,0 +1,334 @@
+"""
+Publish/subscribe fan-out for long-polling, event streams and live counters.
+
+Every worker process keeps its own subscriber queues; a broker backend only
+decides how published messages reach the other processes:
+
+* ``LocalBroker`` delivers inside the current process (tests, single worker).
+* ``RedisBroker`` relays through Redis pub/sub for multi-host deployments.
+* ``UnixSocketBroker`` relays over Unix datagram sockets between workers on
+  one host, without any extra service.
+
+Pick one with ``settings.PUBSUB_BACKEND``. Payloads must be JSON-serializable
+so they can cross processes. Each broker records publish-to-deliver latency in
+``broker.metrics``.
+
+Async views subscribe with ``broker.asubscribe(topic)``: waiting for the next
+payload then suspends the coroutine on its event loop instead of blocking a
+thread.
+"""
+import asyncio
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+
+class Subscription:
+    def __init__(self, broker, topic):
+        self.broker = broker
+        self.topic = topic
+        self.queue = queue.Queue()
+
+    def get(self, timeout=None):
+        """Block until the next payload arrives, or return None after ``timeout`` seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _LoopQueue:
+    """The queue of an AsyncSubscription: brokers put payloads from any thread, the loop's coroutines get them"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.payloads = asyncio.Queue()
+
+    def put(self, payload):
+        try:
+            self.loop.call_soon_threadsafe(self.payloads.put_nowait, payload)
+        except RuntimeError:
+            pass  # the loop has closed; nobody is waiting any more
+
+
+class AsyncSubscription(Subscription):
+    def __init__(self, broker, topic):
+        self.broker = broker
+        self.topic = topic
+        self.queue = _LoopQueue(asyncio.get_running_loop())
+
+    def get(self, timeout=None):
+        raise TypeError('Await aget() on an AsyncSubscription')
+
+    async def aget(self, timeout=None):
+        """Wait for the next payload, or return None after ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.payloads.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class LatencyMetrics:
+    """Counts published/delivered/dropped messages and a histogram of publish-to-deliver latency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.published = 0
+            self.delivered = 0
+            self.dropped = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+            self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record_publish(self, count):
+        with self._lock:
+            self.published += count
+
+    def record_drop(self, count):
+        with self._lock:
+            self.dropped += count
+
+    def record_delivery(self, published_at, count):
+        latency_ms = max((time.time() - published_at) * 1000, 0.0)
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= bound), len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            self.delivered += count
+            self.total_ms += latency_ms * count
+            self.max_ms = max(self.max_ms, latency_ms)
+            self.buckets[bucket] += count
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+            return {
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'avg_latency_ms': round(self.total_ms / self.delivered, 3) if self.delivered else 0.0,
+                'max_latency_ms': round(self.max_ms, 3),
+                'latency_histogram': dict(zip(labels, self.buckets)),
+            }
+
+
+class LocalBroker:
+    """In-process broker; also the base class that manages local subscriber queues"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self.metrics = LatencyMetrics()
+
+    def subscribe(self, topic):
+        return self._add(Subscription(self, topic))
+
+    def asubscribe(self, topic):
+        """A subscription for the running event loop; use it as ``async with``"""
+        return self._add(AsyncSubscription(self, topic))
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.topic]
+
+    def publish(self, topic, payload):
+        self.publish_many([(topic, payload)])
+
+    def publish_many(self, messages):
+        """Publish an iterable of (topic, payload) pairs in one round trip where the backend allows"""
+        envelopes = [{'topic': topic, 'payload': payload, 'published_at': time.time()} for topic, payload in messages]
+        if envelopes:
+            self.metrics.record_publish(len(envelopes))
+            self._send(envelopes)
+
+    def _send(self, envelopes):
+        self._deliver(envelopes)
+
+    def _deliver(self, envelopes):
+        for envelope in envelopes:
+            with self._lock:
+                subscribers = list(self._subscriptions.get(envelope['topic'], ()))
+            for subscription in subscribers:
+                subscription.queue.put(envelope['payload'])
+            if subscribers:
+                self.metrics.record_delivery(envelope['published_at'], len(subscribers))
+
+
+class RedisBroker(LocalBroker):
+    """
+    Relays messages through a Redis channel so every worker sees them.
+
+    Each process holds one pattern subscription and a listener thread that
+    hands messages to local subscribers, so workers never open a Redis
+    connection per waiting request.
+    """
+    channel_prefix = 'hub:pubsub:'
+
+    def __init__(self, url=None):
+        super().__init__()
+        import redis
+        self.client = redis.Redis.from_url(url or getattr(settings, 'PUBSUB_REDIS_URL', settings.REDIS_URL))
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(f'{self.channel_prefix}*')
+        self._listener = threading.Thread(target=self._listen, name='pubsub-redis', daemon=True)
+        self._listener.start()
+
+    def _send(self, envelopes):
+        pipe = self.client.pipeline(transaction=False)
+        for envelope in envelopes:
+            pipe.publish(f"{self.channel_prefix}{envelope['topic']}", json.dumps(envelope))
+        pipe.execute()
+
+    def _listen(self):
+        while True:
+            try:
+                message = self._pubsub.get_message(timeout=1.0)
+            except Exception:
+                time.sleep(1)
+                continue
+            if message and message['type'] == 'pmessage':
+                self._deliver([json.loads(message['data'])])
+
+
+class UnixSocketBroker(LocalBroker):
+    """
+    Relays messages between worker processes on one host over Unix datagram sockets.
+
+    Each process binds a socket in ``settings.PUBSUB_SOCKET_DIR``; a publish
+    sends one datagram per batch to every socket in that directory. Sockets
+    left behind by dead workers are removed on the first failed send.
+
+    Delivery is best effort, like Redis pub/sub: sends never block, so a
+    worker whose queue is full misses those datagrams instead of stalling
+    every publisher, and an envelope too big for one datagram is not sent.
+    Both count as ``dropped`` in the metrics.
+    """
+    max_datagram_bytes = 60000
+
+    def __init__(self, directory=None):
+        super().__init__()
+        self.directory = directory or getattr(settings, 'PUBSUB_SOCKET_DIR', '/tmp/hub-pubsub')
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._listener = threading.Thread(target=self._listen, name='pubsub-unix', daemon=True)
+        self._listener.start()
+
+    def _batches(self, envelopes):
+        """(datagram, envelope count) pairs, each datagram a JSON list of at most max_datagram_bytes"""
+        batch, size = [], 2
+        for envelope in envelopes:
+            encoded = json.dumps(envelope)
+            if len(encoded) + 2 > self.max_datagram_bytes:
+                self.metrics.record_drop(1)
+                continue
+            if batch and size + len(encoded) + 1 > self.max_datagram_bytes:
+                yield ('[' + ','.join(batch) + ']').encode(), len(batch)
+                batch, size = [], 2
+            batch.append(encoded)
+            size += len(encoded) + 1
+        if batch:
+            yield ('[' + ','.join(batch) + ']').encode(), len(batch)
+
+    def _send(self, envelopes):
+        datagrams = list(self._batches(envelopes))
+        for name in os.listdir(self.directory):
+            if not name.endswith('.sock'):
+                continue
+            path = os.path.join(self.directory, name)
+            for sent, (datagram, count) in enumerate(datagrams):
+                try:
+                    self._sender.sendto(datagram, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    if path != self.path:
+                        try:
+                            os.unlink(path)
+                        except FileNotFoundError:
+                            pass
+                    break
+                except OSError:
+                    # The receiver's queue is full (or the send failed); drop the rest for this worker
+                    self.metrics.record_drop(sum(count for _, count in datagrams[sent:]))
+                    break
+
+    def _listen(self):
+        while True:
+            try:
+                datagram = self._receiver.recv(self.max_datagram_bytes + 1024)
+            except OSError:
+                if self._receiver.fileno() == -1:
+                    return  # closed
+                time.sleep(1)
+                continue
+            try:
+                envelopes = json.loads(datagram)
+                self._deliver(envelopes)
+            except Exception:
+                self.metrics.record_drop(1)
+
+    def close(self):
+        self._receiver.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'PUBSUB_BACKEND', 'hub.pubsub.LocalBroker'))()
+    return _broker
+
+
+def group_messages_topic(group_id):
+    return f'group_messages.{group_id}'
+
+
+def notifications_topic(user_id):
+    return f'notifications.{user_id}'
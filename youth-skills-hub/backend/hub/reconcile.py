@@ -0,0 +1,241 @@
+"""
+Reconcilers for denormalized counters and aggregates.
+
+Each reconciler walks its table in primary-key order, recomputes the derived
+fields for one chunk with set-based aggregate queries and ``bulk_update``s the
+rows that drifted. Chunks commit independently, so a run never holds long
+locks and can resume from the last checkpoint.
+
+Reconcilers with ``default = False`` only run when named explicitly.
+"""
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import (
+    Course, Enrollment, Event, GroupMessage, GroupReadCursor, Mentorship, Notification, ReconcileCheckpoint,
+    StudyGroup, User,
+)
+
+COMPLETION_POINTS = 10
+MENTOR_SESSION_POINTS = 20
+GROUP_JOIN_POINTS = 5
+
+
+def average(total, count):
+    if not count:
+        return Decimal('0')
+    return (Decimal(total) / count).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+
+
+def count_by(queryset, key, pks):
+    return dict(
+        queryset.filter(**{f'{key}__in': pks}).order_by().values(key)
+        .annotate(n=Count('pk')).values_list(key, 'n')
+    )
+
+
+def rating_totals(source, key, pks):
+    return {
+        row[key]: (row['total'] or 0, row['count'])
+        for row in source.objects.filter(**{f'{key}__in': pks, 'rating__gt': 0}).order_by()
+        .values(key).annotate(total=Sum('rating'), count=Count('pk'))
+    }
+
+
+class Reconciler:
+    """Base class: subclasses name a model, its derived fields and how to compute them"""
+    name = None
+    model = None
+    fields = ()
+    default = True  # run when no targets are named
+
+    def queryset(self):
+        return self.model.objects.all()
+
+    def expected(self, pks):
+        """Return {pk: {field: value}} for the given primary keys"""
+        raise NotImplementedError
+
+    def run(self, chunk_size=1000, dry_run=False, throttle=0, start_after=0, on_chunk=None):
+        """Reconcile every row after ``start_after``; returns (rows checked, rows fixed, last pk)"""
+        checked = fixed = 0
+        last_pk = start_after
+        rows = (
+            self.queryset().filter(pk__gt=start_after).order_by('pk')
+            .only('pk', *self.fields).iterator(chunk_size=chunk_size)
+        )
+        chunk = []
+        for obj in rows:
+            chunk.append(obj)
+            if len(chunk) >= chunk_size:
+                fixed += self._reconcile_chunk(chunk, dry_run)
+                checked += len(chunk)
+                last_pk = chunk[-1].pk
+                chunk = []
+                if on_chunk:
+                    on_chunk(self, checked, fixed, last_pk)
+                if throttle:
+                    time.sleep(throttle)
+        if chunk:
+            fixed += self._reconcile_chunk(chunk, dry_run)
+            checked += len(chunk)
+            last_pk = chunk[-1].pk
+            if on_chunk:
+                on_chunk(self, checked, fixed, last_pk)
+        return checked, fixed, last_pk
+
+    def _reconcile_chunk(self, chunk, dry_run):
+        expected = self.expected([obj.pk for obj in chunk])
+        stale = []
+        for obj in chunk:
+            values = expected[obj.pk]
+            if any(getattr(obj, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(obj, field, value)
+                stale.append(obj)
+        if stale and not dry_run:
+            self.model.objects.bulk_update(stale, self.fields)
+        return len(stale)
+
+
+class UserPointsReconciler(Reconciler):
+    """
+    Recompute points from the formula: completions, mentor sessions and group memberships.
+
+    Points from any other source (seed data, admin edits, past memberships)
+    are overwritten, so this only runs when asked for by name.
+    """
+    name = 'points'
+    model = User
+    fields = ('points',)
+    default = False
+
+    def expected(self, pks):
+        completions = count_by(Enrollment.objects.filter(completed=True), 'user_id', pks)
+        sessions = count_by(Mentorship.objects.filter(status='completed'), 'mentor_id', pks)
+        memberships = count_by(StudyGroup.members.through.objects, 'user_id', pks)
+        return {
+            pk: {'points': completions.get(pk, 0) * COMPLETION_POINTS
+                 + sessions.get(pk, 0) * MENTOR_SESSION_POINTS
+                 + memberships.get(pk, 0) * GROUP_JOIN_POINTS}
+            for pk in pks
+        }
+
+
+class EnrolledCountReconciler(Reconciler):
+    name = 'enrolled_count'
+    model = Course
+    fields = ('enrolled_count',)
+
+    def expected(self, pks):
+        counts = count_by(Enrollment.objects, 'course_id', pks)
+        return {pk: {'enrolled_count': counts.get(pk, 0)} for pk in pks}
+
+
+class CourseRatingReconciler(Reconciler):
+    name = 'course_rating'
+    model = Course
+    fields = ('rating_sum', 'rating_count', 'rating')
+
+    def expected(self, pks):
+        totals = rating_totals(Enrollment, 'course_id', pks)
+        result = {}
+        for pk in pks:
+            total, count = totals.get(pk, (0, 0))
+            result[pk] = {'rating_sum': total, 'rating_count': count, 'rating': average(total, count)}
+        return result
+
+
+class MentorRatingReconciler(Reconciler):
+    name = 'mentor_rating'
+    model = User
+    fields = ('mentor_rating_sum', 'mentor_rating_count', 'mentor_rating')
+
+    def queryset(self):
+        return User.objects.filter(Q(role='mentor') | Q(mentor_rating_count__gt=0))
+
+    def expected(self, pks):
+        totals = rating_totals(Mentorship, 'mentor_id', pks)
+        result = {}
+        for pk in pks:
+            total, count = totals.get(pk, (0, 0))
+            result[pk] = {
+                'mentor_rating_sum': total, 'mentor_rating_count': count, 'mentor_rating': average(total, count)}
+        return result
+
+
+class GroupMembersReconciler(Reconciler):
+    name = 'group_members'
+    model = StudyGroup
+    fields = ('members_count',)
+
+    def expected(self, pks):
+        counts = count_by(StudyGroup.members.through.objects, 'studygroup_id', pks)
+        return {pk: {'members_count': counts.get(pk, 0)} for pk in pks}
+
+
+class EventAttendeesReconciler(Reconciler):
+    name = 'event_attendees'
+    model = Event
+    fields = ('attendee_count',)
+
+    def expected(self, pks):
+        counts = count_by(Event.attendees.through.objects, 'event_id', pks)
+        return {pk: {'attendee_count': counts.get(pk, 0)} for pk in pks}
+
+
+class UnreadNotificationsReconciler(Reconciler):
+    name = 'unread_notifications'
+    model = User
+    fields = ('unread_notifications',)
+
+    def expected(self, pks):
+        counts = count_by(Notification.objects.filter(is_read=False), 'user_id', pks)
+        return {pk: {'unread_notifications': counts.get(pk, 0)} for pk in pks}
+
+
+class GroupUnreadReconciler(Reconciler):
+    name = 'group_unread'
+    model = GroupReadCursor
+    fields = ('unread_count',)
+
+    def expected(self, pks):
+        unread = GroupMessage.objects.filter(
+            group_id=OuterRef('group_id'), id__gt=OuterRef('last_read_message_id'),
+        ).exclude(sender_id=OuterRef('user_id')).order_by().values('group_id').annotate(n=Count('pk')).values('n')
+        counts = GroupReadCursor.objects.filter(pk__in=pks).annotate(
+            expected=Coalesce(Subquery(unread), 0)).values_list('pk', 'expected')
+        return {pk: {'unread_count': count} for pk, count in counts}
+
+
+RECONCILERS = {
+    reconciler.name: reconciler
+    for reconciler in (
+        UserPointsReconciler(),
+        EnrolledCountReconciler(),
+        CourseRatingReconciler(),
+        MentorRatingReconciler(),
+        GroupMembersReconciler(),
+        EventAttendeesReconciler(),
+        UnreadNotificationsReconciler(),
+        GroupUnreadReconciler(),
+    )
+}
+
+
+DEFAULT_TARGETS = [name for name, reconciler in RECONCILERS.items() if reconciler.default]
+
+
+def save_checkpoint(reconciler, checked, fixed, last_pk):
+    ReconcileCheckpoint.objects.update_or_create(name=reconciler.name, defaults={'last_pk': last_pk})
+
+
+def load_checkpoint(name):
+    return ReconcileCheckpoint.objects.filter(name=name).values_list('last_pk', flat=True).first() or 0
+
+
+def clear_checkpoint(name):
+    ReconcileCheckpoint.objects.filter(name=name).delete()
@@ -0,0 +1,136 @@
+"""
+Reminders for upcoming events and mentorship sessions.
+
+Saving an Event or Mentorship with a start time writes one Reminder row per
+offset in ``settings.REMINDER_OFFSETS_MINUTES``. A periodic tick reads only
+rows that are due, through the (status, due_at) index, so its work follows
+the number of due reminders rather than the number of events.
+
+Due rows are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the
+database supports it, so concurrent ticks take disjoint batches. SQLite has
+no row locks; there a conditional UPDATE stamps a claim token on rows that
+are still pending, which is atomic because SQLite serializes writers.
+Event reminders go out through the announcement fan-out to all attendees;
+mentorship reminders notify the mentor and the learner. A reminder whose
+event or session has been called off, or has already started (say the tick
+was down for a while), is cancelled instead of sent.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Event, Mentorship, Notification, Reminder
+
+BATCH_SIZE = 200
+
+
+def reminder_offsets():
+    return getattr(settings, 'REMINDER_OFFSETS_MINUTES', [24 * 60, 60])
+
+
+def schedule_reminders(target):
+    """Replace the pending reminders of an Event or Mentorship to match its current start time"""
+    if isinstance(target, Event):
+        lookup, starts_at, active = {'event': target}, target.start_time, target.is_active
+    else:
+        lookup = {'mentorship': target}
+        starts_at, active = target.scheduled_at, target.status in ('pending', 'active')
+    now = timezone.now()
+    with transaction.atomic():
+        Reminder.objects.filter(status='pending', **lookup).delete()
+        if not active or not starts_at or starts_at <= now:
+            return []
+        return Reminder.objects.bulk_create([
+            Reminder(minutes_before=minutes, due_at=starts_at - timedelta(minutes=minutes), **lookup)
+            for minutes in reminder_offsets()
+            if starts_at - timedelta(minutes=minutes) > now
+        ])
+
+
+def _claim(batch_size, now):
+    due = Reminder.objects.filter(status='pending', due_at__lte=now).order_by('due_at')
+    if connection.features.has_select_for_update_skip_locked:
+        return list(due.select_for_update(skip_locked=True, of=('self',))
+                    .select_related('event', 'mentorship__mentor', 'mentorship__learner')[:batch_size])
+    token = uuid.uuid4()
+    ids = list(due.values_list('id', flat=True)[:batch_size])
+    Reminder.objects.filter(id__in=ids, status='pending', claim_token__isnull=True).update(claim_token=token)
+    return list(Reminder.objects.filter(claim_token=token).select_related(
+        'event', 'mentorship__mentor', 'mentorship__learner'))
+
+
+def _when(minutes):
+    if minutes % (24 * 60) == 0:
+        days = minutes // (24 * 60)
+        return f"{days} day{'s' if days != 1 else ''}"
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    return f'{minutes} minutes'
+
+
+def _still_upcoming(reminder, now):
+    """Whether the reminder's event or session is still on and has not started by ``now``"""
+    if reminder.event_id:
+        event = reminder.event
+        return event is not None and event.is_active and event.start_time > now
+    mentorship = reminder.mentorship
+    return (mentorship is not None and mentorship.status in ('pending', 'active')
+            and mentorship.scheduled_at is not None and mentorship.scheduled_at > now)
+
+
+def _send(reminder):
+    from .fanout import create_announcement
+    if reminder.event_id:
+        event = reminder.event
+        if not event.attendee_count:
+            return
+        create_announcement(
+            None, event, 'event', f'Starting in {_when(reminder.minutes_before)}: {event.title}',
+            f"{event.title} starts at {timezone.localtime(event.start_time):%H:%M on %d %b}.",
+            event.external_url)
+        return
+    mentorship = reminder.mentorship
+    when = timezone.localtime(mentorship.scheduled_at)
+    for user, other in ((mentorship.mentor, mentorship.learner), (mentorship.learner, mentorship.mentor)):
+        Notification.objects.create(
+            user=user,
+            title=f'Mentorship session in {_when(reminder.minutes_before)}',
+            message=f'Your session with {other.username} starts at {when:%H:%M on %d %b}.',
+            action_url=mentorship.meeting_link,
+        )
+
+
+def dispatch_due_reminders(batch_size=BATCH_SIZE, now=None):
+    """Send every reminder due by ``now``, one claimed batch per transaction; returns how many were sent"""
+    now = now or timezone.now()
+    sent = 0
+    while True:
+        with transaction.atomic():
+            batch = _claim(batch_size, now)
+            if not batch:
+                return sent
+            for reminder in batch:
+                if not _still_upcoming(reminder, now):
+                    reminder.status = 'cancelled'
+                else:
+                    _send(reminder)
+                    reminder.status = 'sent'
+                    reminder.sent_at = now
+                    sent += 1
+            Reminder.objects.bulk_update(batch, ['status', 'sent_at'])
+
+
+def backfill_reminders():
+    """Schedule reminders for events and sessions created before reminders existed"""
+    now = timezone.now()
+    count = 0
+    for event in Event.objects.filter(is_active=True, start_time__gt=now).iterator():
+        count += len(schedule_reminders(event))
+    for mentorship in Mentorship.objects.filter(
+            status__in=['pending', 'active'], scheduled_at__gt=now).iterator():
+        count += len(schedule_reminders(mentorship))
+    return count
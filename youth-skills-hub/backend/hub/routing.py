@@ -0,0 +1,7 @@
+from django.urls import re_path
+
+from .consumers import StudyGroupChatConsumer
+
+websocket_urlpatterns = [
+    re_path(r'^ws/study-groups/(?P<group_id>\d+)/$', StudyGroupChatConsumer.as_asgi()),
+]
@@ -0,0 +1,114 @@
+"""
+Full-text search over study-group messages.
+
+SQLite uses the ``hub_groupmessage_fts`` FTS5 table and PostgreSQL a GIN
+index on ``to_tsvector('english', message)``; both are created in migration
+0013 and kept current by the database itself (triggers on SQLite, the
+expression index on PostgreSQL), so every insert, edit and delete - including
+bulk deletes and archiving - updates the index. Archived messages are not
+searchable.
+"""
+import re
+
+from django.db import connection
+
+from .models import GroupMessage
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+SNIPPET_TOKENS = 12
+MAX_TERMS = 10
+
+
+def fts5_query(text, group_id):
+    """Quote each word so user input can't inject FTS5 syntax; the last word also matches as a prefix"""
+    terms = TERM_RE.findall(text)[:MAX_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return f'group_id:"{group_id}" AND ({" ".join(quoted)})'
+
+
+class MessageSearchResults:
+    """
+    Lazily evaluated, ranked matches for ``query`` in one group.
+
+    Supports ``count()`` and slicing, so it can be handed straight to a
+    Django or DRF paginator: each page runs one ranked query with LIMIT/OFFSET.
+    Sliced results are GroupMessage instances with ``rank`` and ``snippet`` set.
+    """
+
+    def __init__(self, group_id, query):
+        self.group_id = group_id
+        self.query = query
+        self.postgres = connection.vendor == 'postgresql'
+        self._count = None
+
+    def _match(self):
+        if self.postgres:
+            return self.query
+        return fts5_query(self.query, self.group_id)
+
+    def count(self):
+        if self._count is None:
+            match = self._match()
+            if not match:
+                self._count = 0
+            elif self.postgres:
+                self._count = _scalar(
+                    "SELECT COUNT(*) FROM hub_groupmessage "
+                    "WHERE group_id = %s AND to_tsvector('english', message) @@ websearch_to_tsquery('english', %s)",
+                    [self.group_id, match])
+            else:
+                self._count = _scalar(
+                    'SELECT COUNT(*) FROM hub_groupmessage_fts WHERE hub_groupmessage_fts MATCH %s', [match])
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        offset = index.start or 0
+        limit = (index.stop - offset) if index.stop is not None else self.count() - offset
+        match = self._match()
+        if not match or limit <= 0:
+            return []
+        if self.postgres:
+            sql = (
+                "SELECT m.id, ts_rank(to_tsvector('english', m.message), q) AS rank, "
+                "ts_headline('english', m.message, q, %s) "
+                "FROM hub_groupmessage m, websearch_to_tsquery('english', %s) q "
+                "WHERE m.group_id = %s AND to_tsvector('english', m.message) @@ q "
+                "ORDER BY rank DESC, m.id DESC LIMIT %s OFFSET %s"
+            )
+            options = f'StartSel=<mark>, StopSel=</mark>, MaxWords={SNIPPET_TOKENS}, MinWords=5'
+            params = [options, match, self.group_id, limit, offset]
+        else:
+            # bm25 is lower-is-better; the group_id column only scopes the match and carries no weight
+            sql = (
+                "SELECT rowid, -bm25(hub_groupmessage_fts, 1.0, 0.0) AS rank, "
+                "snippet(hub_groupmessage_fts, 0, '<mark>', '</mark>', '...', %s) "
+                "FROM hub_groupmessage_fts WHERE hub_groupmessage_fts MATCH %s "
+                "ORDER BY bm25(hub_groupmessage_fts, 1.0, 0.0), rowid DESC LIMIT %s OFFSET %s"
+            )
+            params = [SNIPPET_TOKENS, match, limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            hits = cursor.fetchall()
+        messages = GroupMessage.objects.select_related('sender').in_bulk([hit[0] for hit in hits])
+        results = []
+        for message_id, rank, snippet in hits:
+            message = messages.get(message_id)
+            if message is not None:
+                message.rank = float(rank)
+                message.snippet = snippet
+                results.append(message)
+        return results
+
+
+def _scalar(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()[0]
@@ -1,14 +1,15 @@
 from rest_framework import serializers
-from .models import User, Course, Enrollment, Mentorship, StudyGroup, Portfolio, Badge, UserBadge, Notification, Event, GroupMessage
+from .models import User, Course, Enrollment, Mentorship, StudyGroup, Portfolio, Badge, UserBadge, Notification, Event, GroupMessage, ProgressDay, FileUpload, Announcement, BackgroundJob
 
 class UserSerializer(serializers.ModelSerializer):
     badges = serializers.SerializerMethodField()
     enrolled_courses_count = serializers.SerializerMethodField()
+    current_streak = serializers.IntegerField(source='active_streak', read_only=True)
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'bio', 'location', 'skills', 'interests', 'phone_number', 'avatar', 'points', 'is_verified', 'preferred_language', 'two_factor_enabled', 'badges', 'enrolled_courses_count']
-        read_only_fields = ['id', 'points']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'bio', 'location', 'skills', 'interests', 'phone_number', 'avatar', 'points', 'is_verified', 'preferred_language', 'two_factor_enabled', 'mentor_rating', 'mentor_rating_count', 'current_streak', 'longest_streak', 'badges', 'enrolled_courses_count']
+        read_only_fields = ['id', 'points', 'mentor_rating', 'mentor_rating_count', 'longest_streak']
 
     def get_badges(self, obj):
         user_badges = UserBadge.objects.filter(user=obj, is_active=True)
@@ -49,7 +50,8 @@ class CourseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Course
-        fields = '__all__'
+        exclude = ['minhash']
+        read_only_fields = ['rating', 'rating_sum', 'rating_count', 'duplicate_of', 'last_synced_at']
 
     def get_is_enrolled(self, obj):
         request = self.context.get('request')
@@ -77,6 +79,11 @@ class EnrollmentSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['user']
 
+class ProgressDaySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProgressDay
+        fields = ['day', 'updates', 'progress_gained', 'courses_completed', 'course_progress']
+
 class MentorshipSerializer(serializers.ModelSerializer):
     mentor_username = serializers.CharField(source='mentor.username', read_only=True)
     learner_username = serializers.CharField(source='learner.username', read_only=True)
@@ -90,16 +97,14 @@ class MentorshipSerializer(serializers.ModelSerializer):
 
 class StudyGroupSerializer(serializers.ModelSerializer):
     creator_username = serializers.CharField(source='creator.username', read_only=True)
-    members_count = serializers.SerializerMethodField()
+    members_count = serializers.ReadOnlyField()
     is_member = serializers.SerializerMethodField()
 
     class Meta:
         model = StudyGroup
         fields = '__all__'
-        read_only_fields = ['creator']
-
-    def get_members_count(self, obj):
-        return obj.members.count()
+        # Membership changes only through the join/leave actions, which keep members_count and points in step
+        read_only_fields = ['creator', 'members']
 
     def get_is_member(self, obj):
         request = self.context.get('request')
@@ -116,6 +121,18 @@ class GroupMessageSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['sender']
 
+class GroupMessageSearchSerializer(GroupMessageSerializer):
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+class FileUploadSerializer(serializers.ModelSerializer):
+    message = GroupMessageSerializer(read_only=True)
+
+    class Meta:
+        model = FileUpload
+        fields = ['upload_id', 'group', 'file_name', 'size', 'sha256', 'received', 'status', 'message', 'created_at']
+        read_only_fields = fields
+
 class PortfolioSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
     user_avatar = serializers.ImageField(source='user.avatar', read_only=True)
@@ -146,9 +163,40 @@ class NotificationSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['user']
 
+class AnnouncementSerializer(serializers.ModelSerializer):
+    mode = serializers.ChoiceField(choices=Announcement.MODE_CHOICES, required=False)
+
+    class Meta:
+        model = Announcement
+        exclude = ['last_user_id']
+        read_only_fields = ['created_by', 'status', 'total_recipients', 'delivered', 'created_at', 'finished_at']
+
+class AnnouncementFeedSerializer(AnnouncementSerializer):
+    is_read = serializers.BooleanField(read_only=True)
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BackgroundJob
+        fields = '__all__'
+        read_only_fields = ['status', 'cursor', 'total', 'processed', 'result', 'cancel_requested', 'worker',
+                            'heartbeat_at', 'last_error', 'created_by', 'created_at', 'started_at', 'finished_at']
+        extra_kwargs = {'chunk_size': {'required': False}}
+
+    def get_progress(self, obj):
+        """Percent done, from the estimate taken when the job was created"""
+        if obj.status == 'done':
+            return 100
+        if not obj.total:
+            return None
+        return min(99, int(obj.processed * 100 / obj.total))
+
 class EventSerializer(serializers.ModelSerializer):
     attendee_count = serializers.ReadOnlyField()
 
     class Meta:
         model = Event
         fields = '__all__'
+        # Attendance changes only through the attend/unattend actions, which keep attendee_count in step
+        read_only_fields = ['attendees']
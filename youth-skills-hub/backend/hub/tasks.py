@@ -0,0 +1,149 @@
+"""
+Background side effects of course completions and mentorship sessions.
+
+Models queue these with ``enqueue_on_commit`` so a task never runs against a
+row that was rolled back, and the request only pays for its own writes.
+Workers acknowledge late and may deliver a task twice, so every task that
+awards points claims an idempotency key in the same transaction as its
+effects; a second delivery finds the key and does nothing.
+"""
+from celery import shared_task
+from django.db import IntegrityError, OperationalError, transaction
+
+from .models import Announcement, Enrollment, Mentorship, Notification, OutboxMessage, ProcessedTask, User
+from .reconcile import COMPLETION_POINTS, MENTOR_SESSION_POINTS
+
+retry_options = {
+    'autoretry_for': (OperationalError,),
+    'retry_backoff': True,
+    'max_retries': 5,
+}
+
+
+def enqueue_on_commit(task, *args):
+    transaction.on_commit(lambda: task.delay(*args))
+
+
+def claim(key):
+    """Record ``key`` inside the current transaction; False if an earlier run already committed it"""
+    try:
+        with transaction.atomic():
+            ProcessedTask.objects.create(key=key)
+        return True
+    except IntegrityError:
+        return False
+
+
+@shared_task(**retry_options)
+def enrollment_completed(enrollment_id):
+    enrollment = Enrollment.objects.select_related('user', 'course').filter(pk=enrollment_id).first()
+    if enrollment is None or not enrollment.completed:
+        return
+    with transaction.atomic():
+        if not claim(f'enrollment-completed:{enrollment_id}'):
+            return
+        enrollment.user.add_points(COMPLETION_POINTS)
+        Notification.objects.create(
+            user=enrollment.user,
+            title='Course completed',
+            message=f'You completed {enrollment.course.title} and earned {COMPLETION_POINTS} points.',
+        )
+    enqueue_on_commit(check_badges, enrollment.user_id)
+
+
+@shared_task(**retry_options)
+def mentorship_completed(mentorship_id, completed_at):
+    mentorship = Mentorship.objects.select_related('mentor', 'learner').filter(pk=mentorship_id).first()
+    if mentorship is None or mentorship.status != 'completed':
+        return
+    with transaction.atomic():
+        # Keyed on the completion time so a mentorship completed again later still earns its points
+        if not claim(f'mentorship-completed:{mentorship_id}:{completed_at}'):
+            return
+        mentorship.mentor.add_points(MENTOR_SESSION_POINTS)
+        Notification.objects.create(
+            user=mentorship.mentor,
+            title='Session completed',
+            message=f'Your session with {mentorship.learner.username} is complete. '
+                    f'You earned {MENTOR_SESSION_POINTS} points.',
+        )
+        Notification.objects.create(
+            user=mentorship.learner,
+            title='Session completed',
+            message=f'Your session with {mentorship.mentor.username} is complete. Leave a rating and feedback!',
+        )
+        # Both sides may now qualify for badges; checked under the same claim so a redelivery skips them too
+        for user in (mentorship.mentor, mentorship.learner):
+            award_badges_with_notifications(user)
+
+
+@shared_task(**retry_options)
+def check_badges(user_id):
+    """Award any badges the user now qualifies for; re-running only finds badges already held"""
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return []
+    with transaction.atomic():
+        badges = award_badges_with_notifications(user)
+    return [badge.name for badge in badges]
+
+
+def award_badges_with_notifications(user):
+    from .ml_model import award_badges
+    badges = award_badges(user)
+    for badge in badges:
+        Notification.objects.create(
+            user=user,
+            title='Badge earned',
+            message=f'You earned the {badge.name} badge: {badge.description}',
+        )
+    return badges
+
+
+@shared_task(**retry_options)
+def fan_out_announcement(announcement_id):
+    """Deliver a push-mode announcement; safe to retry, it resumes after the last committed batch"""
+    from .fanout import fan_out
+    announcement = Announcement.objects.filter(pk=announcement_id, mode='push').exclude(status='done').first()
+    if announcement is not None:
+        fan_out(announcement)
+
+
+@shared_task
+def drain_outbox(channel=None):
+    """Send due outbox messages; also run periodically so backed-off retries go out"""
+    from .outbox import drain
+    channels = [channel] if channel else [choice for choice, _ in OutboxMessage.CHANNEL_CHOICES]
+    return {name: drain(name) for name in channels}
+
+
+@shared_task
+def dispatch_reminders():
+    """Periodic tick: send the event and mentorship reminders that are due"""
+    from .reminders import dispatch_due_reminders
+    return dispatch_due_reminders()
+
+
+@shared_task(**retry_options)
+def update_course_index(course_ids):
+    """Re-vectorize changed courses for recommendations; re-running just rewrites the same vectors"""
+    from .ml_model import update_course_index as update_index
+    return update_index(course_ids)
+
+
+@shared_task
+def run_background_job(job_id):
+    """Run a BackgroundJob; a redelivered or duplicate task finds the claim taken and exits"""
+    from .jobs import run_job
+    job = run_job(job_id)
+    return job.status if job else None
+
+
+@shared_task
+def resume_stale_jobs():
+    """Periodic: requeue running jobs whose worker stopped heartbeating"""
+    from .jobs import stale_jobs
+    job_ids = list(stale_jobs().values_list('pk', flat=True))
+    for job_id in job_ids:
+        run_background_job.delay(job_id)
+    return job_ids
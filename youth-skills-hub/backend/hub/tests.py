@@ -1,3 +1,1206 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import F
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import catalog, fanout, jobs, outbox
+from .analytics import compute_funnels
+from .archive import archive_messages, message_page
+from .auth import JWTAuthMiddleware
+from .consumers import broadcast_group_message
+from .dedupe import dedupe_courses, duplicate_clusters, signature
+from .fanout import announcement_feed, create_announcement, fan_out, mark_announcements_read, unread_announcements
+from .leaderboard import DatabaseLeaderboard
+from .ml_model import update_course_index
+from .models import (Announcement, BackgroundJob, Course, CourseVector, Enrollment, Event, FileUpload, FreeCourseDuplicate, GroupMessage,
+                     GroupMessageSegment, GroupReadCursor, LeaderboardScore, Mentorship, Notification, OutboxMessage,
+                     ProgressDay, StudyGroup, User)
+from .notifications import notification_stream
+from .presence import MemoryPresence
+from .providers import ProviderAggregator, StubProvider
+from .pubsub import LocalBroker, UnixSocketBroker, get_broker, group_messages_topic
+from .reconcile import DEFAULT_TARGETS, MENTOR_SESSION_POINTS, RECONCILERS
+from .reminders import dispatch_due_reminders
+from .routing import websocket_urlpatterns
+from .throttling import LOCK_RETRY, TokenBucket
+from .tasks import fan_out_announcement, mentorship_completed
+from .uploads import partial_path
+from .views import GroupMessageViewSet, NotificationViewSet, StudyGroupViewSet, free_courses
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.course = Course.objects.create(
+            title='Python', description='Basics', category='coding', skill_level='beginner', duration=10,
+            provider='Hub')
+        self.group = StudyGroup.objects.create(name='Group', description='Study', creator=self.user)
+        start = timezone.now() + timedelta(days=7)
+        self.event = Event.objects.create(
+            title='Meetup', description='Talk', event_type='workshop', start_time=start,
+            end_time=start + timedelta(hours=2))
+
+    def assert_enrolled_count(self, course, expected):
+        course.refresh_from_db()
+        self.assertEqual(course.enrolled_count, expected)
+
+    def test_enrollment_create_and_delete_keep_count(self):
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        Enrollment.objects.create(user=self.other, course=self.course)
+        self.assert_enrolled_count(self.course, 2)
+        enrollment.delete()
+        self.assert_enrolled_count(self.course, 1)
+
+    def test_enroll_action_counts_once(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.post(f'/api/courses/{self.course.pk}/enroll/')
+        client.post(f'/api/courses/{self.course.pk}/enroll/')
+        self.assert_enrolled_count(self.course, 1)
+
+    def test_moving_enrollment_moves_count(self):
+        other_course = Course.objects.create(
+            title='SQL', description='Queries', category='coding', skill_level='beginner', duration=5, provider='Hub')
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        enrollment = Enrollment.objects.get(pk=enrollment.pk)
+        enrollment.course = other_course
+        enrollment.save()
+        self.assert_enrolled_count(self.course, 0)
+        self.assert_enrolled_count(other_course, 1)
+
+    def test_membership_changes_only_count_real_members(self):
+        self.assertTrue(self.group.add_member(self.other))
+        self.assertTrue(self.group.add_member(self.other))
+        self.assertTrue(self.group.remove_member(self.other))
+        self.assertFalse(self.group.remove_member(self.other))
+        self.group.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.group.members_count, 0)
+        self.assertEqual(self.other.points, 0)
+
+    def test_leave_twice_is_rejected(self):
+        self.group.add_member(self.other)
+        client = APIClient()
+        client.force_authenticate(self.other)
+        self.assertEqual(client.post(f'/api/study-groups/{self.group.pk}/leave/').status_code, 200)
+        self.assertEqual(client.post(f'/api/study-groups/{self.group.pk}/leave/').status_code, 400)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.members_count, 0)
+
+    def test_attendance_changes_only_count_real_attendees(self):
+        self.assertTrue(self.event.add_attendee(self.other))
+        self.assertTrue(self.event.add_attendee(self.other))
+        self.assertTrue(self.event.remove_attendee(self.other))
+        self.assertFalse(self.event.remove_attendee(self.other))
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendee_count, 0)
+
+    def test_stale_instances_cannot_overfill_or_double_leave(self):
+        # Two copies loaded before either change stand in for concurrent requests
+        StudyGroup.objects.filter(pk=self.group.pk).update(max_members=1)
+        first, second = StudyGroup.objects.get(pk=self.group.pk), StudyGroup.objects.get(pk=self.group.pk)
+        third = User.objects.create_user('third', 'third@example.com', 'pw')
+        self.assertTrue(first.add_member(self.other))
+        self.assertFalse(second.add_member(third))
+        self.assertFalse(self.group.members.filter(pk=third.pk).exists())
+        third.refresh_from_db()
+        self.assertEqual(third.points, 0)
+
+        first, second = StudyGroup.objects.get(pk=self.group.pk), StudyGroup.objects.get(pk=self.group.pk)
+        self.assertTrue(first.remove_member(self.other))
+        self.assertFalse(second.remove_member(self.other))
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.members_count, 0)
+
+    def test_full_event_rejects_attendee(self):
+        Event.objects.filter(pk=self.event.pk).update(max_attendees=1)
+        first, second = Event.objects.get(pk=self.event.pk), Event.objects.get(pk=self.event.pk)
+        self.assertTrue(first.add_attendee(self.user))
+        self.assertFalse(second.add_attendee(self.other))
+        self.assertTrue(second.add_attendee(self.user))
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.attendee_count, self.event.attendees.count()), (1, 1))
+
+    def test_members_cannot_be_patched(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.patch(f'/api/study-groups/{self.group.pk}/', {'members': [self.other.pk]}, format='json')
+        self.assertFalse(self.group.members.exists())
+
+    def test_points_reconciler_is_opt_in(self):
+        self.assertNotIn('points', DEFAULT_TARGETS)
+        self.assertIn('points', RECONCILERS)
+        self.assertIn('enrolled_count', DEFAULT_TARGETS)
+
+
+class RatingAggregateMigrationTests(TestCase):
+    def test_existing_ratings_are_seeded(self):
+        mentor = User.objects.create_user('mentor', 'mentor@example.com', 'pw', role='mentor')
+        learners = [User.objects.create_user(f'learner{i}', f'learner{i}@example.com', 'pw') for i in range(3)]
+        course = Course.objects.create(
+            title='Python', description='Basics', category='coding', skill_level='beginner', duration=10, provider='Hub')
+        for learner, rating in zip(learners, (4, 5, 0)):
+            Enrollment.objects.create(user=learner, course=course, rating=rating)
+            Mentorship.objects.create(mentor=mentor, learner=learner, rating=rating)
+        # As if the ratings had been given before the aggregate columns existed
+        Course.objects.update(rating_sum=0, rating_count=0, rating=0)
+        User.objects.update(mentor_rating_sum=0, mentor_rating_count=0, mentor_rating=0)
+
+        import_module('hub.migrations.0005_rating_aggregates').seed_rating_aggregates(apps, None)
+        course.refresh_from_db()
+        mentor.refresh_from_db()
+        self.assertEqual((course.rating_sum, course.rating_count, course.rating), (9, 2, Decimal('4.5')))
+        self.assertEqual((mentor.mentor_rating_sum, mentor.mentor_rating_count, mentor.mentor_rating),
+                         (9, 2, Decimal('4.5')))
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.leaderboard = DatabaseLeaderboard()
+
+    def period_points(self):
+        return dict(LeaderboardScore.objects.filter(user=self.user).values_list('timeframe', 'points'))
+
+    def test_deduction_without_period_score_creates_nothing(self):
+        self.leaderboard.record(self.user, -5)
+        self.assertEqual(self.period_points(), {})
+
+    def test_period_scores_never_go_negative(self):
+        self.leaderboard.record(self.user, 3)
+        self.leaderboard.record(self.user, -5)
+        self.assertEqual(self.period_points(), {'monthly': 0, 'weekly': 0})
+        self.leaderboard.record(self.user, 4)
+        self.assertEqual(self.period_points(), {'monthly': 4, 'weekly': 4})
+
+
+class MessageHistoryTests(TransactionTestCase):
+    # The messages route is async and queries from the database pool's threads
+    def setUp(self):
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.group = StudyGroup.objects.create(name='Group', description='Study', creator=self.user)
+        self.ids = [GroupMessage.objects.create(group=self.group, sender=self.user, message=f'm{i}').id
+                    for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def page(self, **params):
+        response = self.client.get(f'/api/study-groups/{self.group.pk}/messages/', params)
+        self.assertEqual(response.status_code, 200)
+        return [message['id'] for message in response.data]
+
+    def test_before_id_pages_back_through_history(self):
+        newest = self.page(limit=2)
+        self.assertEqual(newest, self.ids[3:])
+        older = self.page(limit=2, before_id=newest[0])
+        self.assertEqual(older, self.ids[1:3])
+        self.assertEqual(self.page(limit=2, before_id=older[0]), self.ids[:1])
+
+
+class MessageSearchTests(TestCase):
+    def test_new_message_is_searchable(self):
+        # The test database is built by the migrations, so this fails if a table rebuild dropped the FTS triggers
+        user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        group = StudyGroup.objects.create(name='Group', description='Study', creator=user)
+        message = GroupMessage.objects.create(group=group, sender=user, message='Recursion explained with turtles')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/api/study-groups/{group.pk}/search/', {'q': 'turtle'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.data['results']], [message.id])
+
+    def test_private_group_search_is_for_members_only(self):
+        creator = User.objects.create_user('creator', 'creator@example.com', 'pw')
+        member = User.objects.create_user('member', 'member@example.com', 'pw')
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'pw')
+        group = StudyGroup.objects.create(name='Private', description='Study', creator=creator, is_private=True)
+        group.add_member(member)
+        GroupMessage.objects.create(group=group, sender=creator, message='secret plans')
+        client = APIClient()
+        for user, status in ((creator, 200), (member, 200), (outsider, 403)):
+            client.force_authenticate(user)
+            self.assertEqual(client.get(f'/api/study-groups/{group.pk}/search/', {'q': 'secret'}).status_code, status)
+
+
+class PrivateGroupMessageTests(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', 'creator@example.com', 'pw')
+        self.outsider = User.objects.create_user('outsider', 'outsider@example.com', 'pw')
+        self.group = StudyGroup.objects.create(
+            name='Private', description='Study', creator=self.creator, is_private=True)
+        GroupMessage.objects.create(group=self.group, sender=self.creator, message='secret')
+        self.factory = APIRequestFactory()
+
+    def get(self, view, url, user, **kwargs):
+        request = self.factory.get(url)
+        force_authenticate(request, user)
+        return view(request, **kwargs)
+
+    def test_history_and_polls_are_for_members_only(self):
+        messages = StudyGroupViewSet.as_view({'get': 'messages'})
+        group_messages = GroupMessageViewSet.as_view({'get': 'list'})
+        for user, status in ((self.creator, 200), (self.outsider, 403)):
+            for url in (f'/api/study-groups/{self.group.pk}/messages/',
+                        f'/api/study-groups/{self.group.pk}/messages/?after_id=0&wait=0'):
+                self.assertEqual(self.get(messages, url, user, pk=self.group.pk).status_code, status)
+            for url in (f'/api/group-messages/?group={self.group.pk}',
+                        f'/api/group-messages/?group={self.group.pk}&after_id=0&wait=0'):
+                self.assertEqual(self.get(group_messages, url, user).status_code, status)
+
+    def test_unknown_group_is_not_found(self):
+        group_messages = GroupMessageViewSet.as_view({'get': 'list'})
+        for url, status in (('/api/group-messages/?group=999&after_id=0', 404), ('/api/group-messages/?group=x', 400)):
+            self.assertEqual(self.get(group_messages, url, self.creator).status_code, status)
+
+
+class PresenceTests(TestCase):
+    def test_user_stays_online_until_last_connection_closes(self):
+        presence = MemoryPresence()
+        self.assertTrue(presence.connect(1, 7, 'learner'))
+        self.assertFalse(presence.connect(1, 7, 'learner'))
+        self.assertFalse(presence.leave(1, 7, 'learner'))
+        self.assertEqual(presence.online(1), [{'id': 7, 'username': 'learner'}])
+        self.assertTrue(presence.leave(1, 7, 'learner'))
+        self.assertEqual(presence.online(1), [])
+        self.assertFalse(presence.leave(1, 7, 'learner'))
+
+    def test_expiry_forgets_connection_count(self):
+        presence = MemoryPresence()
+        presence.connect(1, 7, 'learner')
+        presence.connect(1, 7, 'learner')
+        with mock.patch('hub.presence.time.time', return_value=time.time() + 60):
+            self.assertEqual(presence.sweep(force=True), {1})
+        self.assertTrue(presence.connect(1, 7, 'learner'))
+        self.assertTrue(presence.leave(1, 7, 'learner'))
+
+
+class UploadTests(TestCase):
+    data = b'0123456789' * 10
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(FILE_UPLOAD_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.group = StudyGroup.objects.create(name='Group', description='Study', creator=self.user, is_private=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, sha256=None):
+        response = self.client.post('/api/uploads/', {
+            'group': self.group.pk, 'file_name': 'notes.html', 'size': len(self.data),
+            'sha256': sha256 or hashlib.sha256(self.data).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data['upload_id']
+
+    def put(self, upload_id, offset, chunk):
+        return self.client.put(f'/api/uploads/{upload_id}/chunk/', chunk, content_type='application/octet-stream',
+                               HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunks_resume_from_stored_offset(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, self.data[:40]).status_code, 200)
+        stale = self.put(upload_id, 0, self.data[:40])
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale['Upload-Offset'], '40')
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/')['Upload-Offset'], '40')
+        response = self.put(upload_id, 40, self.data[40:])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'complete')
+        self.assertTrue(response.data['message']['file_url'].endswith(f'/api/uploads/{upload_id}/download/'))
+
+    def test_hash_mismatch_restarts_upload(self):
+        upload_id = self.start(sha256='0' * 64)
+        response = self.put(upload_id, 0, self.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response['Upload-Offset'], '0')
+        self.assertEqual(FileUpload.objects.get(upload_id=upload_id).status, 'uploading')
+        self.assertFalse(GroupMessage.objects.exists())
+
+    def test_failed_message_create_keeps_partial_file(self):
+        upload_id = self.start()
+        with mock.patch('hub.uploads.GroupMessage.objects.create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.put(upload_id, 0, self.data)
+        upload = FileUpload.objects.get(upload_id=upload_id)
+        self.assertEqual(upload.status, 'uploading')
+        with open(partial_path(upload), 'rb') as part:
+            self.assertEqual(part.read(), self.data)
+
+    def test_download_is_an_attachment_for_group_readers_only(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.data)
+        response = self.client.get(f'/api/uploads/{upload_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'pw')
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/download/').status_code, 404)
+
+
+class RecordingBackend(outbox.Backend):
+    """Outbox backend for tests: fails while ``failures`` is positive, otherwise records what it sent"""
+    sent = []
+    failures = 0
+
+    def send(self, unit):
+        if RecordingBackend.failures:
+            RecordingBackend.failures -= 1
+            raise ConnectionError('provider unavailable')
+        RecordingBackend.sent.extend(message.recipient for message in unit)
+
+
+@override_settings(OUTBOX_BACKENDS={'email': {'BACKEND': 'hub.tests.RecordingBackend'}})
+class OutboxTests(TestCase):
+    def setUp(self):
+        RecordingBackend.sent = []
+        RecordingBackend.failures = 0
+        self.message = OutboxMessage.objects.create(channel='email', recipient='a@example.com', subject='Hi', body='Hello')
+
+    def test_failed_send_is_retried_after_backoff(self):
+        RecordingBackend.failures = 1
+        before = timezone.now()
+        self.assertEqual(outbox.drain('email'), (0, 1, 0))
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), ('pending', 1))
+        self.assertIn('provider unavailable', self.message.last_error)
+        delay = (self.message.next_attempt_at - before).total_seconds()
+        self.assertTrue(0.8 * outbox.BACKOFF_BASE_SECONDS <= delay <= 1.2 * outbox.BACKOFF_BASE_SECONDS + 5)
+
+        self.assertEqual(outbox.drain('email'), (0, 0, 0))  # not due yet
+        OutboxMessage.objects.filter(pk=self.message.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.drain('email'), (1, 0, 0))
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, 'sent')
+        self.assertEqual(RecordingBackend.sent, ['a@example.com'])
+
+    def test_backoff_grows_and_is_capped(self):
+        with mock.patch('hub.outbox.random.uniform', return_value=1):
+            self.assertEqual(outbox.backoff(1), timedelta(seconds=outbox.BACKOFF_BASE_SECONDS))
+            self.assertEqual(outbox.backoff(3), timedelta(seconds=4 * outbox.BACKOFF_BASE_SECONDS))
+            self.assertEqual(outbox.backoff(50), timedelta(seconds=outbox.BACKOFF_MAX_SECONDS))
+
+    def test_message_fails_after_max_attempts(self):
+        RecordingBackend.failures = 1
+        OutboxMessage.objects.filter(pk=self.message.pk).update(attempts=outbox.MAX_ATTEMPTS - 1)
+        self.assertEqual(outbox.drain('email'), (0, 0, 1))
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), ('failed', outbox.MAX_ATTEMPTS))
+
+    def test_abandoned_claim_is_reclaimed_after_lease(self):
+        OutboxMessage.objects.filter(pk=self.message.pk).update(status='sending', claimed_at=timezone.now())
+        self.assertEqual(outbox.claim_batch('email', 10), [])
+        OutboxMessage.objects.filter(pk=self.message.pk).update(
+            claimed_at=timezone.now() - outbox.CLAIM_LEASE - timedelta(seconds=1))
+        self.assertEqual(outbox.claim_batch('email', 10), [self.message])
+
+    def test_only_one_drain_per_channel(self):
+        cache.add('outbox:drain:email', 1)
+        self.addCleanup(cache.delete, 'outbox:drain:email')
+        self.assertIsNone(outbox.drain('email'))
+        self.assertEqual(RecordingBackend.sent, [])
+
+
+@override_settings(REMINDER_OFFSETS_MINUTES=[24 * 60, 60])
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.mentor = User.objects.create_user('mentor', 'mentor@example.com', 'pw')
+        self.learner = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.start = timezone.now() + timedelta(days=2)
+        self.mentorship = Mentorship.objects.create(mentor=self.mentor, learner=self.learner, scheduled_at=self.start)
+
+    def due_times(self):
+        return list(self.mentorship.reminders.filter(status='pending').values_list('due_at', flat=True))
+
+    def test_saving_schedules_and_reschedules_reminders(self):
+        self.assertEqual(self.due_times(), [self.start - timedelta(days=1), self.start - timedelta(hours=1)])
+        self.mentorship.scheduled_at = self.start + timedelta(days=1)
+        self.mentorship.save()
+        self.assertEqual(self.due_times(), [self.start, self.start + timedelta(days=1) - timedelta(hours=1)])
+        self.mentorship.status = 'cancelled'
+        self.mentorship.save()
+        self.assertEqual(self.due_times(), [])
+
+    def test_dispatch_sends_due_reminders_once(self):
+        now = self.start - timedelta(hours=23)
+        self.assertEqual(dispatch_due_reminders(now=now), 1)
+        self.assertEqual(dispatch_due_reminders(now=now), 0)
+        self.assertEqual(Notification.objects.filter(title='Mentorship session in 1 day').count(), 2)
+        self.assertEqual(self.mentorship.reminders.filter(status='pending').count(), 1)
+
+    def test_rows_claimed_by_another_worker_are_skipped(self):
+        self.mentorship.reminders.update(claim_token=uuid.uuid4())
+        self.assertEqual(dispatch_due_reminders(now=self.start), 0)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_inactive_event_reminders_are_cancelled(self):
+        event = Event.objects.create(
+            title='Meetup', description='Talk', event_type='workshop', start_time=self.start,
+            end_time=self.start + timedelta(hours=2))
+        Event.objects.filter(pk=event.pk).update(is_active=False)
+        self.assertEqual(dispatch_due_reminders(now=self.start - timedelta(hours=23)), 1)
+        self.assertEqual(list(event.reminders.values_list('status', flat=True)), ['cancelled', 'pending'])
+
+    def test_reminders_for_sessions_that_already_started_are_cancelled(self):
+        # The tick was down until after the session started
+        self.assertEqual(dispatch_due_reminders(now=self.start + timedelta(minutes=5)), 0)
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(set(self.mentorship.reminders.values_list('status', flat=True)), {'cancelled'})
+
+    def test_late_tick_still_sends_reminders_before_the_start(self):
+        # Both reminders are overdue but the session is still ahead
+        self.assertEqual(dispatch_due_reminders(now=self.start - timedelta(minutes=30)), 2)
+        self.assertEqual(set(self.mentorship.reminders.values_list('status', flat=True)), {'sent'})
+
+    def test_reminders_for_called_off_sessions_are_cancelled(self):
+        Mentorship.objects.filter(pk=self.mentorship.pk).update(status='cancelled')  # bypasses rescheduling
+        self.assertEqual(dispatch_due_reminders(now=self.start - timedelta(hours=23)), 0)
+        self.assertEqual(list(self.mentorship.reminders.order_by('due_at').values_list('status', flat=True)),
+                         ['cancelled', 'pending'])
+
+
+class CourseIndexJobTests(TestCase):
+    def test_missing_only_indexes_courses_without_vectors(self):
+        indexed, missing = [Course.objects.create(
+            title=title, description='Basics', category='coding', skill_level='beginner', duration=10, provider='Hub')
+            for title in ('Python', 'SQL')]
+        update_course_index([indexed.pk])
+        job = jobs.start_job('course_index', {'missing': '1'}, enqueue=False)
+        self.assertEqual(job.total, 1)
+        job = jobs.run_job(job.pk)
+        self.assertEqual((job.status, job.result), ('done', {'indexed': 1}))
+        self.assertTrue(CourseVector.objects.filter(course=missing).exists())
+        self.assertEqual(jobs.start_job('course_index', {'missing': '1'}, enqueue=False).total, 0)
+
+
+class PointsJob(jobs.Job):
+    """Test job that gives every user one point, failing on the users in ``fail_on``"""
+    name = 'test_points'
+    fail_on = set()
+
+    def run_chunk(self, params, cursor, chunk_size):
+        user_ids = list(User.objects.filter(pk__gt=cursor).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        User.objects.filter(pk__in=user_ids).update(points=F('points') + 1)
+        if self.fail_on & set(user_ids):
+            raise RuntimeError('chunk failed')
+        return len(user_ids), user_ids[-1] if user_ids else 0, {'users': len(user_ids)}
+
+
+class JobResumeTests(TestCase):
+    def setUp(self):
+        self.job_type = PointsJob()
+        patcher = mock.patch.dict(jobs.JOBS, {PointsJob.name: self.job_type})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pw') for i in range(5)]
+        self.job = jobs.start_job(PointsJob.name, chunk_size=2, enqueue=False)
+
+    def assert_every_user_processed_once(self):
+        self.assertEqual(set(User.objects.values_list('points', flat=True)), {1})
+
+    def test_lost_claim_rolls_back_chunk_and_new_runner_resumes(self):
+        def taken_over(job):
+            # Another runner claims the job after the first chunk
+            BackgroundJob.objects.filter(pk=job.pk).update(worker='other', heartbeat_at=timezone.now())
+
+        self.assertIsNone(jobs.run_job(self.job.pk, worker='first', on_chunk=taken_over))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.processed, self.job.cursor), (2, self.users[1].pk))
+        self.assertEqual(User.objects.filter(points=1).count(), 2)
+
+        self.assertIsNone(jobs.run_job(self.job.pk, worker='third'))  # the other runner's claim is still live
+        BackgroundJob.objects.filter(pk=self.job.pk).update(heartbeat_at=timezone.now() - jobs.LEASE * 2)
+        self.assertEqual(jobs.stale_jobs().get(), self.job)
+        job = jobs.run_job(self.job.pk, worker='third')
+        self.assertEqual((job.status, job.processed, job.result), ('done', 5, {'users': 5}))
+        self.assert_every_user_processed_once()
+
+    def test_failed_job_resumes_from_last_committed_chunk(self):
+        self.job_type.fail_on = {self.users[2].pk}
+        job = jobs.run_job(self.job.pk, worker='first')
+        self.assertEqual((job.status, job.processed), ('failed', 2))
+        self.assertIn('chunk failed', job.last_error)
+
+        self.job_type.fail_on = set()
+        jobs.resume_job(job, enqueue=False)
+        job = jobs.run_job(self.job.pk, worker='second')
+        self.assertEqual((job.status, job.processed), ('done', 5))
+        self.assert_every_user_processed_once()
+
+
+class HeartbeatTests(TransactionTestCase):
+    # The heartbeat writes from its own thread and connection
+
+    def test_heartbeat_keeps_a_long_chunk_claimed(self):
+        job = BackgroundJob.objects.create(name='test_points', status='running', worker='first',
+                                           heartbeat_at=timezone.now() - jobs.LEASE * 2)
+        self.assertEqual(jobs.stale_jobs().get(), job)
+        with jobs.Heartbeat(job.pk, 'first', interval=timedelta(milliseconds=20)):
+            time.sleep(0.2)  # a chunk running longer than the heartbeat interval
+        self.assertFalse(jobs.stale_jobs().exists())
+        self.assertFalse(jobs.claim_job(job.pk, 'second'))
+
+    def test_heartbeat_stops_once_the_claim_is_lost(self):
+        job = BackgroundJob.objects.create(name='test_points', status='running', worker='other',
+                                           heartbeat_at=timezone.now() - jobs.LEASE * 2)
+        with jobs.Heartbeat(job.pk, 'first', interval=timedelta(milliseconds=20)) as heartbeat:
+            heartbeat._thread.join(timeout=1)
+            self.assertFalse(heartbeat._thread.is_alive())
+        self.assertEqual(jobs.stale_jobs().get(), job)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # The async routes run their queries on the database pool's threads
+
+    def setUp(self):
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.outsider = User.objects.create_user('outsider', 'outsider@example.com', 'pw')
+        self.group = StudyGroup.objects.create(
+            name='Private', description='Study', creator=self.user, is_private=True)
+        self.last = GroupMessage.objects.create(group=self.group, sender=self.user, message='hello')
+        self.client = AsyncClient()
+
+    def auth(self, user):
+        return {'headers': {'Authorization': f'Bearer {AccessToken.for_user(user)}'}}
+
+    async def test_long_poll_wakes_on_new_message(self):
+        async def post_later():
+            await asyncio.sleep(0.2)
+            message = await sync_to_async(GroupMessage.objects.create)(
+                group=self.group, sender=self.user, message='new')
+            get_broker().publish(group_messages_topic(self.group.pk), message.id)
+
+        started = time.monotonic()
+        response, _ = await asyncio.gather(self.client.get(
+            f'/api/study-groups/{self.group.pk}/messages/', {'after_id': self.last.pk, 'wait': 10},
+            **self.auth(self.user)), post_later())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message['message'] for message in response.json()], ['new'])
+        self.assertLess(time.monotonic() - started, 5)
+
+    async def test_long_poll_times_out_empty(self):
+        started = time.monotonic()
+        response = await self.client.get(
+            '/api/group-messages/', {'group': self.group.pk, 'after_id': self.last.pk, 'wait': 0.3},
+            **self.auth(self.user))
+        self.assertEqual((response.status_code, response.json()), (200, []))
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    async def test_polls_check_authentication_and_membership(self):
+        urls = [f'/api/study-groups/{self.group.pk}/messages/?after_id=0',
+                f'/api/group-messages/?group={self.group.pk}&after_id=0']
+        for url in urls:
+            self.assertEqual((await self.client.get(url)).status_code, 401)
+            self.assertEqual((await self.client.get(url, **self.auth(self.outsider))).status_code, 403)
+        response = await self.client.get('/api/group-messages/?group=999&after_id=0', **self.auth(self.user))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_health_reports_failing_checks(self):
+        response = await self.client.get('/api/health/')
+        self.assertEqual((response.status_code, response.json()['status']), (200, 'ok'))
+        with mock.patch('hub.views.check_database', side_effect=RuntimeError('database is down')):
+            response = await self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['database'], 'RuntimeError: database is down')
+        self.assertEqual(response.json()['checks']['cache'], 'ok')
+
+
+class PubSubTests(TestCase):
+    def test_publish_many_delivers_in_order_and_counts(self):
+        broker = LocalBroker()
+        with broker.subscribe('a') as a, broker.subscribe('b') as b:
+            broker.publish_many([('a', 1), ('b', 2), ('a', 3), ('nobody', 4)])
+            self.assertEqual([a.get(timeout=1), a.get(timeout=1), b.get(timeout=1)], [1, 3, 2])
+        metrics = broker.metrics.snapshot()
+        self.assertEqual((metrics['published'], metrics['delivered'], metrics['dropped']), (4, 3, 0))
+
+    def test_metrics_endpoint_is_for_admins(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('learner', 'learner@example.com', 'pw'))
+        self.assertEqual(client.get('/api/pubsub/metrics/').status_code, 403)
+        client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'pw', role='admin'))
+        response = client.get('/api/pubsub/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('latency_histogram', response.data)
+
+
+class UnixSocketBrokerTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def broker(self, **attributes):
+        broker = UnixSocketBroker(self.directory)
+        for name, value in attributes.items():
+            setattr(broker, name, value)
+        self.addCleanup(broker.close)
+        return broker
+
+    def test_batches_split_at_datagram_limit_and_reach_other_workers(self):
+        publisher, receiver = self.broker(max_datagram_bytes=300), self.broker()
+        self.assertEqual([count for _, count in publisher._batches(
+            [{'topic': 't', 'payload': 'x' * 100}] * 5)], [2, 2, 1])
+        with receiver.subscribe('t') as subscription:
+            publisher.publish_many([('t', i) for i in range(20)])
+            self.assertEqual([subscription.get(timeout=2) for _ in range(20)], list(range(20)))
+
+    def test_oversized_envelope_is_dropped_not_raised(self):
+        publisher, receiver = self.broker(max_datagram_bytes=200), self.broker()
+        with receiver.subscribe('t') as subscription:
+            publisher.publish_many([('t', 'x' * 500), ('t', 'small')])
+            self.assertEqual(subscription.get(timeout=2), 'small')
+        self.assertEqual(publisher.metrics.snapshot()['dropped'], 1)
+
+    def test_full_receiver_does_not_block_publishers(self):
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        stalled.bind(os.path.join(self.directory, 'stalled.sock'))
+        self.addCleanup(stalled.close)
+        publisher = self.broker()
+        started = time.monotonic()
+        for i in range(2000):
+            publisher.publish('t', 'x' * 1000)
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertGreater(publisher.metrics.snapshot()['dropped'], 0)
+
+    def test_bad_datagram_does_not_stop_listener(self):
+        receiver = self.broker()
+        with receiver.subscribe('t') as subscription:
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.addCleanup(sender.close)
+            sender.sendto(b'not json', receiver.path)
+            self.broker().publish('t', 'still listening')
+            self.assertEqual(subscription.get(timeout=2), 'still listening')
+
+
+class MentorshipCompletionTests(TestCase):
+    def setUp(self):
+        self.mentor = User.objects.create_user('mentor', 'mentor@example.com', 'pw', role='mentor')
+        self.learner = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.mentorship = Mentorship.objects.create(mentor=self.mentor, learner=self.learner, status='active')
+
+    def test_completion_queues_one_task_after_commit(self):
+        with mock.patch('hub.tasks.mentorship_completed.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.mentorship.complete_session()
+        delay.assert_called_once_with(self.mentorship.pk, self.mentorship.completed_at.isoformat())
+
+    def test_redelivered_task_is_a_no_op(self):
+        with mock.patch('hub.tasks.mentorship_completed.delay'):
+            self.mentorship.complete_session()
+        completed_at = self.mentorship.completed_at.isoformat()
+        with mock.patch('hub.ml_model.award_badges', return_value=[]) as award_badges:
+            mentorship_completed(self.mentorship.pk, completed_at)
+            mentorship_completed(self.mentorship.pk, completed_at)
+        self.assertEqual([call.args[0] for call in award_badges.call_args_list], [self.mentor, self.learner])
+        self.mentor.refresh_from_db()
+        self.assertEqual(self.mentor.points, MENTOR_SESSION_POINTS)
+        self.assertEqual(Notification.objects.filter(title='Session completed').count(), 2)
+
+
+class CatalogVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.aggregator = ProviderAggregator([StubProvider('Coursera'), StubProvider('edX')])
+        for patcher in (mock.patch('hub.providers._aggregator', self.aggregator), mock.patch.object(catalog, '_catalog', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unchanged_providers_only_read_the_digests(self):
+        built = catalog.get_catalog()
+        self.assertTrue(len(built))
+        with mock.patch('hub.providers.cache', wraps=cache) as spy:
+            self.assertIs(catalog.get_catalog(), built)
+        keys = [key for call in spy.get_many.call_args_list for key in call.args[0]]
+        self.assertEqual(sorted(keys), ['free-courses:digest:coursera', 'free-courses:digest:edx'])
+
+    def test_changed_provider_list_rebuilds_the_catalog(self):
+        built = catalog.get_catalog()
+        provider = self.aggregator.providers[0]
+        entry = dict(cache.get(self.aggregator.cache_key(provider)), digest='changed')
+        entry['courses'] = entry['courses'] + [dict(entry['courses'][0], id='new-course', title='Brand new course')]
+        cache.set_many({self.aggregator.cache_key(provider): entry,
+                        self.aggregator.digest_key(provider): {'digest': 'changed', 'fetched_at': entry['fetched_at']}})
+        rebuilt = catalog.get_catalog()
+        self.assertNotEqual(rebuilt.version, built.version)
+        self.assertEqual(len(rebuilt), len(built) + 1)
+        self.assertEqual(rebuilt.search(search='brand')[0]['id'], 'new-course')
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+
+    def test_bucket_refills_evenly(self):
+        bucket = TokenBucket('test', '2/min')
+        with mock.patch('hub.throttling.time.time', return_value=1000.0):
+            self.assertEqual([bucket.take(self.user.pk) for _ in range(2)], [0, 0])
+            self.assertAlmostEqual(bucket.take(self.user.pk), 30)
+        with mock.patch('hub.throttling.time.time', return_value=1030.0):
+            self.assertEqual(bucket.take(self.user.pk), 0)
+            self.assertAlmostEqual(bucket.take(self.user.pk), 30)
+
+    def test_contended_lock_asks_to_retry(self):
+        bucket = TokenBucket('test', '2/min')
+        cache.add(f'{bucket.key(self.user.pk)}:lock', 1)
+        with mock.patch('hub.throttling.time.sleep'):
+            self.assertEqual(bucket.take(self.user.pk), LOCK_RETRY)
+
+    @override_settings(THROTTLE_RATES={'update_progress': '2/min'})
+    def test_empty_bucket_returns_429_with_retry_after(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        url = '/api/enrollments/999/update_progress/'
+        self.assertEqual([client.post(url).status_code for _ in range(2)], [404, 404])
+        response = client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response.json()['retry_after'], 30)
+
+
+class FunnelTests(TestCase):
+    def test_funnels_and_cohort_retention_on_fixed_data(self):
+        def at(month, day):
+            return datetime(2024, month, day, tzinfo=dt_timezone.utc).timestamp()
+
+        # user, course, progress, enrolled, completed; user 99 has no signup row
+        rows = [
+            (1, 10, 100, at(1, 20), at(3, 5)),
+            (1, 11, 30, at(2, 10), -1),
+            (2, 10, 60, at(1, 25), -1),
+            (3, 11, 80, at(2, 20), -1),
+            (99, 10, 0, at(3, 1), -1),
+        ]
+        user_ids, course_ids, progress, enrolled_at, completed_at = (np.array(column) for column in zip(*rows))
+        cohort_user_ids = np.array([1, 2, 3])
+        cohort_months = np.array([at(1, 2), at(1, 30), at(2, 14)]).astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+        report = compute_funnels(user_ids, course_ids, progress, enrolled_at, completed_at,
+                                 cohort_user_ids, cohort_months, {10: 'tech', 11: 'art'})
+
+        self.assertEqual(report['enrollments'], 5)
+        self.assertEqual(report['by_course'], {'10': [3, 2, 2, 1, 1], '11': [2, 2, 1, 1, 0]})
+        self.assertEqual(report['by_category'], {
+            'art': [2, 2, 1, 1, 0], 'other': [0, 0, 0, 0, 0], 'tech': [3, 2, 2, 1, 1]})
+        self.assertEqual(report['by_cohort'], {'2024-01': [3, 3, 2, 1, 1], '2024-02': [1, 1, 1, 1, 0]})
+        self.assertEqual(report['cohort_retention'], {
+            '2024-01': {'users': 2, 'retention': [1.0, 0.5, 0.5] + [0.0] * 9},
+            '2024-02': {'users': 1, 'retention': [1.0] + [0.0] * 11},
+        })
+
+
+class StreakTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.today = timezone.localdate()
+
+    def test_consecutive_days_extend_and_a_gap_restarts(self):
+        for offset in (-4, -3, -3):  # the repeat on the same day changes nothing
+            self.user.record_activity(self.today + timedelta(days=offset))
+        self.assertEqual((self.user.current_streak, self.user.longest_streak), (2, 2))
+        self.user.record_activity(self.today - timedelta(days=1))
+        self.assertEqual((self.user.current_streak, self.user.longest_streak), (1, 2))
+        self.user.record_activity(self.today)
+        self.assertEqual((self.user.current_streak, self.user.longest_streak), (2, 2))
+        self.assertEqual(self.user.active_streak, 2)
+
+    def test_active_streak_is_zero_after_a_missed_day(self):
+        self.user.record_activity(self.today - timedelta(days=1))
+        self.assertEqual(self.user.active_streak, 1)
+        self.user.record_activity(self.today - timedelta(days=2))  # older days don't rewind the streak
+        self.assertEqual(self.user.last_active_day, self.today - timedelta(days=1))
+        User.objects.filter(pk=self.user.pk).update(last_active_day=self.today - timedelta(days=2))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.current_streak, self.user.active_streak), (1, 0))
+
+    def test_repeated_progress_updates_share_one_row_per_day(self):
+        course = Course.objects.create(
+            title='Python', description='Basics', category='coding', skill_level='beginner', duration=10,
+            provider='Hub')
+        enrollment = Enrollment.objects.create(user=self.user, course=course)
+        for progress in (10, 30, 20):
+            enrollment.progress = progress
+            enrollment.save()
+        ProgressDay.record(self.user, course.pk, 20, 40, day=self.today - timedelta(days=1))
+        today = ProgressDay.objects.get(user=self.user, day=self.today)
+        self.assertEqual(ProgressDay.objects.filter(user=self.user).count(), 2)
+        self.assertEqual((today.updates, today.progress_gained, today.course_progress), (3, 30, {str(course.pk): 20}))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.current_streak, self.user.last_active_day), (1, self.today))
+
+
+class ChatConsumerTests(TransactionTestCase):
+    # The consumer reads the database from channels' worker threads
+
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', 'creator@example.com', 'pw')
+        self.member = User.objects.create_user('member', 'member@example.com', 'pw')
+        self.outsider = User.objects.create_user('outsider', 'outsider@example.com', 'pw')
+        self.group = StudyGroup.objects.create(name='Private', description='Study', creator=self.creator, is_private=True)
+        self.group.add_member(self.member)
+        self.application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+        patcher = mock.patch('hub.presence._presence', MemoryPresence())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def communicator(self, user=None, token=None):
+        if user is not None:
+            token = AccessToken.for_user(user)
+        path = f'/ws/study-groups/{self.group.pk}/' + (f'?token={token}' if token else '')
+        return WebsocketCommunicator(self.application, path)
+
+    async def test_connection_needs_a_valid_token(self):
+        for communicator in (self.communicator(), self.communicator(token='not-a-jwt')):
+            self.assertEqual(await communicator.connect(), (False, 4401))
+
+    async def test_private_group_rejects_non_members(self):
+        self.assertEqual(await self.communicator(self.outsider).connect(), (False, 4403))
+
+    async def test_new_message_is_pushed_to_everyone_in_the_group(self):
+        creator, member = self.communicator(self.creator), self.communicator(self.member)
+        self.assertTrue((await creator.connect())[0])
+        await creator.receive_json_from()  # presence: creator
+        self.assertTrue((await member.connect())[0])
+        for communicator in (creator, member):
+            presence = await communicator.receive_json_from()
+            self.assertEqual({user['username'] for user in presence['online']}, {'creator', 'member'})
+
+        message = await sync_to_async(GroupMessage.objects.create)(group=self.group, sender=self.member, message='hello')
+        await sync_to_async(broadcast_group_message)(message)
+        for communicator in (creator, member):
+            pushed = await communicator.receive_json_from()
+            self.assertEqual((pushed['type'], pushed['message']['id'], pushed['message']['message']),
+                             ('message', message.pk, 'hello'))
+        await member.disconnect()
+        presence = await creator.receive_json_from()
+        self.assertEqual([user['username'] for user in presence['online']], ['creator'])
+        await creator.disconnect()
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.notifications = [Notification.objects.create(user=self.user, title=f'n{i}', message='Hi') for i in range(3)]
+        self.user.refresh_from_db()
+        # The stream closes its connection once it starts waiting, which would end the test's transaction
+        for patcher in (mock.patch('hub.notifications.connection'), mock.patch('hub.notifications.KEEPALIVE_SECONDS', 0.05)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_stream_opens_with_the_unread_count(self):
+        frames = notification_stream(self.user)
+        self.assertEqual(next(frames), 'retry: 3000\n\n')
+        self.assertEqual(next(frames), 'event: unread_count\ndata: {"unread_count": 3}\n\n')
+        self.assertEqual(next(frames), ': keepalive\n\n')  # nothing is replayed without Last-Event-ID
+        frames.close()
+
+    def test_last_event_id_replays_missed_notifications(self):
+        request = APIRequestFactory().get('/api/notifications/stream/', HTTP_LAST_EVENT_ID=str(self.notifications[0].pk))
+        force_authenticate(request, user=self.user)
+        response = NotificationViewSet.as_view({'get': 'stream'})(request)
+        frames = iter(response.streaming_content)
+        replayed = [next(frames).decode() for _ in range(4)][2:]
+        response.close()
+        self.assertEqual([frame.split('\n')[0] for frame in replayed],
+                         [f'id: {notification.pk}' for notification in self.notifications[1:]])
+        self.assertIn('"unread_delta": 0', replayed[0])
+
+    def test_marking_read_publishes_one_read_delta(self):
+        frames = notification_stream(self.user)
+        next(frames), next(frames)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        notification = self.notifications[0]
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(client.post(f'/api/notifications/{notification.pk}/mark_read/').status_code, 200)
+        self.assertEqual(next(frames), f'event: read\ndata: {{"ids": [{notification.pk}], "unread_delta": -1}}\n\n')
+        self.assertEqual(next(frames), ': keepalive\n\n')
+        frames.close()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.unread_notifications, 2)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.group = StudyGroup.objects.create(name='Group', description='Study', creator=self.alice)
+        self.other_group = StudyGroup.objects.create(name='Other', description='Study', creator=self.alice)
+        for group in (self.group, self.other_group):
+            group.add_member(self.alice)
+            group.add_member(self.bob)
+        self.ids = [GroupMessage.objects.create(group=self.group, sender=self.alice, message=f'm{i}').id for i in range(3)]
+        GroupMessage.objects.create(group=self.group, sender=self.bob, message='reply')
+        self.client = APIClient()
+
+    def unread(self, user, group=None):
+        return GroupReadCursor.objects.get(user=user, group=group or self.group).unread_count
+
+    def test_messages_count_as_unread_for_everyone_but_the_sender(self):
+        self.assertEqual((self.unread(self.alice), self.unread(self.bob)), (1, 3))
+        self.assertEqual(self.unread(self.bob, self.other_group), 0)
+
+    def test_marking_the_same_message_read_twice_only_counts_once(self):
+        self.client.force_authenticate(self.bob)
+        url = f'/api/study-groups/{self.group.pk}/mark_read/'
+        for _ in range(2):
+            response = self.client.post(url, {'message_id': self.ids[1]}, format='json')
+            self.assertEqual(response.data, {'last_read_message_id': self.ids[1], 'unread_count': 1})
+        # An older id never moves the cursor back
+        self.assertEqual(self.client.post(url, {'message_id': self.ids[0]}, format='json').data['unread_count'], 1)
+        self.assertEqual(self.client.post(url).data['unread_count'], 0)
+        self.assertEqual(self.unread(self.bob), 0)
+
+    def test_unread_counts_lists_only_groups_with_unread_messages(self):
+        self.client.force_authenticate(self.bob)
+        response = self.client.get('/api/unread-counts/')
+        self.assertEqual(response.data['groups'], {str(self.group.pk): 3})
+        self.assertEqual(response.data['notifications'], self.bob.unread_notifications)
+        self.client.post(f'/api/study-groups/{self.group.pk}/mark_read/')
+        self.assertEqual(self.client.get('/api/unread-counts/').data['groups'], {})
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner', 'learner@example.com', 'pw')
+        self.group = StudyGroup.objects.create(name='Group', description='Study', creator=self.user)
+        self.now = timezone.now()
+
+    def send(self, count, days_ago):
+        ids = [GroupMessage.objects.create(group=self.group, sender=self.user, message=f'm{i}').id for i in range(count)]
+        GroupMessage.objects.filter(id__in=ids).update(created_at=self.now - timedelta(days=days_ago))
+        return ids
+
+    def all_pages(self, limit):
+        ids, before_id = [], None
+        while True:
+            page = [message.id for message in message_page(self.group.pk, before_id, limit)]
+            if not page:
+                return ids
+            ids = page + ids
+            before_id = page[0]
+
+    def test_paging_crosses_from_hot_rows_into_archived_segments(self):
+        ids = self.send(4, 100) + self.send(3, 65) + self.send(4, 1)
+        stats = archive_messages(timedelta(days=30))
+        self.assertEqual((stats['messages'], stats['segments']), (7, 2))
+        self.assertEqual(list(GroupMessage.objects.filter(group=self.group).values_list('id', flat=True)), ids[7:])
+        for limit in (1, 3, 5, 50):
+            self.assertEqual(self.all_pages(limit), ids)
+        page = message_page(self.group.pk, ids[8], 3)
+        self.assertEqual([message.id for message in page], ids[5:8])
+        self.assertEqual(page[0].message, 'm1')  # archived rows come back as messages with their text
+
+    def test_later_archive_run_appends_to_the_open_segment(self):
+        first = self.send(3, 40)
+        archive_messages(timedelta(days=30))
+        later = self.send(2, 40)  # same month, newer ids
+        stats = archive_messages(timedelta(days=30))
+        self.assertEqual((stats['messages'], stats['segments']), (2, 0))
+        segment = GroupMessageSegment.objects.get(group=self.group)
+        self.assertEqual((segment.message_count, segment.first_message_id, segment.last_message_id),
+                         (5, first[0], later[-1]))
+        self.assertEqual(self.all_pages(2), first + later)
+
+
+class AnnouncementTests(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user('creator', 'creator@example.com', 'pw')
+        self.group = StudyGroup.objects.create(name='Group', description='Study', creator=self.creator, max_members=10)
+        self.members = [User.objects.create_user(f'member{i}', f'member{i}@example.com', 'pw') for i in range(5)]
+        for member in self.members:
+            self.group.add_member(member)
+        self.group.refresh_from_db()
+
+    def test_push_delivers_in_batches_and_resumes_after_a_failure(self):
+        announcement = create_announcement(self.creator, self.group, 'group', 'Exam', 'Friday', mode='push')
+        deliver = fanout._deliver
+        calls = []
+
+        def flaky_deliver(announcement, user_ids):
+            calls.append(list(user_ids))
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            deliver(announcement, user_ids)
+
+        with mock.patch('hub.fanout._deliver', flaky_deliver), self.assertRaises(RuntimeError):
+            fan_out(announcement, batch_size=2)
+        announcement.refresh_from_db()
+        self.assertEqual((announcement.status, announcement.delivered, announcement.last_user_id),
+                         ('failed', 2, self.members[1].pk))
+
+        with mock.patch('hub.fanout.BATCH_SIZE', 2):
+            fan_out_announcement(announcement.pk)
+        announcement.refresh_from_db()
+        self.assertEqual((announcement.status, announcement.delivered), ('done', 5))
+        self.assertEqual(sorted(Notification.objects.filter(title='Exam').values_list('user_id', flat=True)),
+                         [member.pk for member in self.members])
+        self.assertEqual(set(User.objects.filter(pk__in=[m.pk for m in self.members]).values_list(
+            'unread_notifications', flat=True)), {1})
+
+    @override_settings(ANNOUNCEMENT_PULL_THRESHOLD=3)
+    def test_large_audiences_default_to_pull_mode(self):
+        announcement = create_announcement(self.creator, self.group, 'group', 'Exam', 'Friday')
+        self.assertEqual((announcement.mode, announcement.status, announcement.total_recipients), ('pull', 'done', 5))
+        self.assertFalse(Notification.objects.filter(title='Exam').exists())
+        member = self.members[0]
+        self.assertEqual([a.pk for a in announcement_feed(member)], [announcement.pk])
+        self.assertEqual(unread_announcements(member), 1)
+        mark_announcements_read(member, [announcement.pk])
+        self.assertEqual((unread_announcements(member), unread_announcements(self.members[1])), (0, 1))
+        self.assertFalse(announcement_feed(self.creator).exists())  # the creator is not a member
+        with override_settings(ANNOUNCEMENT_PULL_THRESHOLD=5):
+            self.assertEqual(create_announcement(self.creator, self.group, 'group', 'Exam', 'Friday').mode, 'push')
+
+    def test_only_group_creators_and_admins_may_announce(self):
+        course = Course.objects.create(
+            title='Python', description='Basics', category='coding', skill_level='beginner', duration=10,
+            provider='Hub')
+        admin = User.objects.create_user('admin', 'admin@example.com', 'pw', role='admin')
+        client = APIClient()
+
+        def announce(user, audience_type, audience_id):
+            client.force_authenticate(user)
+            return client.post('/api/announcements/', {
+                'audience_type': audience_type, 'audience_id': audience_id, 'title': 'Exam', 'message': 'Friday',
+            }, format='json').status_code
+
+        self.assertEqual(announce(self.members[0], 'group', self.group.pk), 403)
+        self.assertEqual(announce(self.creator, 'course', course.pk), 403)
+        self.assertEqual(announce(self.creator, 'group', self.group.pk), 201)
+        self.assertEqual(announce(admin, 'course', course.pk), 201)
+        self.assertEqual(announce(admin, 'course', 999999), 400)
+        self.assertEqual(Announcement.objects.count(), 2)
+
+
+class FreeCourseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(catalog, '_catalog', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.courses = catalog.get_catalog().courses  # provider by provider, as served
+        self.assertEqual(len(self.courses), len(catalog.load_courses()))
+
+    def get(self, **params):
+        headers = params.pop('headers', {})
+        return free_courses(APIRequestFactory().get('/api/free-courses/', params, **headers))
+
+    def ids(self, response):
+        return [course['id'] for course in response.data['results']]
+
+    def test_search_matches_substrings_of_title_or_description(self):
+        expected = [course['id'] for course in self.courses
+                    if 'script' in course['title'].lower() or 'script' in course['description'].lower()]
+        self.assertTrue(any('JavaScript' in course['description'] for course in self.courses if course['id'] in expected))
+        self.assertEqual(self.ids(self.get(search='SCRIPT', page_size=100)), expected)
+        self.assertEqual(self.ids(self.get(search='no such course', page_size=100)), [])
+
+    def test_filters_combine(self):
+        response = self.get(provider='edx', category='CODING', page_size=100)
+        self.assertEqual(self.ids(response), [course['id'] for course in self.courses
+                                              if course['provider'] == 'edX' and course['category'] == 'coding'])
+        self.assertTrue(response.data['results'])
+
+    def test_pages_cover_the_catalog_once(self):
+        first = self.get(page_size=20)
+        self.assertEqual(first.data['count'], len(self.courses))
+        ids, page = [], 1
+        while True:
+            response = self.get(page=page, page_size=20)
+            ids += self.ids(response)
+            if not response.data['next']:
+                break
+            page += 1
+        self.assertEqual(ids, [course['id'] for course in self.courses])
+        self.assertEqual(self.get(page=page + 1, page_size=20).status_code, 404)
+
+    def test_matching_etag_returns_304(self):
+        response = self.get(search='data', page_size=5)
+        etag = response['ETag']
+        self.assertEqual(response.status_code, 200)
+        not_modified = self.get(search='data', page_size=5, headers={'HTTP_IF_NONE_MATCH': f'"other", {etag}'})
+        self.assertEqual((not_modified.status_code, not_modified['ETag']), (304, etag))
+        self.assertNotEqual(self.get(search='data', page_size=6)['ETag'], etag)
+        self.assertEqual(self.get(search='DATA', page_size=5)['ETag'], etag)
+
+    async def test_async_route_answers_304(self):
+        client = AsyncClient()
+        response = await client.get('/api/free-courses/', {'provider': 'Coursera'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(course['provider'] == 'Coursera' for course in response.json()['results']))
+        response = await client.get('/api/free-courses/', {'provider': 'Coursera'}, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+class DedupeTests(TestCase):
+    DESCRIPTION = 'Learn variables, loops, functions and data structures by building small programs in Python.'
+
+    def course(self, title, description='', enrolled=0, provider='Hub'):
+        course = Course.objects.create(title=title, description=description, category='coding',
+                                       skill_level='beginner', duration=10, provider=provider)
+        Course.objects.filter(pk=course.pk).update(enrolled_count=enrolled)
+        return course
+
+    def test_courses_without_shingles_never_cluster(self):
+        signatures = np.array([
+            signature('Python Programming Basics', self.DESCRIPTION, ''),
+            signature('Python programming basics!', self.DESCRIPTION, ''),
+            signature('Watercolour Painting', 'Mix colours and paint landscapes.', ''),
+            signature('The', '', ''),
+            signature('Of the', '', ''),
+        ])
+        self.assertEqual(duplicate_clusters(signatures), [[0, 1]])
+        # Nor through the exact title key, which is empty for a title of stop words
+        self.assertEqual(duplicate_clusters(signatures, exact_keys=(['a', 'b', 'c', '', ''],)), [[0, 1]])
+
+    def test_most_enrolled_internal_course_is_canonical(self):
+        less = self.course('Python Programming Basics', self.DESCRIPTION, enrolled=10)
+        more = self.course('Python programming basics', self.DESCRIPTION, enrolled=50)
+        empty = [self.course('The', enrolled=5), self.course('Of the', enrolled=5)]
+        free = [
+            {'id': 'free_python', 'provider': 'edX', 'title': 'Python Programming Basics', 'description': self.DESCRIPTION},
+            {'id': 'free_art_1', 'provider': 'Udacity', 'title': 'Watercolour Painting', 'description': 'Paint.'},
+            {'id': 'free_art_2', 'provider': 'Udacity', 'title': 'Watercolour painting', 'description': 'Colours.'},
+            {'id': 'free_empty', 'provider': 'edX', 'title': 'The', 'description': ''},
+        ]
+        self.assertEqual(dedupe_courses(free), {'courses': 1, 'free_courses': 2})
+        self.assertEqual(dict(Course.objects.filter(duplicate_of__isnull=False).values_list('pk', 'duplicate_of')),
+                         {less.pk: more.pk})
+        self.assertEqual(sorted(FreeCourseDuplicate.objects.values_list('free_course_id', 'course', 'duplicate_of_free_id')),
+                         [('free_art_2', None, 'free_art_1'), ('free_python', more.pk, '')])
+        self.assertFalse(Course.objects.filter(pk__in=[course.pk for course in empty], duplicate_of__isnull=False).exists())
+
+        # Enrollments move the canonical choice on the next run
+        Course.objects.filter(pk=less.pk).update(enrolled_count=100)
+        dedupe_courses(free)
+        self.assertEqual(dict(Course.objects.filter(duplicate_of__isnull=False).values_list('pk', 'duplicate_of')),
+                         {more.pk: less.pk})
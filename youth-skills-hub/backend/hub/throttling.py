@@ -0,0 +1,176 @@
+"""
+Token-bucket rate limits keyed by user and action.
+
+Each (scope, user) pair owns a bucket of ``capacity`` tokens that refills
+evenly over the rate's period; a request spends one token or is rejected.
+Buckets live in the ``RATELIMIT_USE_CACHE`` cache. With a Redis cache the
+refill-and-take runs as one Lua script; any other backend serializes updates
+to a bucket with a short ``cache.add`` lock; a request that cannot get the
+lock is asked to retry after LOCK_RETRY seconds rather than let through.
+
+``ThrottleMiddleware`` checks the routes in ``settings.THROTTLE_ROUTES`` before
+sessions, authentication or the view run. The user id comes from the JWT's
+signed claims, so a rejection never touches the database.
+"""
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from django_ratelimit.exceptions import Ratelimited
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+LOCK_ATTEMPTS = 20
+LOCK_WAIT = 0.005
+LOCK_RETRY = 1
+
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry = (1 - tokens) / refill
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return tostring(retry)
+"""
+
+
+def parse_rate(rate):
+    """'20/min' -> (capacity 20, refill 20/60 tokens per second)"""
+    count, period = rate.split('/')
+    seconds = PERIODS[period.strip().lower()]
+    count = int(count)
+    return count, count / seconds
+
+
+class TokenBucket:
+    def __init__(self, scope, rate, cache=None):
+        self.scope = scope
+        self.capacity, self.refill = parse_rate(rate)
+        # Long enough for an idle bucket to refill completely, after which it carries no information
+        self.ttl = int(self.capacity / self.refill) + 1
+        self.cache = cache or caches[getattr(settings, 'RATELIMIT_USE_CACHE', 'default')]
+        self._script = None
+
+    def key(self, ident):
+        return f"{getattr(settings, 'RATELIMIT_CACHE_PREFIX', 'rl:')}{self.scope}:{ident}"
+
+    def take(self, ident):
+        """Spend one token; returns 0 if allowed, otherwise seconds until a token is available"""
+        client = _redis_client(self.cache)
+        if client is not None:
+            if self._script is None:
+                self._script = client.register_script(TAKE_SCRIPT)
+            retry = self._script(
+                keys=[self.cache.make_key(self.key(ident))],
+                args=[self.capacity, self.refill, time.time(), self.ttl],
+            )
+            return float(retry)
+        return self._take_with_lock(ident)
+
+    def _take_with_lock(self, ident):
+        key = self.key(ident)
+        lock = f'{key}:lock'
+        for _ in range(LOCK_ATTEMPTS):
+            if self.cache.add(lock, 1, timeout=1):
+                break
+            time.sleep(LOCK_WAIT)
+        else:
+            return LOCK_RETRY  # bucket is hot with contention; letting the request through would bypass the limit
+        try:
+            now = time.time()
+            tokens, ts = self.cache.get(key) or (self.capacity, now)
+            tokens = min(self.capacity, tokens + max(0, now - ts) * self.refill)
+            retry = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry = (1 - tokens) / self.refill
+            self.cache.set(key, (tokens, now), timeout=self.ttl)
+            return retry
+        finally:
+            self.cache.delete(lock)
+
+
+def _redis_client(cache):
+    """Raw redis-py client behind Django's RedisCache or django-redis, else None"""
+    if hasattr(cache, '_cache') and hasattr(cache._cache, 'get_client'):
+        return cache._cache.get_client(write=True)
+    if hasattr(cache, 'client') and hasattr(cache.client, 'get_client'):
+        return cache.client.get_client(write=True)
+    return None
+
+
+def user_id_from_jwt(request):
+    """The user id claim of a valid bearer access token, checked by signature only"""
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(header) != 2 or header[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(header[1]).get(jwt_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+class ThrottleMiddleware:
+    # Async-capable so async views keep a fully async stack under ASGI; sync middleware would pin a thread per request
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.routes = [
+            (method, re.compile(pattern), scope)
+            for method, pattern, scope in getattr(settings, 'THROTTLE_ROUTES', [])
+        ]
+        self.buckets = {scope: TokenBucket(scope, rate) for scope, rate in getattr(settings, 'THROTTLE_RATES', {}).items()}
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.reject(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # Only throttled routes touch the cache; everything else passes straight through
+        if getattr(settings, 'RATELIMIT_ENABLE', True) and self.match(request):
+            response = await sync_to_async(self.reject)(request)
+            if response:
+                return response
+        return await self.get_response(request)
+
+    def reject(self, request):
+        """The 429 response if the request's route is throttled and its user's bucket is empty, else None"""
+        if getattr(settings, 'RATELIMIT_ENABLE', True):
+            scope = self.match(request)
+            if scope:
+                user_id = user_id_from_jwt(request)
+                # Requests without a valid token are left for authentication to reject
+                if user_id is not None:
+                    retry_after = self.buckets[scope].take(user_id)
+                    if retry_after:
+                        request.throttle_scope = scope
+                        request.throttle_retry_after = retry_after
+                        return import_string(settings.RATELIMIT_VIEW)(request, Ratelimited())
+        return None
+
+    def match(self, request):
+        for method, pattern, scope in self.routes:
+            if request.method == method and pattern.match(request.path_info) and scope in self.buckets:
+                return scope
+        return None
@@ -0,0 +1,162 @@
+"""
+Chunked, resumable uploads of study-group file attachments.
+
+A client declares the file (name, size, SHA-256) and then sends its bytes in
+any number of ``PUT`` requests, each starting at the ``Upload-Offset`` the
+server last acknowledged. Chunks are streamed straight to a partial file on
+disk, so memory use does not depend on file or chunk size. After a dropped
+connection the client asks for the upload's status and continues from
+``received``. When the last byte arrives the hash is checked, a 'file'
+GroupMessage is created and the file is moved into place.
+
+Attachments are kept under FILE_UPLOAD_ROOT, outside MEDIA_ROOT, and are only
+served by the upload's download action as attachments. The files come from
+users, so a browser must never render one inline as HTML.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import FileUpload, GroupMessage
+
+READ_SIZE = 64 * 1024
+PARTIAL_DIR = 'partial'
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_upload_size():
+    return getattr(settings, 'FILE_UPLOAD_MAX_SIZE', 50 * 1024 * 1024)
+
+
+def upload_root():
+    return getattr(settings, 'FILE_UPLOAD_ROOT', os.path.join(settings.BASE_DIR, 'group_files'))
+
+
+def partial_path(upload):
+    return os.path.join(upload_root(), PARTIAL_DIR, f'{upload.upload_id}.part')
+
+
+def stored_path(upload):
+    """Where a completed upload's file lives"""
+    return os.path.join(upload_root(), str(upload.group_id), upload.upload_id.hex[:16], upload.file_name)
+
+
+def start_upload(user, group, file_name, size, sha256):
+    file_name = get_valid_filename(os.path.basename(file_name or ''))[-100:]
+    if not file_name:
+        raise UploadError('file_name is required')
+    if size <= 0 or size > max_upload_size():
+        raise UploadError(f'size must be between 1 and {max_upload_size()} bytes', status=413)
+    sha256 = (sha256 or '').lower()
+    if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+        raise UploadError('sha256 must be a hex digest')
+    upload = FileUpload.objects.create(user=user, group=group, file_name=file_name, size=size, sha256=sha256)
+    os.makedirs(os.path.dirname(partial_path(upload)), exist_ok=True)
+    open(partial_path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length, base_url=''):
+    """
+    Append ``length`` bytes read from ``stream`` at ``offset``.
+
+    The offset must equal what the server has already stored; anything else is
+    a stale or duplicate chunk and is refused with the current offset so the
+    client can resync. Returns the upload, completed if this was the last chunk.
+    """
+    if upload.status != 'uploading':
+        raise UploadError('Upload is already complete', status=409)
+    if offset != upload.received:
+        raise UploadError(f'Expected Upload-Offset {upload.received}', status=409)
+    if length is None or length < 0 or offset + length > upload.size:
+        raise UploadError(f'Chunk must not extend past {upload.size} bytes', status=413)
+
+    written = 0
+    with open(partial_path(upload), 'r+b') as part:
+        part.seek(offset)
+        part.truncate()  # drop whatever a broken earlier attempt left past the acknowledged offset
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            part.write(data)
+            written += len(data)
+
+    # Only the request that started at the stored offset may advance it
+    if not FileUpload.objects.filter(pk=upload.pk, received=offset).update(
+            received=offset + written, updated_at=timezone.now()):
+        raise UploadError('Another chunk for this upload was stored concurrently', status=409)
+    upload.received = offset + written
+    if written < length:
+        raise UploadError(f'Connection closed after {written} bytes; resume from {upload.received}', status=400)
+    if upload.received == upload.size:
+        return complete_upload(upload, base_url)
+    return upload
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_upload(upload, base_url=''):
+    path = partial_path(upload)
+    if file_sha256(path) != upload.sha256:
+        # Something was corrupted in transit; start the bytes over rather than keep a bad file
+        open(path, 'wb').close()
+        FileUpload.objects.filter(pk=upload.pk).update(received=0)
+        upload.received = 0
+        raise UploadError('SHA-256 mismatch; upload restarted from offset 0', status=422)
+
+    destination = stored_path(upload)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # The file only moves once the message exists, and moves back if the commit fails,
+    # so a retried final chunk still finds its partial file
+    try:
+        with transaction.atomic():
+            upload.message = GroupMessage.objects.create(
+                group_id=upload.group_id,
+                sender_id=upload.user_id,
+                message=upload.file_name,
+                message_type='file',
+                file_url=base_url + reverse('upload-download', kwargs={'upload_id': upload.upload_id}),
+                file_name=upload.file_name,
+            )
+            upload.status = 'complete'
+            upload.save(update_fields=['message', 'status', 'received', 'updated_at'])
+            os.replace(path, destination)
+    except Exception:
+        if os.path.exists(destination) and not os.path.exists(path):
+            os.replace(destination, path)
+        upload.message = None
+        upload.status = 'uploading'
+        raise
+    return upload
+
+
+def purge_stale_uploads(older_than=timedelta(days=1)):
+    """Delete unfinished uploads that have not received a chunk for ``older_than``; returns how many"""
+    stale = FileUpload.objects.filter(status='uploading', updated_at__lt=timezone.now() - older_than)
+    count = 0
+    for upload in stale.iterator():
+        try:
+            os.remove(partial_path(upload))
+        except FileNotFoundError:
+            pass
+        upload.delete()
+        count += 1
+    return count
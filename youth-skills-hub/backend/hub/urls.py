@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, CourseViewSet, EnrollmentViewSet, MentorshipViewSet, StudyGroupViewSet, PortfolioViewSet, BadgeViewSet, UserBadgeViewSet, NotificationViewSet, EventViewSet, GroupMessageViewSet, leaderboard, public_stats, free_courses
+from .views import UserViewSet, CourseViewSet, EnrollmentViewSet, MentorshipViewSet, StudyGroupViewSet, PortfolioViewSet, BadgeViewSet, UserBadgeViewSet, NotificationViewSet, EventViewSet, GroupMessageViewSet, FileUploadViewSet, AnnouncementViewSet, BackgroundJobViewSet, leaderboard, leaderboard_rank, unread_counts, public_stats, free_courses, analytics_funnels, pubsub_metrics, health, free_courses_async, group_messages_async, notification_stream_async, study_group_messages_async, with_sync_fallback
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -14,10 +15,30 @@ router.register(r'user-badges', UserBadgeViewSet)
 router.register(r'notifications', NotificationViewSet)
 router.register(r'events', EventViewSet)
 router.register(r'group-messages', GroupMessageViewSet)
+router.register(r'uploads', FileUploadViewSet, basename='upload')
+router.register(r'announcements', AnnouncementViewSet, basename='announcement')
+router.register(r'jobs', BackgroundJobViewSet, basename='job')
 
-urlpatterns = [
+urlpatterns = []
+
+if settings.ASYNC_VIEWS:
+    # Ahead of the router so these routes reach the async views first
+    drf_views = {url.name: url.callback for url in router.urls}
+    urlpatterns += [
+        path('study-groups/<int:pk>/messages/', with_sync_fallback(study_group_messages_async, drf_views['studygroup-messages'])),
+        path('group-messages/', with_sync_fallback(group_messages_async, drf_views['groupmessage-list'])),
+        path('notifications/stream/', notification_stream_async),
+        path('free-courses/', free_courses_async),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
     path('leaderboard/', leaderboard, name='leaderboard'),
+    path('leaderboard/me/', leaderboard_rank, name='leaderboard_rank'),
+    path('unread-counts/', unread_counts, name='unread_counts'),
     path('public-stats/', public_stats, name='public_stats'),
     path('free-courses/', free_courses, name='free_courses'),
+    path('analytics/funnels/', analytics_funnels, name='analytics_funnels'),
+    path('pubsub/metrics/', pubsub_metrics, name='pubsub_metrics'),
+    path('health/', health, name='health'),
 ]
@@ -2,18 +2,40 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
-from django.core.mail import send_mail
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import FileResponse, HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from .models import User, Course, Enrollment, Mentorship, StudyGroup, Portfolio, Badge, UserBadge, Notification, Event, GroupMessage
-from .serializers import UserSerializer, UserRegistrationSerializer, CourseSerializer, EnrollmentSerializer, MentorshipSerializer, StudyGroupSerializer, PortfolioSerializer, BadgeSerializer, UserBadgeSerializer, NotificationSerializer, EventSerializer, GroupMessageSerializer
+from datetime import timedelta
+from functools import wraps
+import asyncio
+import math
+from .models import User, Course, Enrollment, Mentorship, StudyGroup, Portfolio, Badge, UserBadge, Notification, Event, GroupMessage, GroupReadCursor, ProgressDay, FileUpload, Announcement, FreeCourseDuplicate, BackgroundJob
+from .analytics import get_funnel_report
+from .catalog import aget_catalog, get_catalog
+from .archive import message_page
+from .auth import QueryStringJWTAuthentication, get_user_for_request
+from .consumers import broadcast_group_message
+from .jobs import JobError, cancel_job, resume_job, start_job
+from .fanout import announcement_feed, audience_target, create_announcement, mark_announcements_read, unread_announcements
+from .dbpool import pooled
+from .notifications import EventStreamRenderer, anotification_stream, notification_stream, publish_read
+from .pubsub import get_broker, group_messages_topic
+from .leaderboard import TIMEFRAMES, get_leaderboard, period_start
+from .search import MessageSearchResults
+from .uploads import UploadError, start_upload, stored_path, write_chunk
+from .serializers import UserSerializer, UserRegistrationSerializer, CourseSerializer, EnrollmentSerializer, MentorshipSerializer, StudyGroupSerializer, PortfolioSerializer, BadgeSerializer, UserBadgeSerializer, NotificationSerializer, EventSerializer, GroupMessageSerializer, GroupMessageSearchSerializer, ProgressDaySerializer, FileUploadSerializer, AnnouncementSerializer, AnnouncementFeedSerializer, BackgroundJobSerializer
+from .ml_model import CourseRecommender
 # Temporarily comment out ML imports to test
-# from .ml_model import MentorMatcher, CourseRecommender, award_badges
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+# from .ml_model import MentorMatcher, award_badges
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -60,6 +82,21 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def progress_history(self, request):
+        try:
+            days = min(max(int(request.query_params.get('days', 30)), 1), 365)
+        except ValueError:
+            return Response({'error': 'days must be an integer'}, status=400)
+        since = timezone.localdate() - timedelta(days=days - 1)
+        history = ProgressDay.objects.filter(user=request.user, day__gte=since)
+        return Response({
+            'current_streak': request.user.active_streak,
+            'longest_streak': request.user.longest_streak,
+            'last_active_day': request.user.last_active_day,
+            'days': ProgressDaySerializer(history, many=True).data,
+        })
+
 class CourseViewSet(viewsets.ModelViewSet):
     queryset = Course.objects.filter(is_active=True)
     serializer_class = CourseSerializer
@@ -78,6 +115,8 @@ class CourseViewSet(viewsets.ModelViewSet):
         if search:
             queryset = queryset.filter(
                 title__icontains=search) | queryset.filter(description__icontains=search)
+        if self.request.query_params.get('collapse') == '1':
+            queryset = queryset.filter(duplicate_of__isnull=True)
 
         return queryset
 
@@ -88,7 +127,6 @@ class CourseViewSet(viewsets.ModelViewSet):
             user=request.user, course=course)
 
         if created:
-            course.update_enrolled_count()
             return Response({'message': 'Enrolled successfully'})
         return Response({'message': 'Already enrolled'})
 
@@ -100,8 +138,7 @@ class CourseViewSet(viewsets.ModelViewSet):
             progress = request.data.get('progress', 0)
             enrollment.progress = progress
             if progress == 100:
-                enrollment.completed = True
-                # award_badges(request.user)  # Check for badge awards
+                enrollment.completed = True  # badges are checked by the enrollment_completed task
             enrollment.save()
             return Response(EnrollmentSerializer(enrollment).data)
         except Enrollment.DoesNotExist:
@@ -109,9 +146,7 @@ class CourseViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def recommendations(self, request):
-        # recommender = CourseRecommender()
-        # recommended_courses = recommender.recommend_courses(request.user)
-        recommended_courses = Course.objects.filter(is_active=True)[:5]
+        recommended_courses = CourseRecommender().recommend_courses(request.user)
         serializer = self.get_serializer(recommended_courses, many=True)
         return Response(serializer.data)
 
@@ -129,9 +164,7 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
         progress = request.data.get('progress', 0)
         enrollment.progress = progress
         if progress == 100:
-            enrollment.completed = True
-            enrollment.user.points += 10  # Award points
-            enrollment.user.save()
+            enrollment.completed = True  # Enrollment.save() queues the completion points and badge check
         enrollment.save()
         return Response(EnrollmentSerializer(enrollment).data)
 
@@ -163,7 +196,6 @@ class MentorshipViewSet(viewsets.ModelViewSet):
     def complete_session(self, request, pk=None):
         mentorship = self.get_object()
         mentorship.complete_session()
-        # award_badges(request.user)  # Check for badge awards
         return Response(MentorshipSerializer(mentorship).data)
 
 class StudyGroupViewSet(viewsets.ModelViewSet):
@@ -183,26 +215,59 @@ class StudyGroupViewSet(viewsets.ModelViewSet):
         group = self.get_object()
         if group.members.filter(id=request.user.id).exists():
             return Response({'message': 'Already a member'})
-        if group.members.count() >= group.max_members:
+        if not group.add_member(request.user):
             return Response({'error': 'Group is full'}, status=400)
-        group.members.add(request.user)
         return Response({'message': 'Joined group'})
 
     @action(detail=True, methods=['post'])
     def leave(self, request, pk=None):
         group = self.get_object()
-        if not group.members.filter(id=request.user.id).exists():
+        if not group.remove_member(request.user):
             return Response({'error': 'Not a member of this group'}, status=400)
-        group.members.remove(request.user)
         return Response({'message': 'Left group'})
 
+    @action(detail=True, methods=['post'])
+    def mark_read(self, request, pk=None):
+        group = self.get_object()
+        message_id = request.data.get('message_id')
+        try:
+            message_id = int(message_id) if message_id is not None else None
+        except (TypeError, ValueError):
+            return Response({'error': 'message_id must be an integer'}, status=400)
+        cursor = GroupReadCursor.mark_read(request.user, group, message_id)
+        return Response({'last_read_message_id': cursor.last_read_message_id, 'unread_count': cursor.unread_count})
+
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
         group = self.get_object()
-        messages = GroupMessage.objects.filter(group=group)
-        serializer = GroupMessageSerializer(messages, many=True)
+        if not can_access_group(group, request.user):
+            return Response({'error': 'Not a member of this group'}, status=403)
+        if 'after_id' in request.query_params:
+            return poll_group_messages(request, group.id)
+        # Pages back through history, including archived months: pass the smallest id seen as before_id
+        try:
+            before_id = request.query_params.get('before_id')
+            before_id = int(before_id) if before_id is not None else None
+            limit = min(int(request.query_params.get('limit', MESSAGE_PAGE_SIZE)), NEW_MESSAGES_LIMIT)
+        except ValueError:
+            return Response({'error': 'before_id and limit must be numbers'}, status=400)
+        messages = message_page(group.id, before_id, max(limit, 1))
+        serializer = GroupMessageSerializer(messages, many=True, context={'request': request})
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def search(self, request, pk=None):
+        """Ranked full-text search over this group's messages: ?q=terms&page=N"""
+        group = self.get_object()
+        if not can_access_group(group, request.user):
+            return Response({'error': 'Not a member of this group'}, status=403)
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=400)
+        page = self.paginate_queryset(MessageSearchResults(group.id, query))
+        serializer = GroupMessageSearchSerializer(page, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
+
 class PortfolioViewSet(viewsets.ModelViewSet):
     queryset = Portfolio.objects.all()
     serializer_class = PortfolioSerializer
@@ -250,10 +315,101 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        if not notification.is_read:
+            notification.is_read = True
+            notification.save()
+            transaction.on_commit(lambda: publish_read([notification.id], request.user.id))
         return Response({'message': 'Notification marked as read'})
 
+    @action(detail=False, methods=['get', 'post'])
+    def announcements(self, request):
+        """GET: pull-mode announcements for the user's courses, events and groups. POST {ids}: mark them read"""
+        if request.method == 'POST':
+            ids = request.data.get('ids')
+            if not isinstance(ids, list):
+                return Response({'error': 'ids must be a list'}, status=400)
+            mark_announcements_read(request.user, ids)
+            return Response({'message': 'Announcements marked as read'})
+        page = self.paginate_queryset(announcement_feed(request.user))
+        return self.get_paginated_response(AnnouncementFeedSerializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer],
+            authentication_classes=[JWTAuthentication, QueryStringJWTAuthentication])
+    def stream(self, request):
+        """Server-sent events: new notifications and unread-count deltas for the current user"""
+        return event_stream_response(notification_stream(request.user, last_event_id_for(request)))
+
+class AnnouncementViewSet(viewsets.ModelViewSet):
+    """Announcements to a course's enrollees, an event's attendees or a group's members, with delivery progress"""
+    serializer_class = AnnouncementSerializer
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    def get_queryset(self):
+        if self.request.user.role in ['admin', 'superadmin']:
+            return Announcement.objects.all()
+        return Announcement.objects.filter(created_by=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        target = audience_target(data['audience_type'], data['audience_id'])
+        if target is None:
+            return Response({'error': 'Audience not found'}, status=400)
+        is_admin = request.user.role in ['admin', 'superadmin']
+        if not is_admin and not (data['audience_type'] == 'group' and target.creator_id == request.user.id):
+            return Response({'error': 'Unauthorized'}, status=403)
+        announcement = create_announcement(
+            request.user, target, data['audience_type'], data['title'], data['message'],
+            data.get('action_url', ''), data.get('mode'))
+        return Response(AnnouncementSerializer(announcement).data, status=status.HTTP_201_CREATED)
+
+class BackgroundJobViewSet(viewsets.ModelViewSet):
+    """Admin view of background jobs: start one, follow its progress, cancel or resume it"""
+    serializer_class = BackgroundJobSerializer
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    def get_queryset(self):
+        queryset = BackgroundJob.objects.all()
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        return queryset
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.user.role not in ['admin', 'superadmin']:
+            self.permission_denied(request, message='Unauthorized')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            job = start_job(data['name'], data.get('params'), user=request.user,
+                            chunk_size=data.get('chunk_size'), throttle=data.get('throttle', 0))
+        except JobError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(BackgroundJobSerializer(job).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        try:
+            job = cancel_job(self.get_object())
+        except JobError as e:
+            return Response({'error': str(e)}, status=409)
+        return Response(BackgroundJobSerializer(job).data)
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        try:
+            job = resume_job(self.get_object())
+        except JobError as e:
+            return Response({'error': str(e)}, status=409)
+        return Response(BackgroundJobSerializer(job).data)
+
 class EventViewSet(viewsets.ModelViewSet):
     queryset = Event.objects.filter(is_active=True)
     serializer_class = EventSerializer
@@ -262,11 +418,19 @@ class EventViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def attend(self, request, pk=None):
         event = self.get_object()
-        if event.attendee_count < event.max_attendees:
-            event.attendees.add(request.user)
+        if event.attendees.filter(id=request.user.id).exists():
+            return Response({'message': 'Already attending'})
+        if event.add_attendee(request.user):
             return Response({'message': 'Added to attendees'})
         return Response({'error': 'Event is full'}, status=400)
 
+    @action(detail=True, methods=['post'])
+    def unattend(self, request, pk=None):
+        event = self.get_object()
+        if not event.remove_attendee(request.user):
+            return Response({'error': 'Not attending this event'}, status=400)
+        return Response({'message': 'Removed from attendees'})
+
 class GroupMessageViewSet(viewsets.ModelViewSet):
     queryset = GroupMessage.objects.all()
     serializer_class = GroupMessageSerializer
@@ -275,18 +439,196 @@ class GroupMessageViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         group_id = self.request.query_params.get('group', None)
         if group_id:
-            return GroupMessage.objects.filter(group_id=group_id)
+            return GroupMessage.objects.filter(group_id=group_id).select_related('sender')
         return GroupMessage.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        group_id = request.query_params.get('group', None)
+        if group_id:
+            error = group_access_error(group_id, request.user)
+            if error:
+                return Response(*error)
+            if 'after_id' in request.query_params:
+                return poll_group_messages(request, group_id)
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
+        announce_group_message(serializer.save(sender=self.request.user))
+
+def announce_group_message(message):
+    """Once committed, push a new message to WebSocket clients and wake long-polls"""
+    transaction.on_commit(lambda: broadcast_group_message(message))
+    transaction.on_commit(lambda: get_broker().publish(group_messages_topic(message.group_id), message.id))
+
+def can_access_group(group, user):
+    return not group.is_private or group.creator_id == user.id or group.members.filter(id=user.id).exists()
+
+def group_access_error(group_id, user):
+    """None if ``user`` may read the messages of the group, else the (error, status) to respond with"""
+    try:
+        group = StudyGroup.objects.filter(pk=int(group_id)).only('is_private', 'creator_id').first()
+    except ValueError:
+        return {'error': 'group must be a number'}, 400
+    if group is None:
+        return {'detail': 'Not found.'}, 404
+    if not can_access_group(group, user):
+        return {'error': 'Not a member of this group'}, 403
+    return None
+
+class FileUploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable file attachments for group messages.
+
+    POST /uploads/ with group, file_name, size and sha256 starts an upload;
+    PUT /uploads/{upload_id}/chunk/ with an Upload-Offset header and the raw
+    bytes as the body appends a chunk; GET /uploads/{upload_id}/ returns how
+    many bytes are stored so an interrupted client can resume.
+    GET /uploads/{upload_id}/download/ returns a completed file to anyone who
+    can read its group, always as a download and never rendered inline.
+    """
+    serializer_class = FileUploadSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'upload_id'
+
+    def get_queryset(self):
+        if self.action == 'download':
+            return FileUpload.objects.filter(status='complete').select_related('group')
+        return FileUpload.objects.filter(user=self.request.user).select_related('message__sender')
+
+    def create(self, request):
+        try:
+            group = StudyGroup.objects.get(pk=request.data.get('group'))
+            size = int(request.data.get('size'))
+        except (StudyGroup.DoesNotExist, TypeError, ValueError):
+            return Response({'error': 'A valid group and size are required'}, status=400)
+        if not can_access_group(group, request.user):
+            return Response({'error': 'Not a member of this group'}, status=403)
+        try:
+            upload = start_upload(request.user, group, request.data.get('file_name'), size, request.data.get('sha256'))
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+        return Response(FileUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, upload_id=None):
+        upload = self.get_object()
+        return Response(FileUploadSerializer(upload).data, headers={'Upload-Offset': str(upload.received)})
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, upload_id=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return Response({'error': 'Upload-Offset and Content-Length headers are required'}, status=400)
+        try:
+            # Read the underlying Django request directly so DRF never buffers the body
+            upload = write_chunk(upload, offset, request._request, length, request.build_absolute_uri('/')[:-1])
+        except UploadError as e:
+            return Response({'error': str(e), 'received': upload.received}, status=e.status,
+                            headers={'Upload-Offset': str(upload.received)})
+        if upload.message is not None:
+            announce_group_message(upload.message)
+        return Response(FileUploadSerializer(upload).data, headers={'Upload-Offset': str(upload.received)})
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, upload_id=None):
+        upload = self.get_object()
+        if not can_access_group(upload.group, request.user):
+            raise NotFound()
+        try:
+            file = open(stored_path(upload), 'rb')
+        except FileNotFoundError:
+            raise NotFound()
+        # User content: force a download with a generic type so the browser never renders or sniffs it
+        response = FileResponse(file, as_attachment=True, filename=upload.file_name,
+                                content_type='application/octet-stream')
+        response['X-Content-Type-Options'] = 'nosniff'
+        response['Content-Security-Policy'] = "default-src 'none'; sandbox"
+        return response
+
+LONG_POLL_MAX_WAIT = 30
+NEW_MESSAGES_LIMIT = 200
+MESSAGE_PAGE_SIZE = 50
+
+def new_group_messages(group_id, after_id, wait=0):
+    """
+    Messages in a group with id > after_id, oldest first.
+
+    With ``wait`` set and nothing new yet, block until a message is published
+    for the group or the timeout passes, then query once more.
+    """
+    queryset = GroupMessage.objects.filter(
+        group_id=group_id, id__gt=after_id).select_related('sender').order_by('id')
+    if not wait:
+        return list(queryset[:NEW_MESSAGES_LIMIT])
+    # Subscribe before querying so a message created in between still wakes us
+    with get_broker().subscribe(group_messages_topic(group_id)) as subscription:
+        messages = list(queryset[:NEW_MESSAGES_LIMIT])
+        if not messages and subscription.get(timeout=wait) is not None:
+            messages = list(queryset[:NEW_MESSAGES_LIMIT])
+    return messages
+
+def long_poll_params(params):
+    """(after_id, wait) from query parameters; raises ValueError for ones that are not numbers"""
+    return int(params.get('after_id', 0)), min(max(float(params.get('wait', 0)), 0), LONG_POLL_MAX_WAIT)
+
+def poll_group_messages(request, group_id):
+    try:
+        after_id, wait = long_poll_params(request.query_params)
+    except ValueError:
+        return Response({'error': 'after_id and wait must be numbers'}, status=400)
+    messages = new_group_messages(group_id, after_id, wait)
+    return Response(GroupMessageSerializer(messages, many=True).data)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def leaderboard(request):
-    top_users = User.objects.order_by('-points')[:50]
-    serializer = UserSerializer(top_users, many=True)
-    return Response(serializer.data)
+    timeframe = request.query_params.get('timeframe', 'all_time')
+    if timeframe not in TIMEFRAMES:
+        return Response({'error': f'timeframe must be one of {", ".join(TIMEFRAMES)}'}, status=400)
+    if timeframe == 'all_time':
+        top_users = User.objects.order_by('-points', 'id')[:50]
+        serializer = UserSerializer(top_users, many=True)
+        return Response(serializer.data)
+    return Response(get_leaderboard().top(timeframe))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def leaderboard_rank(request):
+    """Rank, percentile and the five users either side of the requesting user"""
+    timeframe = request.query_params.get('timeframe', 'all_time')
+    if timeframe not in TIMEFRAMES:
+        return Response({'error': f'timeframe must be one of {", ".join(TIMEFRAMES)}'}, status=400)
+    result = get_leaderboard().rank(request.user, timeframe)
+    start = period_start(timeframe)
+    result.update({
+        'timeframe': timeframe,
+        'period_start': start.isoformat() if start else None,
+    })
+    return Response(result)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_counts(request):
+    """Unread notification count and per-group unread message counts for the current user"""
+    groups = GroupReadCursor.objects.filter(user=request.user, unread_count__gt=0).values_list('group_id', 'unread_count')
+    return Response({
+        'notifications': request.user.unread_notifications,
+        'announcements': unread_announcements(request.user),
+        'groups': {str(group_id): count for group_id, count in groups},
+    })
+
+def rate_limit_view(request, exception):
+    """Response for requests rejected by ThrottleMiddleware or django-ratelimit"""
+    retry_after = getattr(request, 'throttle_retry_after', None)
+    response = JsonResponse({
+        'error': 'Too many requests, please slow down',
+        'retry_after': round(retry_after, 1) if retry_after else None,
+    }, status=429)
+    if retry_after:
+        response['Retry-After'] = str(math.ceil(retry_after))
+    return response
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -307,855 +649,208 @@ def public_stats(request):
     }
     return Response(stats)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def pubsub_metrics(request):
+    """Publish/deliver counts and latency histogram for this worker's pub/sub broker"""
+    if request.user.role not in ['admin', 'superadmin']:
+        return Response({'error': 'Unauthorized'}, status=403)
+    broker = get_broker()
+    return Response({'backend': type(broker).__name__, **broker.metrics.snapshot()})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analytics_funnels(request):
+    """Daily completion funnels per course, category and signup cohort, with cohort retention"""
+    if request.user.role not in ['admin', 'superadmin']:
+        return Response({'error': 'Unauthorized'}, status=403)
+    refresh = request.query_params.get('refresh') == '1'
+    return Response(get_funnel_report(refresh=refresh))
+
+class FreeCoursePagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def free_courses(request):
     """
-    Fetch free courses from external APIs (Coursera, edX, Khan Academy)
-    In production, this would make actual API calls to these services
+    Free courses from external providers (Coursera, edX, Khan Academy, Udacity, FutureLearn)
+    Filters: provider, category, skill_level (case-insensitive) and search (substring of title or description)
+    collapse=1 leaves out courses that duplicate an internal course or an earlier free course
     """
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def free_courses(request):
+    catalog = get_catalog()
+    duplicates = free_course_duplicates() if request.query_params.get('collapse') == '1' else []
+    etag = free_courses_etag(catalog, request.query_params, duplicates)
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    response = Response(free_courses_page(catalog, request, duplicates))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=300'
+    return response
+
+def free_course_duplicates():
+    return sorted(FreeCourseDuplicate.objects.values_list('free_course_id', flat=True))
+
+def free_courses_etag(catalog, params, duplicates):
+    return catalog.etag(*(params.get(key) for key in ('provider', 'category', 'skill_level', 'search', 'page', 'page_size')), *duplicates)
+
+def etag_matches(request, etag):
+    return etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]
+
+def free_courses_page(catalog, request, duplicates):
+    """The paginated response body for a free-courses request (a DRF Request)"""
+    params = request.query_params
+    courses = catalog.search(
+        provider=params.get('provider'),
+        category=params.get('category'),
+        skill_level=params.get('skill_level'),
+        search=params.get('search'),
+        exclude=duplicates,
+    )
+    paginator = FreeCoursePagination()
+    page = paginator.paginate_queryset(courses, request)
+    return paginator.get_paginated_response([dict(course) for course in page]).data
+
+def last_event_id_for(request):
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        return int(last_event_id) if last_event_id else None
+    except ValueError:
+        return None
+
+def event_stream_response(frames):
+    response = StreamingHttpResponse(frames, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# Async variants of the I/O-bound endpoints, routed instead of the DRF views when
+# settings.ASYNC_VIEWS is on and the app runs under ASGI (see backend/asgi.py).
+# A long-poll, event stream or cold provider fetch then waits on the event loop
+# without holding a thread; database work runs on the bounded pool in dbpool.py.
+# DRF views are sync only, so these are plain Django views with the same JSON.
+
+AUTHENTICATION_ERROR = {'detail': 'Authentication credentials were not provided.'}
+HEALTH_CHECK_TIMEOUT = 2
+
+def with_sync_fallback(view, sync_view):
     """
-    Fetch free courses from external APIs (Coursera, edX, Khan Academy, Udacity, FutureLearn)
-    In production, this would make actual API calls to these services
+    An async view for a DRF route: requests ``view`` returns None for, such as
+    writes or plain list pages, are handed to ``sync_view`` on the database pool.
     """
-    # Comprehensive collection of free courses from various providers
-    free_courses_data = [
-        # Coursera - Using verified working specialization URLs
-        {
-            'id': 'coursera_python',
-            'title': 'Python for Everybody Specialization',
-            'provider': 'Coursera',
-            'description': 'Learn to Program and Analyze Data with Python. Develop programs to gather, clean, analyze, and visualize data.',
-            'duration': '8 weeks',
-            'skill_level': 'Beginner',
-            'category': 'coding',
-            'url': 'https://www.coursera.org/specializations/python',
-            'rating': 4.8,
-            'enrolled_count': 125000,
-            'image_url': 'https://images.unsplash.com/photo-1526379095098-d400fd0bf935?w=400&h=250&fit=crop',
-            'external_id': 'python-for-everybody'
-        },
-        {
-            'id': 'coursera_web_dev',
-            'title': 'Web Development Courses',
-            'provider': 'Coursera',
-            'description': 'Learn how to create attractive and interactive websites by using HTML, CSS, and JavaScript.',
-            'duration': '10 weeks',
-            'skill_level': 'Beginner',
-            'category': 'coding',
-            'url': 'https://www.coursera.org/courses?query=web%20development',
-            'rating': 4.9,
-            'enrolled_count': 156000,
-            'image_url': 'https://images.unsplash.com/photo-1542831371-29b0f74f9713?w=400&h=250&fit=crop',
-            'external_id': 'web-development-coursera'
-        },
-        {
-            'id': 'coursera_machine_learning',
-            'title': 'Machine Learning Courses',
-            'provider': 'Coursera',
-            'description': 'Learn the principles of machine learning and build your first ML algorithm from scratch.',
-            'duration': '11 weeks',
-            'skill_level': 'Intermediate',
-            'category': 'coding',
-            'url': 'https://www.coursera.org/courses?query=machine%20learning',
-            'rating': 4.9,
-            'enrolled_count': 4500000,
-            'image_url': 'https://images.unsplash.com/photo-1555255707-c07966088b7b?w=400&h=250&fit=crop',
-            'external_id': 'machine-learning-coursera'
-        },
-        {
-            'id': 'coursera_data_science',
-            'title': 'Data Science Courses',
-            'provider': 'Coursera',
-            'description': 'Launch your career in data science with comprehensive courses and specializations.',
-            'duration': '11 months',
-            'skill_level': 'Beginner',
-            'category': 'data_science',
-            'url': 'https://www.coursera.org/courses?query=data%20science',
-            'rating': 4.6,
-            'enrolled_count': 890000,
-            'image_url': 'https://images.unsplash.com/photo-1551288049-bebda4e38f71?w=400&h=250&fit=crop',
-            'external_id': 'data-science-coursera'
-        },
-        {
-            'id': 'coursera_ux_design',
-            'title': 'UX Design Courses',
-            'provider': 'Coursera',
-            'description': 'Build job-ready skills for an entry-level UX design role with comprehensive design courses.',
-            'duration': '6 months',
-            'skill_level': 'Beginner',
-            'category': 'design',
-            'url': 'https://www.coursera.org/courses?query=ux%20design',
-            'rating': 4.8,
-            'enrolled_count': 1200000,
-            'image_url': 'https://images.unsplash.com/photo-1586717791821-3f44a563fa4c?w=400&h=250&fit=crop',
-            'external_id': 'ux-design-coursera'
-        },
-
-        # edX - Using verified working course catalog URLs
-        {
-            'id': 'edx_cs50',
-            'title': 'Computer Science Courses',
-            'provider': 'edX',
-            'description': 'Harvard University\'s introduction to computer science and programming using multiple languages.',
-            'duration': '12 weeks',
-            'skill_level': 'Beginner',
-            'category': 'coding',
-            'url': 'https://www.edx.org/learn/computer-science',
-            'rating': 4.9,
-            'enrolled_count': 234000,
-            'image_url': 'https://images.unsplash.com/photo-1516321318423-f06f85e504b3?w=400&h=250&fit=crop',
-            'external_id': 'computer-science-edx'
-        },
-        {
-            'id': 'edx_biology',
-            'title': 'Biology Courses',
-            'provider': 'edX',
-            'description': 'Comprehensive introduction to biology covering molecular genetics, biochemistry, and cell biology.',
-            'duration': '15 weeks',
-            'skill_level': 'Beginner',
-            'category': 'science_technology',
-            'url': 'https://www.edx.org/learn/biology',
-            'rating': 4.7,
-            'enrolled_count': 156000,
-            'image_url': 'https://images.unsplash.com/photo-1530026405186-ed1f139313f8?w=400&h=250&fit=crop',
-            'external_id': 'biology-edx'
-        },
-        {
-            'id': 'edx_business',
-            'title': 'Business Courses',
-            'provider': 'edX',
-            'description': 'Learn business fundamentals, management, finance, and entrepreneurship from top universities.',
-            'duration': '8-12 weeks',
-            'skill_level': 'Beginner',
-            'category': 'business',
-            'url': 'https://www.edx.org/learn/business-and-management',
-            'rating': 4.6,
-            'enrolled_count': 89000,
-            'image_url': 'https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=400&h=250&fit=crop',
-            'external_id': 'business-edx'
-        },
-
-        # Khan Academy - Using verified working subject URLs (completely free)
-        {
-            'id': 'khan_math',
-            'title': 'Mathematics',
-            'provider': 'Khan Academy',
-            'description': 'Master essential math concepts from arithmetic to calculus with interactive exercises.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'science_technology',
-            'url': 'https://www.khanacademy.org/math',
-            'rating': 4.8,
-            'enrolled_count': 5000000,
-            'image_url': 'https://images.unsplash.com/photo-1509228468518-180dd4864904?w=400&h=250&fit=crop',
-            'external_id': 'khan-math'
-        },
-        {
-            'id': 'khan_computer_science',
-            'title': 'Computer Science',
-            'provider': 'Khan Academy',
-            'description': 'Learn programming fundamentals, algorithms, cryptography, and computer science concepts.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'coding',
-            'url': 'https://www.khanacademy.org/computing/computer-science',
-            'rating': 4.7,
-            'enrolled_count': 2100000,
-            'image_url': 'https://images.unsplash.com/photo-1516321318423-f06f85e504b3?w=400&h=250&fit=crop',
-            'external_id': 'khan-computer-science'
-        },
-        {
-            'id': 'khan_physics',
-            'title': 'Physics',
-            'provider': 'Khan Academy',
-            'description': 'Learn physics concepts from mechanics to quantum physics with clear explanations.',
-            'duration': 'Self-paced',
-            'skill_level': 'Intermediate',
-            'category': 'science_technology',
-            'url': 'https://www.khanacademy.org/science/physics',
-            'rating': 4.7,
-            'enrolled_count': 2100000,
-            'image_url': 'https://images.unsplash.com/photo-1636466497217-26a8cbeaf0aa?w=400&h=250&fit=crop',
-            'external_id': 'khan-physics'
-        },
-        {
-            'id': 'khan_biology',
-            'title': 'Biology',
-            'provider': 'Khan Academy',
-            'description': 'Explore life sciences from cells to ecosystems with comprehensive biology lessons.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'science_technology',
-            'url': 'https://www.khanacademy.org/science/biology',
-            'rating': 4.6,
-            'enrolled_count': 3200000,
-            'image_url': 'https://images.unsplash.com/photo-1530026405186-ed1f139313f8?w=400&h=250&fit=crop',
-            'external_id': 'khan-biology'
-        },
-        {
-            'id': 'khan_chemistry',
-            'title': 'Chemistry',
-            'provider': 'Khan Academy',
-            'description': 'Learn chemistry from atomic structure to organic chemistry with interactive simulations.',
-            'duration': 'Self-paced',
-            'skill_level': 'Intermediate',
-            'category': 'science_technology',
-            'url': 'https://www.khanacademy.org/science/chemistry',
-            'rating': 4.5,
-            'enrolled_count': 1800000,
-            'image_url': 'https://images.unsplash.com/photo-1603126857599-f6e157fa2fe6?w=400&h=250&fit=crop',
-            'external_id': 'khan-chemistry'
-        },
-        {
-            'id': 'khan_economics',
-            'title': 'Economics',
-            'provider': 'Khan Academy',
-            'description': 'Learn microeconomics and macroeconomics concepts with real-world applications.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'business',
-            'url': 'https://www.khanacademy.org/economics-finance-domain',
-            'rating': 4.6,
-            'enrolled_count': 1500000,
-            'image_url': 'https://images.unsplash.com/photo-1611974789855-9c2a0a7236a3?w=400&h=250&fit=crop',
-            'external_id': 'khan-economics'
-        },
-
-        # Udacity - Using main course catalog (free courses page doesn't exist)
-        {
-            'id': 'udacity_programming',
-            'title': 'Programming Courses',
-            'provider': 'Udacity',
-            'description': 'Learn programming with Python, JavaScript, and other languages through project-based courses.',
-            'duration': '2-6 months',
-            'skill_level': 'Beginner',
-            'category': 'coding',
-            'url': 'https://www.udacity.com/courses/all',
-            'rating': 4.6,
-            'enrolled_count': 125000,
-            'image_url': 'https://images.unsplash.com/photo-1516321318423-f06f85e504b3?w=400&h=250&fit=crop',
-            'external_id': 'programming-udacity'
-        },
-        {
-            'id': 'udacity_data_science',
-            'title': 'Data Science Courses',
-            'provider': 'Udacity',
-            'description': 'Master data analysis, machine learning, and AI with hands-on projects and real datasets.',
-            'duration': '3-6 months',
-            'skill_level': 'Intermediate',
-            'category': 'data_science',
-            'url': 'https://www.udacity.com/courses/all',
-            'rating': 4.7,
-            'enrolled_count': 98000,
-            'image_url': 'https://images.unsplash.com/photo-1551288049-bebda4e38f71?w=400&h=250&fit=crop',
-            'external_id': 'data-science-udacity'
-        },
-
-        # FutureLearn - Using verified working subject pages
-        {
-            'id': 'futurelearn_business',
-            'title': 'Business & Management Courses',
-            'provider': 'FutureLearn',
-            'description': 'Learn business fundamentals, leadership, marketing, and entrepreneurship from top universities.',
-            'duration': '3-8 weeks',
-            'skill_level': 'Beginner',
-            'category': 'business',
-            'url': 'https://www.futurelearn.com/subjects/business-and-management-courses',
-            'rating': 4.5,
-            'enrolled_count': 45000,
-            'image_url': 'https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=400&h=250&fit=crop',
-            'external_id': 'business-futurelearn'
-        },
-        {
-            'id': 'futurelearn_technology',
-            'title': 'IT & Computer Science Courses',
-            'provider': 'FutureLearn',
-            'description': 'Master coding, cybersecurity, AI, and other technology skills with university-level courses.',
-            'duration': '4-6 weeks',
-            'skill_level': 'Beginner',
-            'category': 'coding',
-            'url': 'https://www.futurelearn.com/subjects/it-and-computer-science-courses',
-            'rating': 4.4,
-            'enrolled_count': 67000,
-            'image_url': 'https://images.unsplash.com/photo-1516321318423-f06f85e504b3?w=400&h=250&fit=crop',
-            'external_id': 'technology-futurelearn'
-        },
-        {
-            'id': 'futurelearn_science',
-            'title': 'Science, Engineering & Maths Courses',
-            'provider': 'FutureLearn',
-            'description': 'Explore STEM subjects from basic science to advanced engineering and mathematics.',
-            'duration': '4-8 weeks',
-            'skill_level': 'Beginner',
-            'category': 'science_technology',
-            'url': 'https://www.futurelearn.com/subjects/science-engineering-and-maths-courses',
-            'rating': 4.6,
-            'enrolled_count': 89000,
-            'image_url': 'https://images.unsplash.com/photo-1509228468518-180dd4864904?w=400&h=250&fit=crop',
-            'external_id': 'science-futurelearn'
-        },
-
-        # Additional verified courses with working URLs
-        {
-            'id': 'coursera_cloud_computing',
-            'title': 'Cloud Computing Courses',
-            'provider': 'Coursera',
-            'description': 'Master cloud platforms including AWS, Google Cloud, and Azure with hands-on projects.',
-            'duration': '3-6 months',
-            'skill_level': 'Intermediate',
-            'category': 'technology',
-            'url': 'https://www.coursera.org/courses?query=cloud%20computing',
-            'rating': 4.7,
-            'enrolled_count': 234000,
-            'image_url': 'https://images.unsplash.com/photo-1451187580459-43490279c0fa?w=400&h=250&fit=crop',
-            'external_id': 'cloud-computing-coursera'
-        },
-        {
-            'id': 'coursera_react',
-            'title': 'React Development Courses',
-            'provider': 'Coursera',
-            'description': 'Build modern web applications with React and learn advanced frontend development techniques.',
-            'duration': '2-4 months',
-            'skill_level': 'Intermediate',
-            'category': 'coding',
-            'url': 'https://www.coursera.org/courses?query=react',
-            'rating': 4.8,
-            'enrolled_count': 345000,
-            'image_url': 'https://images.unsplash.com/photo-1633356122544-f134324a6cee?w=400&h=250&fit=crop',
-            'external_id': 'react-development-coursera'
-        },
-        {
-            'id': 'edx_technology',
-            'title': 'Technology Courses',
-            'provider': 'edX',
-            'description': 'Learn cutting-edge technology skills from cloud computing to cybersecurity.',
-            'duration': '6-12 weeks',
-            'skill_level': 'Beginner',
-            'category': 'technology',
-            'url': 'https://www.edx.org/learn/technology',
-            'rating': 4.5,
-            'enrolled_count': 89000,
-            'image_url': 'https://images.unsplash.com/photo-1516321318423-f06f85e504b3?w=400&h=250&fit=crop',
-            'external_id': 'technology-edx'
-        },
-        {
-            'id': 'khan_finance',
-            'title': 'Finance & Capital Markets',
-            'provider': 'Khan Academy',
-            'description': 'Learn personal finance, investing, and financial planning with practical examples.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'business',
-            'url': 'https://www.khanacademy.org/economics-finance-domain/core-finance',
-            'rating': 4.7,
-            'enrolled_count': 1200000,
-            'image_url': 'https://images.unsplash.com/photo-1611974789855-9c2a0a7236a3?w=400&h=250&fit=crop',
-            'external_id': 'khan-finance'
-        },
-        {
-            'id': 'coursera_ai_ml',
-            'title': 'AI & Machine Learning Courses',
-            'provider': 'Coursera',
-            'description': 'Master artificial intelligence and machine learning with practical applications.',
-            'duration': '3-6 months',
-            'skill_level': 'Advanced',
-            'category': 'coding',
-            'url': 'https://www.coursera.org/courses?query=artificial%20intelligence',
-            'rating': 4.9,
-            'enrolled_count': 567000,
-            'image_url': 'https://images.unsplash.com/photo-1555255707-c07966088b7b?w=400&h=250&fit=crop',
-            'external_id': 'ai-ml-coursera'
-        },
-        {
-            'id': 'coursera_aws',
-            'title': 'AWS Cloud Courses',
-            'provider': 'Coursera',
-            'description': 'Learn Amazon Web Services and cloud architecture with hands-on labs and projects.',
-            'duration': '3-6 months',
-            'skill_level': 'Intermediate',
-            'category': 'technology',
-            'url': 'https://www.coursera.org/courses?query=aws',
-            'rating': 4.6,
-            'enrolled_count': 178000,
-            'image_url': 'https://images.unsplash.com/photo-1451187580459-43490279c0fa?w=400&h=250&fit=crop',
-            'external_id': 'aws-coursera'
-        },
-
-        # Additional verified free courses from Coursera
-        {
-            'id': 'coursera_python_data_science',
-            'title': 'Python for Data Science, AI & Development',
-            'provider': 'Coursera',
-            'description': 'Learn Python programming fundamentals for data science, AI, and web development.',
-            'duration': '1-3 months',
-            'skill_level': 'Beginner',
-            'category': 'coding',
-            'url': 'https://www.coursera.org/learn/python-for-applied-data-science-ai',
-            'rating': 4.6,
-            'enrolled_count': 42000,
-            'image_url': 'https://images.unsplash.com/photo-1526379095098-d400fd0bf935?w=400&h=250&fit=crop',
-            'external_id': 'python-data-science-coursera'
-        },
-        {
-            'id': 'coursera_cybersecurity',
-            'title': 'Cybersecurity for Everyone',
-            'provider': 'Coursera',
-            'description': 'Learn cybersecurity fundamentals, risk management, and security strategies.',
-            'duration': '1-3 months',
-            'skill_level': 'Beginner',
-            'category': 'technology',
-            'url': 'https://www.coursera.org/learn/cybersecurity-for-everyone',
-            'rating': 4.7,
-            'enrolled_count': 3100,
-            'image_url': 'https://images.unsplash.com/photo-1550751827-4bd374c3f58b?w=400&h=250&fit=crop',
-            'external_id': 'cybersecurity-coursera'
-        },
-        {
-            'id': 'coursera_digital_marketing',
-            'title': 'Foundations of Digital Marketing and E-commerce',
-            'provider': 'Coursera',
-            'description': 'Master digital marketing strategies, SEO, social media, and e-commerce fundamentals.',
-            'duration': '1-4 weeks',
-            'skill_level': 'Beginner',
-            'category': 'business',
-            'url': 'https://www.coursera.org/learn/foundations-of-digital-marketing-and-e-commerce',
-            'rating': 4.8,
-            'enrolled_count': 29000,
-            'image_url': 'https://images.unsplash.com/photo-1460925895917-afdab827c52f?w=400&h=250&fit=crop',
-            'external_id': 'digital-marketing-coursera'
-        },
-        {
-            'id': 'coursera_excel',
-            'title': 'Excel Skills for Business',
-            'provider': 'Coursera',
-            'description': 'Master Excel for business analysis, data visualization, and productivity.',
-            'duration': '1-2 months',
-            'skill_level': 'Beginner',
-            'category': 'business',
-            'url': 'https://www.coursera.org/specializations/excel-skills-for-business',
-            'rating': 4.7,
-            'enrolled_count': 156000,
-            'image_url': 'https://images.unsplash.com/photo-1486312338219-ce68e2c6b827?w=400&h=250&fit=crop',
-            'external_id': 'excel-business-coursera'
-        },
-        {
-            'id': 'coursera_healthcare',
-            'title': 'Healthcare Management and Leadership',
-            'provider': 'Coursera',
-            'description': 'Learn healthcare administration, patient care management, and leadership skills.',
-            'duration': '3-6 months',
-            'skill_level': 'Intermediate',
-            'category': 'healthcare',
-            'url': 'https://www.coursera.org/specializations/healthcare-management',
-            'rating': 4.6,
-            'enrolled_count': 45000,
-            'image_url': 'https://images.unsplash.com/photo-1559757148-5c350d0d3c56?w=400&h=250&fit=crop',
-            'external_id': 'healthcare-management-coursera'
-        },
-        {
-            'id': 'coursera_psychology',
-            'title': 'Introduction to Psychology',
-            'provider': 'Coursera',
-            'description': 'Explore psychological concepts, human behavior, and mental processes.',
-            'duration': '1-3 months',
-            'skill_level': 'Beginner',
-            'category': 'social_sciences',
-            'url': 'https://www.coursera.org/learn/introduction-psychology',
-            'rating': 4.8,
-            'enrolled_count': 89000,
-            'image_url': 'https://images.unsplash.com/photo-1559757148-5c350d0d3c56?w=400&h=250&fit=crop',
-            'external_id': 'psychology-coursera'
-        },
-
-        # Additional verified free courses from edX
-        {
-            'id': 'edx_data_science',
-            'title': 'Data Science and Machine Learning',
-            'provider': 'edX',
-            'description': 'Master data analysis, statistics, and machine learning with Python and R.',
-            'duration': '3-6 months',
-            'skill_level': 'Intermediate',
-            'category': 'data_science',
-            'url': 'https://www.edx.org/learn/data-science',
-            'rating': 4.7,
-            'enrolled_count': 125000,
-            'image_url': 'https://images.unsplash.com/photo-1551288049-bebda4e38f71?w=400&h=250&fit=crop',
-            'external_id': 'data-science-edx'
-        },
-        {
-            'id': 'edx_artificial_intelligence',
-            'title': 'Artificial Intelligence Courses',
-            'provider': 'edX',
-            'description': 'Learn AI fundamentals, machine learning algorithms, and neural networks.',
-            'duration': '2-6 months',
-            'skill_level': 'Intermediate',
-            'category': 'coding',
-            'url': 'https://www.edx.org/learn/artificial-intelligence',
-            'rating': 4.8,
-            'enrolled_count': 98000,
-            'image_url': 'https://images.unsplash.com/photo-1677442136019-21780ecad995?w=400&h=250&fit=crop',
-            'external_id': 'ai-edx'
-        },
-        {
-            'id': 'edx_psychology',
-            'title': 'Psychology and Mental Health',
-            'provider': 'edX',
-            'description': 'Study human behavior, mental health, and psychological research methods.',
-            'duration': '2-4 months',
-            'skill_level': 'Beginner',
-            'category': 'social_sciences',
-            'url': 'https://www.edx.org/learn/psychology',
-            'rating': 4.6,
-            'enrolled_count': 67000,
-            'image_url': 'https://images.unsplash.com/photo-1559757148-5c350d0d3c56?w=400&h=250&fit=crop',
-            'external_id': 'psychology-edx'
-        },
-        {
-            'id': 'edx_english',
-            'title': 'English Language and Communication',
-            'provider': 'edX',
-            'description': 'Improve English language skills for academic and professional communication.',
-            'duration': '1-3 months',
-            'skill_level': 'Beginner',
-            'category': 'language',
-            'url': 'https://www.edx.org/learn/language',
-            'rating': 4.5,
-            'enrolled_count': 156000,
-            'image_url': 'https://images.unsplash.com/photo-1434030216411-0b793f4b4173?w=400&h=250&fit=crop',
-            'external_id': 'english-edx'
-        },
-        {
-            'id': 'edx_environmental_science',
-            'title': 'Environmental Science and Sustainability',
-            'provider': 'edX',
-            'description': 'Learn about climate change, environmental policy, and sustainable development.',
-            'duration': '2-4 months',
-            'skill_level': 'Beginner',
-            'category': 'science_technology',
-            'url': 'https://www.edx.org/learn/environmental-science',
-            'rating': 4.7,
-            'enrolled_count': 45000,
-            'image_url': 'https://images.unsplash.com/photo-1569163139394-de44cb89ba02?w=400&h=250&fit=crop',
-            'external_id': 'environmental-science-edx'
-        },
-
-        # Additional verified free courses from Khan Academy
-        {
-            'id': 'khan_history',
-            'title': 'World History',
-            'provider': 'Khan Academy',
-            'description': 'Explore ancient civilizations, world wars, and modern history with interactive timelines.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'social_sciences',
-            'url': 'https://www.khanacademy.org/humanities/world-history',
-            'rating': 4.6,
-            'enrolled_count': 1800000,
-            'image_url': 'https://images.unsplash.com/photo-1481627834876-b7833e8f5570?w=400&h=250&fit=crop',
-            'external_id': 'khan-world-history'
-        },
-        {
-            'id': 'khan_art_history',
-            'title': 'Art History',
-            'provider': 'Khan Academy',
-            'description': 'Discover art movements, famous artists, and artistic techniques from ancient to modern times.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'arts_humanities',
-            'url': 'https://www.khanacademy.org/humanities/art-history',
-            'rating': 4.5,
-            'enrolled_count': 950000,
-            'image_url': 'https://images.unsplash.com/photo-1578662996442-48f60103fc96?w=400&h=250&fit=crop',
-            'external_id': 'khan-art-history'
-        },
-        {
-            'id': 'khan_statistics',
-            'title': 'Statistics and Probability',
-            'provider': 'Khan Academy',
-            'description': 'Learn statistical analysis, probability theory, and data interpretation skills.',
-            'duration': 'Self-paced',
-            'skill_level': 'Intermediate',
-            'category': 'science_technology',
-            'url': 'https://www.khanacademy.org/math/probability',
-            'rating': 4.7,
-            'enrolled_count': 1400000,
-            'image_url': 'https://images.unsplash.com/photo-1635070041078-e363dbe005cb?w=400&h=250&fit=crop',
-            'external_id': 'khan-statistics'
-        },
-        {
-            'id': 'khan_career_prep',
-            'title': 'Career and College Preparation',
-            'provider': 'Khan Academy',
-            'description': 'Prepare for college applications, career planning, and professional development.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'personal_development',
-            'url': 'https://www.khanacademy.org/college-careers-more',
-            'rating': 4.6,
-            'enrolled_count': 1200000,
-            'image_url': 'https://images.unsplash.com/photo-1522202176988-66273c2fd55f?w=400&h=250&fit=crop',
-            'external_id': 'khan-career-prep'
-        },
-        {
-            'id': 'khan_health_medicine',
-            'title': 'Health and Medicine',
-            'provider': 'Khan Academy',
-            'description': 'Learn about human anatomy, physiology, and healthcare fundamentals.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'healthcare',
-            'url': 'https://www.khanacademy.org/science/health-and-medicine',
-            'rating': 4.5,
-            'enrolled_count': 850000,
-            'image_url': 'https://images.unsplash.com/photo-1559757148-5c350d0d3c56?w=400&h=250&fit=crop',
-            'external_id': 'khan-health-medicine'
-        },
-
-        # Additional verified free courses from Udacity
-        {
-            'id': 'udacity_web_development',
-            'title': 'Web Development Courses',
-            'provider': 'Udacity',
-            'description': 'Learn full-stack web development with HTML, CSS, JavaScript, and modern frameworks.',
-            'duration': '3-6 months',
-            'skill_level': 'Intermediate',
-            'category': 'coding',
-            'url': 'https://www.udacity.com/courses/all',
-            'rating': 4.7,
-            'enrolled_count': 125000,
-            'image_url': 'https://images.unsplash.com/photo-1542831371-29b0f74f9713?w=400&h=250&fit=crop',
-            'external_id': 'web-development-udacity'
-        },
-        {
-            'id': 'udacity_product_management',
-            'title': 'Product Management Courses',
-            'provider': 'Udacity',
-            'description': 'Master product strategy, user research, and agile development methodologies.',
-            'duration': '2-4 months',
-            'skill_level': 'Intermediate',
-            'category': 'business',
-            'url': 'https://www.udacity.com/courses/all',
-            'rating': 4.6,
-            'enrolled_count': 67000,
-            'image_url': 'https://images.unsplash.com/photo-1552664730-d307ca884978?w=400&h=250&fit=crop',
-            'external_id': 'product-management-udacity'
-        },
-
-        # Additional verified free courses from FutureLearn
-        {
-            'id': 'futurelearn_data_science',
-            'title': 'Data Science and Analytics',
-            'provider': 'FutureLearn',
-            'description': 'Learn data analysis, visualization, and statistical modeling techniques.',
-            'duration': '4-6 weeks',
-            'skill_level': 'Beginner',
-            'category': 'data_science',
-            'url': 'https://www.futurelearn.com/subjects/data-science-and-statistics-courses',
-            'rating': 4.5,
-            'enrolled_count': 78000,
-            'image_url': 'https://images.unsplash.com/photo-1551288049-bebda4e38f71?w=400&h=250&fit=crop',
-            'external_id': 'data-science-futurelearn'
-        },
-        {
-            'id': 'futurelearn_mental_health',
-            'title': 'Mental Health and Psychology',
-            'provider': 'FutureLearn',
-            'description': 'Explore mental health, psychological well-being, and therapeutic approaches.',
-            'duration': '3-6 weeks',
-            'skill_level': 'Beginner',
-            'category': 'healthcare',
-            'url': 'https://www.futurelearn.com/subjects/psychology-and-mental-health-courses',
-            'rating': 4.6,
-            'enrolled_count': 45000,
-            'image_url': 'https://images.unsplash.com/photo-1559757148-5c350d0d3c56?w=400&h=250&fit=crop',
-            'external_id': 'mental-health-futurelearn'
-        },
-        {
-            'id': 'futurelearn_creative_arts',
-            'title': 'Creative Arts and Media',
-            'provider': 'FutureLearn',
-            'description': 'Develop creative skills in writing, design, music, and digital media.',
-            'duration': '4-8 weeks',
-            'skill_level': 'Beginner',
-            'category': 'arts_humanities',
-            'url': 'https://www.futurelearn.com/subjects/creative-arts-and-media-courses',
-            'rating': 4.4,
-            'enrolled_count': 56000,
-            'image_url': 'https://images.unsplash.com/photo-1578662996442-48f60103fc96?w=400&h=250&fit=crop',
-            'external_id': 'creative-arts-futurelearn'
-        },
-
-        # Additional diverse free courses
-        {
-            'id': 'coursera_sustainability',
-            'title': 'Sustainability and Climate Change',
-            'provider': 'Coursera',
-            'description': 'Learn about environmental sustainability, climate science, and green technologies.',
-            'duration': '2-4 months',
-            'skill_level': 'Beginner',
-            'category': 'science_technology',
-            'url': 'https://www.coursera.org/courses?query=sustainability',
-            'rating': 4.7,
-            'enrolled_count': 89000,
-            'image_url': 'https://images.unsplash.com/photo-1569163139394-de44cb89ba02?w=400&h=250&fit=crop',
-            'external_id': 'sustainability-coursera'
-        },
-        {
-            'id': 'coursera_creative_writing',
-            'title': 'Creative Writing and Storytelling',
-            'provider': 'Coursera',
-            'description': 'Develop writing skills, learn narrative techniques, and craft compelling stories.',
-            'duration': '1-3 months',
-            'skill_level': 'Beginner',
-            'category': 'arts_humanities',
-            'url': 'https://www.coursera.org/courses?query=creative%20writing',
-            'rating': 4.6,
-            'enrolled_count': 67000,
-            'image_url': 'https://images.unsplash.com/photo-1455390582262-044cdead277a?w=400&h=250&fit=crop',
-            'external_id': 'creative-writing-coursera'
-        },
-        {
-            'id': 'edx_philosophy',
-            'title': 'Philosophy and Critical Thinking',
-            'provider': 'edX',
-            'description': 'Explore philosophical concepts, ethics, logic, and critical reasoning skills.',
-            'duration': '2-4 months',
-            'skill_level': 'Beginner',
-            'category': 'arts_humanities',
-            'url': 'https://www.edx.org/learn/philosophy',
-            'rating': 4.5,
-            'enrolled_count': 45000,
-            'image_url': 'https://images.unsplash.com/photo-1481627834876-b7833e8f5570?w=400&h=250&fit=crop',
-            'external_id': 'philosophy-edx'
-        },
-        {
-            'id': 'khan_music',
-            'title': 'Music Theory and Composition',
-            'provider': 'Khan Academy',
-            'description': 'Learn music fundamentals, theory, and basic composition techniques.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'arts_humanities',
-            'url': 'https://www.khanacademy.org/humanities/music',
-            'rating': 4.4,
-            'enrolled_count': 750000,
-            'image_url': 'https://images.unsplash.com/photo-1493225457124-a3eb161ffa5f?w=400&h=250&fit=crop',
-            'external_id': 'khan-music'
-        },
-        {
-            'id': 'coursera_nutrition',
-            'title': 'Nutrition and Wellness',
-            'provider': 'Coursera',
-            'description': 'Learn about healthy eating, nutrition science, and lifestyle wellness.',
-            'duration': '1-2 months',
-            'skill_level': 'Beginner',
-            'category': 'healthcare',
-            'url': 'https://www.coursera.org/courses?query=nutrition',
-            'rating': 4.7,
-            'enrolled_count': 125000,
-            'image_url': 'https://images.unsplash.com/photo-1490645935967-10de6ba17061?w=400&h=250&fit=crop',
-            'external_id': 'nutrition-coursera'
-        },
-        {
-            'id': 'edx_education',
-            'title': 'Education and Teaching Methods',
-            'provider': 'edX',
-            'description': 'Learn modern teaching strategies, educational psychology, and classroom management.',
-            'duration': '2-4 months',
-            'skill_level': 'Beginner',
-            'category': 'education',
-            'url': 'https://www.edx.org/learn/education',
-            'rating': 4.6,
-            'enrolled_count': 78000,
-            'image_url': 'https://images.unsplash.com/photo-1503676260728-1c00da094a0b?w=400&h=250&fit=crop',
-            'external_id': 'education-edx'
-        },
-        {
-            'id': 'futurelearn_languages',
-            'title': 'Language Learning',
-            'provider': 'FutureLearn',
-            'description': 'Learn new languages with interactive lessons and cultural immersion.',
-            'duration': '4-8 weeks',
-            'skill_level': 'Beginner',
-            'category': 'language',
-            'url': 'https://www.futurelearn.com/subjects/language-courses',
-            'rating': 4.5,
-            'enrolled_count': 92000,
-            'image_url': 'https://images.unsplash.com/photo-1434030216411-0b793f4b4173?w=400&h=250&fit=crop',
-            'external_id': 'languages-futurelearn'
-        },
-        {
-            'id': 'coursera_project_management',
-            'title': 'Project Management Fundamentals',
-            'provider': 'Coursera',
-            'description': 'Learn project planning, risk management, and team leadership skills.',
-            'duration': '2-3 months',
-            'skill_level': 'Beginner',
-            'category': 'business',
-            'url': 'https://www.coursera.org/courses?query=project%20management',
-            'rating': 4.8,
-            'enrolled_count': 234000,
-            'image_url': 'https://images.unsplash.com/photo-1552664730-d307ca884978?w=400&h=250&fit=crop',
-            'external_id': 'project-management-coursera'
-        },
-        {
-            'id': 'khan_grammar',
-            'title': 'Grammar and Writing',
-            'provider': 'Khan Academy',
-            'description': 'Master English grammar, punctuation, and effective writing techniques.',
-            'duration': 'Self-paced',
-            'skill_level': 'Beginner',
-            'category': 'language',
-            'url': 'https://www.khanacademy.org/humanities/grammar',
-            'rating': 4.5,
-            'enrolled_count': 1100000,
-            'image_url': 'https://images.unsplash.com/photo-1455390582262-044cdead277a?w=400&h=250&fit=crop',
-            'external_id': 'khan-grammar'
-        },
-        {
-            'id': 'coursera_blockchain',
-            'title': 'Blockchain and Cryptocurrency',
-            'provider': 'Coursera',
-            'description': 'Learn blockchain technology, cryptocurrency fundamentals, and smart contracts.',
-            'duration': '2-4 months',
-            'skill_level': 'Intermediate',
-            'category': 'technology',
-            'url': 'https://www.coursera.org/courses?query=blockchain',
-            'rating': 4.6,
-            'enrolled_count': 156000,
-            'image_url': 'https://images.unsplash.com/photo-1639762681485-074b7f938ba0?w=400&h=250&fit=crop',
-            'external_id': 'blockchain-coursera'
-        }
-    ]
-
-    # Filter by provider if specified
-    provider = request.query_params.get('provider', None)
-    if provider:
-        free_courses_data = [course for course in free_courses_data if course['provider'].lower() == provider.lower()]
-
-    # Filter by category if specified
-    category = request.query_params.get('category', None)
-    if category:
-        free_courses_data = [course for course in free_courses_data if course['category'] == category]
-
-    # Filter by skill level if specified
-    skill_level = request.query_params.get('skill_level', None)
-    if skill_level:
-        free_courses_data = [course for course in free_courses_data if course['skill_level'].lower() == skill_level.lower()]
-
-    # Search by title or description if specified
-    search = request.query_params.get('search', None)
-    if search:
-        search_lower = search.lower()
-        free_courses_data = [course for course in free_courses_data
-                           if search_lower in course['title'].lower()
-                           or search_lower in course['description'].lower()]
-
-    return Response({
-        'count': len(free_courses_data),
-        'results': free_courses_data
-    })
+    def call_sync_view(request, *args, **kwargs):
+        response = sync_view(request, *args, **kwargs)
+        return response.render() if hasattr(response, 'render') else response
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        response = await view(request, *args, **kwargs)
+        if response is None:
+            response = await pooled(call_sync_view)(request, *args, **kwargs)
+        return response
+    wrapper.csrf_exempt = True  # like every DRF view; the API authenticates with JWTs, not cookies
+    return wrapper
+
+async def anew_group_messages(group_id, after_id, wait=0):
+    """``new_group_messages`` serialized, for async views; a waiting poll holds no thread or connection"""
+    fetch = pooled(lambda: GroupMessageSerializer(new_group_messages(group_id, after_id), many=True).data)
+    if not wait:
+        return await fetch()
+    # Subscribe before querying so a message created in between still wakes us
+    async with get_broker().asubscribe(group_messages_topic(group_id)) as subscription:
+        messages = await fetch()
+        if not messages and await subscription.aget(timeout=wait) is not None:
+            messages = await fetch()
+    return messages
+
+async def apoll_group_messages(request, group_id):
+    try:
+        after_id, wait = long_poll_params(request.GET)
+    except ValueError:
+        return JsonResponse({'error': 'after_id and wait must be numbers'}, status=400)
+    return JsonResponse(await anew_group_messages(group_id, after_id, wait), safe=False)
+
+async def apoll_readable_group_messages(request, group_id):
+    """``apoll_group_messages`` for a signed-in user who may read the group, checked before subscribing"""
+    user = await get_user_for_request(request)
+    if user is None:
+        return JsonResponse(AUTHENTICATION_ERROR, status=401)
+    error = await pooled(group_access_error)(group_id, user)
+    if error:
+        body, status_code = error
+        return JsonResponse(body, status=status_code)
+    return await apoll_group_messages(request, group_id)
+
+async def study_group_messages_async(request, pk):
+    """Long-polls on a study group's messages (?after_id&wait); history pages go to the DRF action"""
+    if request.method != 'GET' or 'after_id' not in request.GET:
+        return None
+    return await apoll_readable_group_messages(request, pk)
+
+async def group_messages_async(request):
+    """Long-polls on ?group&after_id; every other request goes to GroupMessageViewSet"""
+    group_id = request.GET.get('group')
+    if request.method != 'GET' or not group_id or 'after_id' not in request.GET:
+        return None
+    return await apoll_readable_group_messages(request, group_id)
+
+async def notification_stream_async(request):
+    """``NotificationViewSet.stream`` for ASGI workers: an open stream holds no thread"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user = await get_user_for_request(request, query_string=True)
+    if user is None:
+        return JsonResponse(AUTHENTICATION_ERROR, status=401)
+    return event_stream_response(anotification_stream(user, last_event_id_for(request)))
+
+async def free_courses_async(request):
+    """``free_courses`` for ASGI workers: missing provider lists are awaited without holding a thread"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    request = Request(request)
+    catalog = await aget_catalog()
+    duplicates = await pooled(free_course_duplicates)() if request.query_params.get('collapse') == '1' else []
+    etag = free_courses_etag(catalog, request.query_params, duplicates)
+    if etag_matches(request, etag):
+        return HttpResponseNotModified(headers={'ETag': etag})
+    try:
+        data = free_courses_page(catalog, request, duplicates)
+    except NotFound as e:
+        return JsonResponse({'detail': str(e.detail)}, status=404)
+    response = JsonResponse(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=300'
+    return response
+
+def check_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+async def check_cache():
+    await cache.aset('health:ping', 1, 10)
+    if await cache.aget('health:ping') != 1:
+        raise RuntimeError('cache did not return the value just set')
+
+def check_pubsub():
+    broker = get_broker()
+    if hasattr(broker, 'client'):
+        broker.client.ping()
+
+async def run_health_check(check):
+    try:
+        await asyncio.wait_for(check(), HEALTH_CHECK_TIMEOUT)
+    except Exception as e:
+        return f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+    return 'ok'
+
+async def health(request):
+    """Readiness for load balancers and orchestrators: database, cache and pub/sub, checked concurrently"""
+    checks = {
+        'database': pooled(check_database),
+        'cache': check_cache,
+        'pubsub': lambda: asyncio.to_thread(check_pubsub),
+    }
+    results = dict(zip(checks, await asyncio.gather(*(run_health_check(check) for check in checks.values()))))
+    healthy = all(result == 'ok' for result in results.values())
+    return JsonResponse({'status': 'ok' if healthy else 'unavailable', 'checks': results}, status=200 if healthy else 503)
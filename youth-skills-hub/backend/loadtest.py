@@ -0,0 +1,113 @@
+"""
+Load test for long-polling: how many waiting requests one server worker can hold.
+
+Opens --connections long-polls at once on a study group's messages
+(?after_id=<newest>&wait=<seconds>) and reports how many finished, how long
+they took, how many could not connect or got an error, and the peak number
+waiting at the same moment. Nothing is posted, so every poll waits its full
+--wait and returns an empty list. An async worker holds them all at once; a
+worker that needs a thread per waiting request holds as many as it has
+threads and the rest queue behind them or time out.
+
+Compare one ASGI worker against one threaded WSGI worker:
+
+    daphne -p 8000 backend.asgi:application
+    gunicorn backend.wsgi -k gthread --workers 1 --threads 10 -b 127.0.0.1:8001
+
+    python loadtest.py --url http://127.0.0.1:8000 --username alice --password secret --group 1
+    python loadtest.py --url http://127.0.0.1:8001 --username alice --password secret --group 1
+
+Only the standard library is used, so it runs from any machine with Python.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+
+def get_token(url, username, password):
+    request = urllib.request.Request(
+        f'{url}/api/token/', data=json.dumps({'username': username, 'password': password}).encode(),
+        headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)['access']
+
+
+def newest_message_id(url, token, group):
+    request = urllib.request.Request(
+        f'{url}/api/study-groups/{group}/messages/?limit=1', headers={'Authorization': f'Bearer {token}'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        messages = json.load(response)
+    return max([message['id'] for message in messages], default=0)
+
+
+async def get(host, port, path, token, timeout):
+    """(status, started, finished) monotonic times for one GET over its own connection; status is None if it failed"""
+    started = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write((f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAuthorization: Bearer {token}\r\n'
+                      'Connection: close\r\n\r\n').encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout - (time.monotonic() - started))
+        await asyncio.wait_for(reader.read(), timeout - (time.monotonic() - started))
+        writer.close()
+        return int(status_line.split()[1]), started, time.monotonic()
+    except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+        return None, started, time.monotonic()
+
+
+def peak_waiting(finished_times, wait):
+    """Most polls waiting at the same moment: each successful poll spent the last ``wait`` seconds of its life waiting"""
+    events = sorted([(finished - wait, 1) for finished in finished_times] + [(finished, -1) for finished in finished_times])
+    peak = waiting = 0
+    for _, change in events:
+        waiting += change
+        peak = max(peak, waiting)
+    return peak
+
+
+async def run(options):
+    token = options.token or get_token(options.url, options.username, options.password)
+    after_id = newest_message_id(options.url, token, options.group)
+    parts = urlsplit(options.url)
+    path = f'/api/study-groups/{options.group}/messages/?after_id={after_id}&wait={options.wait}'
+    timeout = options.wait + options.timeout
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(
+        get(parts.hostname, parts.port or 80, path, token, timeout) for _ in range(options.connections)))
+    elapsed = time.monotonic() - started
+
+    ok = [(poll_started, finished) for status, poll_started, finished in results if status == 200]
+    print(f'{options.connections} long-polls (wait {options.wait}s) against {options.url} in {elapsed:.1f}s')
+    print(f'  succeeded: {len(ok)}, failed or timed out: {options.connections - len(ok)}')
+    print(f'  peak polls waiting at once: {peak_waiting([finished for _, finished in ok], options.wait)}')
+    ok = sorted(finished - poll_started for poll_started, finished in ok)
+    if ok:
+        quantiles = statistics.quantiles(ok, n=20) if len(ok) > 1 else [ok[0]] * 19
+        print(f'  latency p50 {quantiles[9]:.2f}s, p95 {quantiles[18]:.2f}s, max {ok[-1]:.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hold many concurrent long-polls open against one server')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--group', type=int, required=True, help='Study group id to poll')
+    parser.add_argument('--token', help='JWT access token (or give --username and --password)')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--wait', type=int, default=5, help='Long-poll wait in seconds (at most 30)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='Seconds a poll may take beyond its wait before it counts as failed')
+    options = parser.parse_args()
+    if not options.token and not (options.username and options.password):
+        parser.error('give --token, or --username and --password')
+    asyncio.run(run(options))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,22 @@ import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { useAuth } from '../contexts/AuthContext';
 
+// Matches the server's MESSAGE_PAGE_SIZE: a full page means there may be older history
+const PAGE_SIZE = 50;
+
 const Chat = ({ groupId }) => {
   const { user } = useAuth();
   const [messages, setMessages] = useState([]);
   const [newMessage, setNewMessage] = useState('');
   const [loading, setLoading] = useState(true);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const [onlineUsers, setOnlineUsers] = useState([]);
+  const [typingUsers, setTypingUsers] = useState({});
   const messagesEndRef = useRef(null);
+  const lastIdRef = useRef(0);
+  const socketRef = useRef(null);
+  const typingSentRef = useRef(0);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -15,19 +25,94 @@ const Chat = ({ groupId }) => {
 
   useEffect(() => {
     fetchMessages();
-    // Set up polling for new messages every 5 seconds
-    const interval = setInterval(fetchMessages, 5000);
-    return () => clearInterval(interval);
+
+    // New messages are pushed over a WebSocket; fall back to long-polling if it drops
+    let polling = false;
+    const pollNewMessages = async () => {
+      while (polling) {
+        try {
+          const response = await axios.get(`http://127.0.0.1:8000/api/study-groups/${groupId}/messages/`, {
+            params: { after_id: lastIdRef.current, wait: 25 },
+          });
+          response.data.forEach(appendMessage);
+        } catch (error) {
+          console.error('Error polling messages:', error);
+          await new Promise((resolve) => setTimeout(resolve, 5000));
+        }
+      }
+    };
+    const token = localStorage.getItem('access_token');
+    const socket = new WebSocket(`ws://127.0.0.1:8000/ws/study-groups/${groupId}/?token=${token}`);
+    socketRef.current = socket;
+    const heartbeat = setInterval(() => {
+      if (socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: 'heartbeat' }));
+      }
+    }, 10000);
+    socket.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type === 'message') {
+        appendMessage(data.message);
+        setTyping(data.message.sender, false);
+      } else if (data.type === 'presence') {
+        setOnlineUsers(data.online);
+      } else if (data.type === 'typing') {
+        if (data.users) {
+          data.users.forEach((u) => setTyping(u.id, true, u.username));
+        } else {
+          setTyping(data.user.id, data.typing, data.user.username);
+        }
+      }
+    };
+    socket.onclose = () => {
+      setOnlineUsers([]);
+      if (!polling) {
+        polling = true;
+        pollNewMessages();
+      }
+    };
+
+    return () => {
+      polling = false;
+      clearInterval(heartbeat);
+      socket.onclose = null;
+      socket.close();
+      socketRef.current = null;
+    };
   }, [groupId]);
 
   useEffect(() => {
-    scrollToBottom();
+    const prune = setInterval(() => {
+      setTypingUsers((current) => {
+        const now = Date.now();
+        const expired = Object.keys(current).filter((id) => current[id].until <= now);
+        if (expired.length === 0) return current;
+        const next = { ...current };
+        expired.forEach((id) => delete next[id]);
+        return next;
+      });
+    }, 2000);
+    return () => clearInterval(prune);
+  }, []);
+
+  // Only new messages scroll to the bottom, not older history loaded above
+  useEffect(() => {
+    if (messages.length > 0) {
+      const newest = Math.max(...messages.map((m) => m.id));
+      if (newest > lastIdRef.current) {
+        lastIdRef.current = newest;
+        scrollToBottom();
+      }
+    }
   }, [messages]);
 
   const fetchMessages = async () => {
     try {
-      const response = await axios.get(`http://127.0.0.1:8000/api/study-groups/${groupId}/messages/`);
+      const response = await axios.get(`http://127.0.0.1:8000/api/study-groups/${groupId}/messages/`, {
+        params: { limit: PAGE_SIZE },
+      });
       setMessages(response.data);
+      setHasOlder(response.data.length === PAGE_SIZE);
     } catch (error) {
       console.error('Error fetching messages:', error);
     } finally {
@@ -35,6 +120,58 @@ const Chat = ({ groupId }) => {
     }
   };
 
+  const loadOlder = async () => {
+    if (messages.length === 0) return;
+    setLoadingOlder(true);
+    try {
+      const response = await axios.get(`http://127.0.0.1:8000/api/study-groups/${groupId}/messages/`, {
+        params: { before_id: messages[0].id, limit: PAGE_SIZE },
+      });
+      setMessages((current) => {
+        const seen = new Set(current.map((m) => m.id));
+        return [...response.data.filter((m) => !seen.has(m.id)), ...current];
+      });
+      setHasOlder(response.data.length === PAGE_SIZE);
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  const appendMessage = (message) => {
+    setMessages((current) =>
+      current.some((m) => m.id === message.id) ? current : [...current, message]
+    );
+  };
+
+  // Typing flags expire on their own in case the "stopped typing" event is lost
+  const setTyping = (userId, typing, username) => {
+    setTypingUsers((current) => {
+      const next = { ...current };
+      if (typing) {
+        next[userId] = { username, until: Date.now() + 6000 };
+      } else {
+        delete next[userId];
+      }
+      return next;
+    });
+  };
+
+  const sendTyping = (typing) => {
+    const socket = socketRef.current;
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
+    const now = Date.now();
+    if (typing && now - typingSentRef.current < 3000) return;
+    typingSentRef.current = typing ? now : 0;
+    socket.send(JSON.stringify({ type: 'typing', typing }));
+  };
+
+  const handleInputChange = (e) => {
+    setNewMessage(e.target.value);
+    sendTyping(e.target.value.length > 0);
+  };
+
   const sendMessage = async (e) => {
     e.preventDefault();
     if (!newMessage.trim()) return;
@@ -44,8 +181,9 @@ const Chat = ({ groupId }) => {
         group: groupId,
         message: newMessage,
       });
-      setMessages([...messages, response.data]);
+      appendMessage(response.data);
       setNewMessage('');
+      sendTyping(false);
     } catch (error) {
       console.error('Error sending message:', error);
     }
@@ -55,6 +193,10 @@ const Chat = ({ groupId }) => {
     return new Date(timestamp).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
   };
 
+  const typingNames = Object.values(typingUsers)
+    .filter((t) => t.until > Date.now())
+    .map((t) => t.username);
+
   if (loading) {
     return (
       <div className="retro-card">
@@ -65,10 +207,27 @@ const Chat = ({ groupId }) => {
 
   return (
     <div className="retro-card h-96 flex flex-col">
-      <h3 className="retro-subtitle mb-4">Group Chat</h3>
+      <div className="flex justify-between items-center mb-4">
+        <h3 className="retro-subtitle">Group Chat</h3>
+        <span className="text-xs text-green-400" title={onlineUsers.map((u) => u.username).join(', ')}>
+          🟢 {onlineUsers.length} online
+        </span>
+      </div>
 
       {/* Messages Container */}
       <div className="flex-1 overflow-y-auto mb-4 p-2 bg-black border border-green-400 rounded">
+        {hasOlder && (
+          <div className="text-center mb-3">
+            <button
+              type="button"
+              onClick={loadOlder}
+              className="text-xs text-green-400 underline"
+              disabled={loadingOlder}
+            >
+              {loadingOlder ? 'Loading...' : 'Load older messages'}
+            </button>
+          </div>
+        )}
         {messages.length > 0 ? (
           messages.map((message) => (
             <div
@@ -98,12 +257,18 @@ const Chat = ({ groupId }) => {
         <div ref={messagesEndRef} />
       </div>
 
+      {typingNames.length > 0 && (
+        <div className="text-xs text-yellow-400 mb-1">
+          {typingNames.join(', ')} {typingNames.length === 1 ? 'is' : 'are'} typing...
+        </div>
+      )}
+
       {/* Message Input */}
       <form onSubmit={sendMessage} className="flex gap-2">
         <input
           type="text"
           value={newMessage}
-          onChange={(e) => setNewMessage(e.target.value)}
+          onChange={handleInputChange}
           placeholder="Type your message..."
           className="retro-input flex-1"
           maxLength={500}
@@ -118,7 +283,7 @@ const Chat = ({ groupId }) => {
       </form>
 
       <div className="text-xs text-green-400 mt-2 text-center">
-        💬 Real-time chat • Messages refresh every 5 seconds
+        💬 Real-time chat
       </div>
     </div>
   );
@@ -8,13 +8,17 @@ const FreeCourses = () => {
   const [searchTerm, setSearchTerm] = useState('');
 
   useEffect(() => {
-    fetchFreeCourses();
-  }, []);
+    // Filtering happens on the server; wait for typing to pause before asking
+    const timer = setTimeout(fetchFreeCourses, searchTerm ? 250 : 0);
+    return () => clearTimeout(timer);
+  }, [selectedProvider, searchTerm]);
 
   const fetchFreeCourses = async () => {
     try {
-      setLoading(true);
-      const response = await axios.get('http://127.0.0.1:8000/api/free-courses/');
+      const params = { page_size: 100 };
+      if (selectedProvider !== 'all') params.provider = selectedProvider;
+      if (searchTerm.trim()) params.search = searchTerm.trim();
+      const response = await axios.get('http://127.0.0.1:8000/api/free-courses/', { params });
       setCourses(response.data.results || []);
       setLoading(false);
     } catch (error) {
@@ -23,13 +27,6 @@ const FreeCourses = () => {
     }
   };
 
-  const filteredCourses = courses.filter(course => {
-    const matchesProvider = selectedProvider === 'all' || course.provider.toLowerCase() === selectedProvider;
-    const matchesSearch = course.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                         course.description.toLowerCase().includes(searchTerm.toLowerCase());
-    return matchesProvider && matchesSearch;
-  });
-
   const enrollInCourse = async (course) => {
     try {
       // In a real implementation, this would call your backend to save the enrollment
@@ -82,13 +79,15 @@ const FreeCourses = () => {
               <option value="coursera">Coursera</option>
               <option value="edx">edX</option>
               <option value="khan academy">Khan Academy</option>
+              <option value="udacity">Udacity</option>
+              <option value="futurelearn">FutureLearn</option>
             </select>
           </div>
         </div>
 
         {/* Course Grid */}
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
-          {filteredCourses.map((course) => (
+          {courses.map((course) => (
             <div key={course.id} className="border-2 border-cyan-400 p-6 hover:border-pink-400 transition-colors">
               <div className="mb-4">
                 <img
@@ -155,7 +154,7 @@ const FreeCourses = () => {
           ))}
         </div>
 
-        {filteredCourses.length === 0 && (
+        {courses.length === 0 && (
           <div className="text-center py-12">
             <h3 className="text-2xl text-cyan-400 mb-4">No courses found</h3>
             <p className="text-green-400">Try adjusting your search or filter criteria</p>